@@ -0,0 +1,118 @@
+# ERA 5 rendering benchmark
+
+"""
+Time the plot types (drawing engines) of every map preset on one variable, without any GUI.
+For each preset and plot type, the first frame (data read, map, projection and drawing) and the following frames
+(data update and redraw, as when scrubbing through time) are timed separately.
+
+Example:
+	python benchmark_render.py data.nc t2m --frames 10
+"""
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import argparse
+import json
+import time
+
+# matplotlib imports, without any GUI backend
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure as MplFig
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Custom imports
+import nc_tools
+from figure import Figure, DEFAULT_MAP_OPTIONS, PLOT_TYPES, VECTOR_PLOT_TYPES
+
+###############
+## Constants ##
+###############
+
+PRESETS_FILE = os.path.join(UTILS_PATH, "figure", "map_presets.json")
+FIGURE_SIZE = (10.8, 6)
+# Vector plot types need a u/v wind component: they are only benchmarked on request
+SCALAR_PLOT_TYPES = [plot_type for plot_type in PLOT_TYPES if plot_type not in VECTOR_PLOT_TYPES]
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def benchmark(ds, map_options : dict, presets : dict, n_frames : int, dpi : int = 100):
+	"""
+	Render :n_frames: timesteps with :map_options:. Return the time of the first frame and the mean time of the next ones, in seconds.
+	"""
+	mpl_fig = MplFig(figsize=FIGURE_SIZE, dpi=dpi)
+	canvas = FigureCanvasAgg(mpl_fig)
+	ax = mpl_fig.add_subplot(111)
+	start = time.perf_counter()
+	fig = Figure(figure=mpl_fig, ax=ax, dataset=ds, map_options=dict(map_options, time_index=0), presets=presets)
+	fig.plot_data()
+	canvas.draw()
+	first = time.perf_counter()-start
+
+	n_steps = len(ds['time'])
+	start = time.perf_counter()
+	for i in range (1, n_frames):
+		fig.update_data(fig.read_frame(i%n_steps))
+		canvas.draw()
+	following = (time.perf_counter()-start)/(n_frames-1) if n_frames > 1 else float('nan')
+	return first, following
+
+def parse_args(argv : list = None):
+	"""
+	Parse command line arguments.
+	"""
+	parser = argparse.ArgumentParser(description="Benchmark the plot types of each map preset.")
+	parser.add_argument("data_path", nargs='+', help="netCDF file(s) to read. Several files are concatenated along time.")
+	parser.add_argument("variable", help="Variable to plot.")
+	parser.add_argument("--level", type=int, default=None, help="Pressure level index (pressure level datasets only).")
+	parser.add_argument("--frames", type=int, default=5, help="Number of frames rendered per preset and plot type (default: 5).")
+	parser.add_argument("--presets", nargs='+', default=None, help="Presets to benchmark (default: all).")
+	parser.add_argument("--plot-types", dest="plot_types", nargs='+', default=SCALAR_PLOT_TYPES, choices=PLOT_TYPES,
+						help="Plot types to benchmark (default: the scalar ones; vector ones need a wind component).")
+	parser.add_argument("--dpi", type=int, default=100)
+	return parser.parse_args(argv)
+
+def main(argv : list = None):
+	args = parse_args(argv)
+	with open(PRESETS_FILE, 'r') as foo:
+		presets = json.load(foo)
+	ds = nc_tools.open_dataset(args.data_path)
+	reference = args.plot_types[0]
+	print(f"{'preset':<16}{'plot type':<12}{'first (s)':>10}{'next (s)':>10}{'speedup':>9}", flush=True)
+	try:
+		for preset in args.presets or list(presets.keys()):
+			times = {}
+			for plot_type in args.plot_types:
+				map_options = dict(DEFAULT_MAP_OPTIONS, variable=args.variable, pl_index=args.level, preset=preset, plot_type=plot_type)
+				try:
+					times[plot_type] = benchmark(ds, map_options, presets, args.frames, dpi=args.dpi)
+				except Exception as e:
+					# A failing plot type is reported, the others are still benchmarked
+					print(f"{preset:<16}{plot_type:<12} failed: {e!r}", flush=True)
+					continue
+				first, following = times[plot_type]
+				# Speedup of the following frames, relative to the first plot type
+				speedup = times[reference][1]/following if reference in times and following > 0 else float('nan')
+				print(f"{preset:<16}{plot_type:<12}{first:>10.3f}{following:>10.3f}{speedup:>8.1f}x", flush=True)
+	finally:
+		ds.close()
+
+if __name__ == '__main__':
+	main()
\ No newline at end of file
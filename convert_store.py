@@ -0,0 +1,69 @@
+# ERA 5 chunk store converter
+
+"""
+Copy variables of a dataset into local chunk stores (see utils/chunk_store.py), without any GUI.
+Each store keeps the variable in two layouts: one for map reads, one for time series reads at a grid point.
+Once converted, the GUI and render.py read the variable from its store instead of the netCDF files.
+
+Example:
+	python convert_store.py data.nc --variables t2m tp
+"""
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import argparse
+import time
+
+# Custom imports
+import nc_tools
+import chunk_store
+
+###############
+## Constants ##
+###############
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def parse_args(argv : list = None):
+	"""
+	Parse command line arguments.
+	"""
+	parser = argparse.ArgumentParser(description="Convert variables into local chunk stores.")
+	parser.add_argument("data_path", nargs='+', help="netCDF file(s) to read. Several files are concatenated along time.")
+	parser.add_argument("--variables", nargs='+', default=None, help="Variables to convert (default: all).")
+	parser.add_argument("--force", action="store_true", help="Convert variables again even if their store exists.")
+	return parser.parse_args(argv)
+
+def main(argv : list = None):
+	args = parse_args(argv)
+	ds = nc_tools.open_dataset(args.data_path)
+	try:
+		for variable in args.variables or nc_tools.get_variables(ds=ds):
+			if not args.force and chunk_store.find_store(ds, variable) is not None:
+				print(f"{variable}: already converted.", flush=True)
+				continue
+			start = time.perf_counter()
+			store = chunk_store.convert(ds, variable, progress=lambda fraction, message: print(message, flush=True))
+			print(f"{variable}: converted in {time.perf_counter()-start:.1f} s into {store.path}", flush=True)
+	finally:
+		ds.close()
+
+if __name__ == '__main__':
+	main()
\ No newline at end of file
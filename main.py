@@ -26,10 +26,12 @@ import os
 # GUI imports
 import wx
 
-# Custom imports
-from utils import nc_tools, wx_tools
-from utils.panels import DefaultPanel, OverviewPanel, OptionPanel, PlotPanel
-from utils.dialogs import PresetDialog
+# Custom imports: modules are imported by the same names as in the utils modules (not as utils.xxx),
+# so that there is a single instance of each, e.g. a single nc_tools.READ_LOCK in the process
+import nc_tools, wx_tools, catalog, stats_tools, chunk_store, aggregation
+from panels import DefaultPanel, OverviewPanel, OptionPanel, PlotPanel
+from dialogs import PresetDialog, CatalogDialog, AggregationDialog
+from figure import render_pipeline
 
 ###############
 ## Constants ##
@@ -72,12 +74,22 @@ class DisplayFrame(wx.Frame):
 		self.data_path = None
 		self.dataset = None
 		self.metadata = {}
+		# Directory scans run in the background
+		self.catalog_pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		# Statistics of the variables of the loaded dataset are computed in the background, one variable at a time
+		self.stats_pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		# Temporal aggregations are computed in the background, one at a time
+		self.aggregation_pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		self.aggregation_dialog = None
 
 		# Icon
 		icon = wx.Icon(name="ressources\\logo.ico", type=wx.BITMAP_TYPE_ANY)
 		#icon.CopyFromBitmap(wx.Bitmap("ressources\\logo.ico", )
 		self.SetIcon(icon)
 
+		# Status bar, showing the coordinates and data value under the mouse on the plot
+		self.CreateStatusBar()
+
 		# Panels to be used inside the frame
 		self.default_panel = None
 		self.overview_panel = None
@@ -94,6 +106,7 @@ class DisplayFrame(wx.Frame):
 										  size=PANEL_SIZE
 										  )
 		self.default_panel.button_load.Bind(event=wx.EVT_BUTTON, handler=self.open_file_browser)
+		self.default_panel.button_catalog.Bind(event=wx.EVT_BUTTON, handler=self.open_dir_browser)
 		self.default_panel.button_pres.Bind(event=wx.EVT_BUTTON, handler=self.show_pres_gen)
 		
 		# Add panels to each tab
@@ -102,6 +115,16 @@ class DisplayFrame(wx.Frame):
 		main_sizer = wx.BoxSizer(wx.VERTICAL)
 		main_sizer.Add(self.notebook, 0, wx.EXPAND, 0)
 		self.main_panel.SetSizer(main_sizer)
+		self.Bind(wx.EVT_CLOSE, self.on_close)
+
+	def on_close(self, event):
+		"""
+		Release the background workers when the frame is closed: scans, statistics and aggregations in progress are cancelled.
+		"""
+		self.catalog_pipeline.shutdown()
+		self.stats_pipeline.shutdown()
+		self.aggregation_pipeline.shutdown()
+		event.Skip()
 
 	def open_file_browser(self, event):
 		"""
@@ -109,9 +132,9 @@ class DisplayFrame(wx.Frame):
 		"""
 		wildcard = "netCDF4 files (*.nc)|*.nc|"\
 				   "All files (*.*)|*.*"
-		flags = wx.FD_OPEN | wx.FD_CHANGE_DIR
+		flags = wx.FD_OPEN | wx.FD_CHANGE_DIR | wx.FD_MULTIPLE
 		dlg = wx.FileDialog(self, 
-							message="Choose a file",
+							message="Choose a file (or several files to concatenate along time)",
 							defaultDir=os.getcwd(),
 							defaultFile="",
 							wildcard=wildcard,
@@ -119,13 +142,55 @@ class DisplayFrame(wx.Frame):
 							)
 		if dlg.ShowModal() == wx.ID_OK:
 			# Retrieve path from FileDialog window and load the associated dataset
+			# Several files (e.g. monthly downloads) are loaded as a single virtual dataset
 			paths = dlg.GetPaths()
-			self.data_path = paths[0]
+			self.data_path = paths[0] if len(paths) == 1 else sorted(paths)
 			self.load_data()
 
+	def open_dir_browser(self, event):
+		"""
+		Create and show a directory browser, then scan the chosen directory.
+		"""
+		dlg = wx.DirDialog(self, message="Choose a data directory", defaultPath=os.getcwd(), style=wx.DD_DIR_MUST_EXIST)
+		if dlg.ShowModal() == wx.ID_OK:
+			directory = dlg.GetPath()
+			self.default_panel.text_catalog.SetLabel("Scanning...")
+			self.catalog_pipeline.submit(
+										 prepare=lambda progress: catalog.build_catalog(directory, progress=progress),
+										 on_done=self.show_catalog,
+										 on_progress=self.on_catalog_progress,
+										 on_error=self.on_catalog_error
+										 )
+		dlg.Destroy()
+
+	def on_catalog_progress(self, fraction : float, message : str):
+		self.default_panel.text_catalog.SetLabel(f"Scanning... {message}")
+		self.default_panel.Layout()
+
+	def on_catalog_error(self, error : Exception):
+		self.default_panel.text_catalog.SetLabel("")
+		wx.MessageBox(message=f"Error! The directory could not be scanned.\n{error}", caption="Error", style=wx.OK | wx.ICON_ERROR)
+
+	def show_catalog(self, data_catalog):
+		"""
+		Show the catalog search dialog.
+		"""
+		self.default_panel.text_catalog.SetLabel(f"{len(data_catalog)} files indexed")
+		self.default_panel.Layout()
+		CatalogDialog(self, "Catalog", data_catalog, on_open=self.open_match)
+
+	def open_match(self, match : dict):
+		"""
+		Load the file of a catalog match, and select its variable, timestep and pressure level.
+		"""
+		self.data_path = match['path']
+		if self.load_data():
+			self.option_panel.select(variable=match['variable'], date=match['date'], pl_index=match['pl_index'])
+			self.notebook.SetSelection(self.notebook.GetPageCount()-1)
+
 	def load_data(self):
 		"""
-		Open dataset and get metadata.
+		Open dataset and get metadata. Return True if the dataset has been loaded.
 		"""
 		if self.dataset:
 			# If a dataset has already been loaded, delete pages associated with this dataset.
@@ -137,6 +202,8 @@ class DisplayFrame(wx.Frame):
 								   )
 			if answer == wx.OK:
 				# Continue process and try loading data
+				self.stats_pipeline.cancel()
+				self.aggregation_pipeline.cancel()
 				wx_tools.delete_all_excluding(notebook=self.notebook, exclusion_list=["Menu"])
 				loading = True
 			else:
@@ -147,9 +214,15 @@ class DisplayFrame(wx.Frame):
 		if loading:
 			try:
 				self.dataset = nc_tools.open_dataset(self.data_path)
+				# Variables converted into a chunk store (convert_store.py) are read from it
+				chunk_store.attach_stores(self.dataset)
+				# Aggregations computed in previous sessions are listed as pseudo-variables
+				aggregation.attach_aggregations(self.dataset)
 				self.metadata = nc_tools.get_meta(self.dataset)
 				self.show_overview()
 				self.show_options()
+				self.compute_stats(nc_tools.get_variables(meta=self.metadata))
+				return True
 			except Exception as e:
 				# Catch error and display an error message
 				## ADD AN EXECPTION LOG FILE ##
@@ -158,6 +231,31 @@ class DisplayFrame(wx.Frame):
 							  caption="Error",
 							  style=wx.OK | wx.ICON_ERROR
 							  )
+		return False
+
+	def compute_stats(self, variables : list):
+		"""
+		Compute the statistics of :variables: in the background, one after the other, and display them as they come.
+		"""
+		if not variables:
+			return
+		variable, dataset = variables[0], self.dataset
+		def on_done(stats):
+			self.overview_panel.set_stats(variable, stats)
+			self.option_panel.set_stats(variable, stats)
+			self.compute_stats(variables[1:])
+		def on_progress(fraction, message):
+			self.overview_panel.set_stats_message(variable, f"Computing... {int(100*fraction)}%")
+		def on_error(error):
+			print(f"Statistics warning: statistics of {variable} could not be computed.\n{error}", flush=True)
+			self.overview_panel.set_stats_message(variable, "Not available")
+			self.compute_stats(variables[1:])
+		self.stats_pipeline.submit(
+								   prepare=lambda progress: stats_tools.get_stats(dataset, variable, progress=progress),
+								   on_done=on_done,
+								   on_progress=on_progress,
+								   on_error=on_error
+								   )
 
 	def show_pres_gen(self, event):
 		"""
@@ -190,11 +288,67 @@ class DisplayFrame(wx.Frame):
 										)
 		self.notebook.AddPage(self.option_panel, "Map Options")
 		self.option_panel.button.Bind(wx.EVT_BUTTON , handler=self.show_plot)
+		self.option_panel.button_aggregate.Bind(wx.EVT_BUTTON, handler=self.show_aggregation)
+		for event_type in [wx.EVT_COMBOBOX, wx.EVT_TEXT, wx.EVT_CHECKBOX]:
+			self.option_panel.Bind(event_type, handler=self.on_option_change)
+
+	def show_aggregation(self, event):
+		"""
+		Show the temporal aggregation dialog.
+		"""
+		self.aggregation_dialog = AggregationDialog(
+													self,
+													"Aggregation",
+													variables=nc_tools.get_variables(meta=self.metadata),
+													periods=aggregation.PERIODS,
+													reductions=aggregation.REDUCTIONS,
+													on_compute=self.compute_aggregation
+													)
+
+	def compute_aggregation(self, request : dict):
+		"""
+		Compute an aggregation in the background, then add it to the variables of the option panel.
+		"""
+		dataset, dialog = self.dataset, self.aggregation_dialog
+		def prepare(progress):
+			path = aggregation.aggregate(
+										 dataset,
+										 request['variable'],
+										 request['period'],
+										 request['reduction'],
+										 baseline=request['baseline'],
+										 processes=request['processes'],
+										 progress=progress
+										 )
+			return path
+		def on_done(path):
+			name = aggregation.attach_result(dataset, path)
+			dialog.set_progress(1., f"Done: {name}")
+			if dataset is self.dataset and self.option_panel:
+				self.option_panel.add_variable(name)
+		def on_error(error):
+			dialog.set_progress(0., "Error")
+			wx.MessageBox(message=f"Error! Aggregation could not be computed.\n{error}", caption="Error", style=wx.OK | wx.ICON_ERROR)
+		dialog.set_progress(0., "Aggregating...")
+		self.aggregation_pipeline.submit(prepare=prepare, on_done=on_done, on_progress=dialog.set_progress, on_error=on_error)
+
+	def on_option_change(self, event):
+		"""
+		Cancel the rendering in progress: its options are outdated.
+		"""
+		if self.plot_panel:
+			self.plot_panel.cancel()
+		event.Skip()
 
 	def show_plot(self, event):
 		"""
 		Show the plot panel.
 		"""
+		if self.plot_panel and wx_tools.search_for_page(notebook=self.notebook, page_name="Plot"):
+			# Reuse the existing plot: it is updated in place when possible
+			self.plot_panel.update(self.option_panel.options)
+			event.Skip()
+			return
 		wx_tools.delete_all_excluding(notebook=self.notebook, exclusion_list=["Menu", "Data Overview", "Map Options"])
 		self.plot_panel = PlotPanel(
 									parent=self.notebook,
@@ -0,0 +1,215 @@
+# ERA 5 headless batch renderer
+
+"""
+Render one PNG frame per timestep of a variable, without any GUI.
+Frames are rendered by a pool of processes, each one reusing its basemaps and projected meshes between frames.
+
+Example (one month of hourly 2m temperature over Europe):
+	python render.py data.nc t2m --preset cyl_eu --start 0 --stop 744 --output frames
+
+With --animation, frames are streamed into a single video or GIF file instead:
+	python render.py data.nc t2m --preset cyl_eu --animation t2m.mp4 --fps 24
+"""
+
+#############
+## Imports ##
+#############
+
+# Paths fixing (at module level, so that spawned workers get them too)
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import argparse
+import json
+import time
+from multiprocessing import Pool
+
+# matplotlib imports, without any GUI backend
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure as MplFig
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Custom imports
+import nc_tools
+import chunk_store
+from figure import Figure, DEFAULT_MAP_OPTIONS, PLOT_TYPES
+from figure import animation_tools
+from figure import pyramid_tools
+
+###############
+## Constants ##
+###############
+
+PRESETS_FILE = os.path.join(UTILS_PATH, "figure", "map_presets.json")
+FIGURE_SIZE = (10.8, 6)
+
+# Per-process state, set by the pool initializer
+_WORKER = {}
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def load_presets():
+	"""
+	Load the map presets file.
+	"""
+	with open(PRESETS_FILE, 'r') as foo:
+		presets = json.load(foo)
+	return presets
+
+def build_options(args : argparse.Namespace):
+	"""
+	Build the map options dictionary from command line arguments.
+	"""
+	options = DEFAULT_MAP_OPTIONS.copy()
+	options.update({
+		"variable": args.variable,
+		"pl_index": args.level,
+		"lon_offset": args.lon_offset,
+		"coef": args.coef,
+		"offset": args.offset,
+		"preset": args.preset,
+		"resolution": args.resolution,
+		"countries": args.countries,
+		"rivers": args.rivers,
+		"cmap": args.cmap,
+		"colorbar": args.colorbar,
+		"plot_type": args.plot_type,
+		"pyramid": args.pyramid,
+		"packed": args.packed
+	})
+	if args.norm is not None:
+		options["norm"] = True
+		options["c_min"], options["midpoint"], options["c_max"] = args.norm
+	return options
+
+def init_worker(data_path, map_options : dict, presets : dict, output : str, dpi : int):
+	"""
+	Pool initializer: open the dataset once per process.
+	"""
+	_WORKER['dataset'] = nc_tools.open_dataset(data_path)
+	chunk_store.attach_stores(_WORKER['dataset'])
+	_WORKER['map_options'] = map_options
+	_WORKER['presets'] = presets
+	_WORKER['output'] = output
+	_WORKER['dpi'] = dpi
+	_WORKER['figure'] = MplFig(figsize=FIGURE_SIZE)
+	FigureCanvasAgg(_WORKER['figure'])
+
+def render_frame(time_index : int):
+	"""
+	Render the frame of :time_index: and return the path of the written PNG file.
+	"""
+	mpl_fig = _WORKER['figure']
+	mpl_fig.clear()
+	ax = mpl_fig.add_subplot(111)
+	map_options = _WORKER['map_options'].copy()
+	map_options['time_index'] = time_index
+	fig = Figure(figure=mpl_fig, ax=ax, dataset=_WORKER['dataset'], map_options=map_options, presets=_WORKER['presets'])
+	fig.plot_data()
+	mpl_fig.tight_layout()
+	path = os.path.join(_WORKER['output'], f"{map_options['variable']}_{time_index:05d}.png")
+	mpl_fig.savefig(path, dpi=_WORKER['dpi'])
+	return path
+
+def render(data_path, map_options : dict, time_indices : list, output : str, processes : int = None, dpi : int = 100):
+	"""
+	Render frames for all :time_indices: in :output:. Return the number of frames per second.
+	"""
+	os.makedirs(output, exist_ok=True)
+	presets = load_presets()
+	n_frames = len(time_indices)
+	start = time.perf_counter()
+	initargs = (data_path, map_options, presets, output, dpi)
+	with Pool(processes=processes, initializer=init_worker, initargs=initargs) as pool:
+		for i, path in enumerate(pool.imap_unordered(render_frame, time_indices), start=1):
+			elapsed = time.perf_counter()-start
+			print(f"[{i}/{n_frames}] {path} ({i/elapsed:.2f} frames/s)", flush=True)
+	elapsed = time.perf_counter()-start
+	fps = n_frames/elapsed if elapsed > 0 else float('inf')
+	print(f"{n_frames} frames rendered in {elapsed:.1f} s ({fps:.2f} frames/s).", flush=True)
+	return fps
+
+def animate(data_path, map_options : dict, time_indices : list, path : str, fps : float = 10, dpi : int = 100):
+	"""
+	Stream frames for all :time_indices: into the animation file :path:. Return the number of frames per second.
+	"""
+	ds = nc_tools.open_dataset(data_path)
+	chunk_store.attach_stores(ds)
+	start = time.perf_counter()
+	def progress(n_written, n_frames):
+		elapsed = time.perf_counter()-start
+		print(f"[{n_written}/{n_frames}] {path} ({n_written/elapsed:.2f} frames/s)", flush=True)
+	try:
+		animation_tools.export_animation(ds, map_options, load_presets(), time_indices, path, fps=fps, dpi=dpi, figsize=FIGURE_SIZE, progress=progress)
+	finally:
+		ds.close()
+	elapsed = time.perf_counter()-start
+	rate = len(time_indices)/elapsed if elapsed > 0 else float('inf')
+	print(f"{len(time_indices)} frames exported in {elapsed:.1f} s ({rate:.2f} frames/s).", flush=True)
+	return rate
+
+def parse_args(argv : list = None):
+	"""
+	Parse command line arguments.
+	"""
+	parser = argparse.ArgumentParser(description="Render ERA5 maps for a range of timesteps as PNG frames.")
+	parser.add_argument("data_path", nargs='+', help="netCDF file(s) to read. Several files are concatenated along time.")
+	parser.add_argument("variable", help="Variable to plot.")
+	parser.add_argument("--level", type=int, default=None, help="Pressure level index (pressure level datasets only).")
+	parser.add_argument("--start", type=int, default=0, help="First time index (default: 0).")
+	parser.add_argument("--stop", type=int, default=None, help="Last time index, excluded (default: end of the time axis).")
+	parser.add_argument("--stride", type=int, default=1, help="Step between time indices (default: 1).")
+	parser.add_argument("--preset", default=DEFAULT_MAP_OPTIONS['preset'], help="Map preset, from map_presets.json.")
+	parser.add_argument("--resolution", default=DEFAULT_MAP_OPTIONS['resolution'], choices=['c', 'l', 'i', 'h', 'f'])
+	parser.add_argument("--cmap", default=DEFAULT_MAP_OPTIONS['cmap'], help="Colormap name.")
+	parser.add_argument("--plot-type", dest="plot_type", default=DEFAULT_MAP_OPTIONS['plot_type'], choices=PLOT_TYPES)
+	parser.add_argument("--pyramid", default=DEFAULT_MAP_OPTIONS['pyramid'], choices=["off"]+pyramid_tools.METHODS,
+						help="Draw from precomputed overview levels, reduced by block mean, min or max (default: off).")
+	parser.add_argument("--coef", type=float, default=DEFAULT_MAP_OPTIONS['coef'], help="Coefficient applied to data.")
+	parser.add_argument("--offset", type=float, default=DEFAULT_MAP_OPTIONS['offset'], help="Offset applied to data.")
+	parser.add_argument("--lon-offset", dest="lon_offset", type=float, default=DEFAULT_MAP_OPTIONS['lon_offset'])
+	parser.add_argument("--norm", type=float, nargs=3, metavar=("MIN", "MIDPOINT", "MAX"), default=None, help="Fixed colour limits.")
+	parser.add_argument("--countries", action="store_true")
+	parser.add_argument("--rivers", action="store_true")
+	parser.add_argument("--colorbar", action="store_true")
+	parser.add_argument("--packed", action="store_true", help="Unpack 16-bit packed variables through a lookup table (faster, less memory).")
+	parser.add_argument("--processes", type=int, default=None, help="Number of worker processes (default: number of CPUs).")
+	parser.add_argument("--dpi", type=int, default=100)
+	parser.add_argument("--output", default="frames", help="Output directory (default: frames).")
+	parser.add_argument("--animation", default=None, help="Export an animation (.mp4, .gif...) to this path instead of PNG frames.")
+	parser.add_argument("--fps", type=float, default=10, help="Frames per second of the animation (default: 10).")
+	return parser.parse_args(argv)
+
+def main(argv : list = None):
+	args = parse_args(argv)
+	ds = nc_tools.open_dataset(args.data_path)
+	n_steps = len(ds['time'])
+	if args.pyramid in pyramid_tools.METHODS:
+		# Built once here rather than concurrently by each worker
+		pyramid = pyramid_tools.get_pyramid(ds, args.variable, args.pyramid)
+		if pyramid is not None and not pyramid.is_built():
+			pyramid.build(progress=lambda fraction, message: print(message, flush=True))
+	ds.close()
+	stop = n_steps if args.stop is None else min(args.stop, n_steps)
+	time_indices = list(range(args.start, stop, args.stride))
+	if not time_indices:
+		raise Exception("ArgumentsError: The time range is empty.")
+	if args.animation:
+		animate(args.data_path, build_options(args), time_indices, args.animation, fps=args.fps, dpi=args.dpi)
+	else:
+		render(args.data_path, build_options(args), time_indices, args.output, processes=args.processes, dpi=args.dpi)
+
+if __name__ == '__main__':
+	main()
\ No newline at end of file
@@ -0,0 +1,162 @@
+# Tests of the temporal reductions of utils/aggregation.py, against direct numpy reductions
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import nc_tools
+import aggregation
+
+###############
+## Constants ##
+###############
+
+N_STEPS = 50 # 6-hourly steps from 2019-01-29: 13 days over January and February
+SHAPE = (N_STEPS, 2, 4, 5) # (time, level, lat, lon)
+N_DAYS = 730 # Daily steps from 2019-01-01, over two years
+
+#############
+## Classes ##
+#############
+
+class TestAggregation(unittest.TestCase):
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		self.times = np.datetime64("2019-01-29T00:00:00", 's')+np.arange(N_STEPS)*np.timedelta64(6, 'h')
+		data = rng.normal(size=SHAPE).astype(np.float32)
+		data[3, 0, 1, 2] = np.nan # Missing value within a period
+		data[:, 1, 0, 0] = np.nan # Grid point without any value
+		self.dataset = {"t2m": np.ma.masked_invalid(data)}
+		self.data = data
+		self.budget = aggregation.CHUNK_BUDGET
+
+	def tearDown(self):
+		aggregation.CHUNK_BUDGET = self.budget
+
+	def reduce(self, period : str, reduction : str):
+		codes, periods = aggregation._get_period_codes(self.times, period)
+		output = np.full((len(periods),)+SHAPE[1:], -999., dtype=np.float32)
+		aggregation.reduce_tile(self.dataset, "t2m", codes, reduction, output)
+		return output, periods
+
+	def expected(self, period : str, reduction : str):
+		unit = 'D' if period == "daily" else 'M'
+		keys = self.times.astype(f"datetime64[{unit}]")
+		function = {"mean": np.nanmean, "min": np.nanmin, "max": np.nanmax}[reduction]
+		with warnings.catch_warnings():
+			# All-NaN grid points give NaN, as expected from the aggregation
+			warnings.simplefilter("ignore", RuntimeWarning)
+			return np.stack([function(self.data[keys == key], axis=0) for key in np.unique(keys)])
+
+	def check(self, period : str):
+		for reduction in ["mean", "min", "max"]:
+			output, _ = self.reduce(period, reduction)
+			np.testing.assert_allclose(output, self.expected(period, reduction), rtol=1e-5, equal_nan=True, err_msg=f"{period} {reduction}")
+
+	def test_period_codes(self):
+		codes, periods = aggregation._get_period_codes(self.times, "daily")
+		self.assertEqual(len(periods), 13)
+		self.assertEqual(periods[0], np.datetime64("2019-01-29T00:00:00", 's'))
+		self.assertTrue(np.all(codes[:4] == 0) and codes[4] == 1)
+		codes, periods = aggregation._get_period_codes(self.times, "monthly")
+		self.assertEqual(list(periods.astype('datetime64[M]').astype(str)), ["2019-01", "2019-02"])
+		self.assertEqual(int(np.sum(codes == 0)), 12)
+
+	def test_single_chunk(self):
+		self.check("daily")
+		self.check("monthly")
+
+	def test_periods_across_chunks(self):
+		# 3 timesteps per chunk: days (4 timesteps) and months span two or more chunks
+		aggregation.CHUNK_BUDGET = 3*int(np.prod(SHAPE[1:]))*8
+		self.check("daily")
+		self.check("monthly")
+
+	def test_latitude_band(self):
+		codes, periods = aggregation._get_period_codes(self.times, "daily")
+		output = np.full((len(periods),)+SHAPE[1:], -999., dtype=np.float32)
+		aggregation.reduce_tile(self.dataset, "t2m", codes, "max", output, lat_slice=slice(1, 3))
+		expected = self.expected("daily", "max")
+		np.testing.assert_allclose(output[..., 1:3, :], expected[..., 1:3, :], rtol=1e-5, equal_nan=True)
+		self.assertTrue(np.all(output[..., :1, :] == -999.) and np.all(output[..., 3:, :] == -999.))
+
+	def test_names(self):
+		self.assertEqual(aggregation.make_name("t2m", "daily", "mean"), "t2m@daily_mean")
+		name = aggregation.make_name("t2m", "anomaly", "max", (1991, 2020))
+		self.assertEqual(name, "t2m@anomaly_max_1991-2020")
+		self.assertEqual(aggregation.parse_name(name), ("t2m", "anomaly", "max"))
+		self.assertIsNone(aggregation.parse_name("t2m"))
+		self.assertIsNone(aggregation.parse_name("t2m@weekly_mean"))
+
+class TestAggregate(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.aggregation_path = aggregation.AGGREGATION_PATH
+		aggregation.AGGREGATION_PATH = os.path.join(self.tmp_dir.name, "aggregations")
+		rng = np.random.default_rng(1)
+		self.data = rng.normal(size=(N_DAYS, 3, 4)).astype(np.float32)
+		path = os.path.join(self.tmp_dir.name, "source.nc")
+		with nc.Dataset(path, 'w') as ds:
+			for dim, size in zip(['time', 'latitude', 'longitude'], self.data.shape):
+				ds.createDimension(dim, size)
+			time = ds.createVariable('time', 'f8', ('time',))
+			time.units = "days since 2019-01-01 00:00:00"
+			time[:] = np.arange(N_DAYS)
+			ds.createVariable('latitude', 'f4', ('latitude',))[:] = [10., 0., -10.]
+			ds.createVariable('longitude', 'f4', ('longitude',))[:] = [0., 10., 20., 30.]
+			ds.createVariable('t2m', 'f4', ('time', 'latitude', 'longitude'))[:] = self.data
+		self.dataset = nc.Dataset(path)
+
+	def tearDown(self):
+		nc_tools.detach_pseudo_variables()
+		self.dataset.close()
+		aggregation.AGGREGATION_PATH = self.aggregation_path
+		self.tmp_dir.cleanup()
+
+	def test_results(self):
+		path = aggregation.aggregate(self.dataset, "t2m", "monthly", "mean")
+		anomaly_path = aggregation.aggregate(self.dataset, "t2m", "anomaly", "mean")
+		# Results are published with their source key, without any temporary file left
+		self.assertEqual(sorted(os.listdir(aggregation.AGGREGATION_PATH)), sorted(os.path.basename(p) for p in [path, anomaly_path]))
+		with nc.Dataset(path) as result:
+			self.assertEqual(result.source_key, aggregation.get_source_key(self.dataset))
+			monthly = result["t2m@monthly_mean"][:]
+		self.assertEqual(monthly.shape, (24, 3, 4))
+		np.testing.assert_allclose(monthly[1], self.data[31:59].mean(axis=0), rtol=1e-5)
+		with nc.Dataset(anomaly_path) as result:
+			anomaly = result[aggregation.make_name("t2m", "anomaly", "mean", (2019, 2020))][:]
+		np.testing.assert_allclose(anomaly[0], (monthly[0]-monthly[12])/2, rtol=1e-4, atol=1e-6)
+		names = aggregation.attach_aggregations(self.dataset)
+		self.assertEqual(sorted(names), sorted(["t2m@monthly_mean", "t2m@anomaly_mean_2019-2020"]))
+
+	def test_interrupted(self):
+		def progress(fraction : float, message : str):
+			raise KeyboardInterrupt()
+		with self.assertRaises(KeyboardInterrupt):
+			aggregation.aggregate(self.dataset, "t2m", "daily", "max", progress=progress)
+		self.assertEqual(os.listdir(aggregation.AGGREGATION_PATH), [])
+		self.assertEqual(aggregation.attach_aggregations(self.dataset), [])
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
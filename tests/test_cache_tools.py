@@ -0,0 +1,135 @@
+# Tests of the in-memory and on-disk caches of utils/cache_tools.py
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import time
+import tempfile
+import unittest
+
+import numpy as np
+
+# Custom imports
+import cache_tools
+
+###############
+## Constants ##
+###############
+
+ENTRY_BYTES = 800 # One float64 array of 100 values
+
+#############
+## Classes ##
+#############
+
+class TestLRUCache(unittest.TestCase):
+	def test_max_items(self):
+		cache = cache_tools.LRUCache(max_items=2)
+		cache.put("a", 1)
+		cache.put("b", 2)
+		cache.get("a") # "b" becomes the least recently used entry
+		cache.put("c", 3)
+		self.assertIn("a", cache)
+		self.assertNotIn("b", cache)
+		self.assertEqual(len(cache), 2)
+
+	def test_max_bytes(self):
+		cache = cache_tools.LRUCache(max_items=None, max_bytes=2*ENTRY_BYTES)
+		for key in ["a", "b", "c"]:
+			cache.put(key, np.zeros(100))
+		self.assertEqual(len(cache), 2)
+		self.assertEqual(cache.n_bytes, 2*ENTRY_BYTES)
+		# The last inserted entry is kept even if it is larger than the bound
+		cache.put("d", np.zeros(1000))
+		self.assertEqual(len(cache), 1)
+		self.assertIn("d", cache)
+
+	def test_replace_and_pop(self):
+		cache = cache_tools.LRUCache(max_bytes=10*ENTRY_BYTES)
+		cache.put("a", np.zeros(100))
+		cache.put("a", np.zeros(200))
+		self.assertEqual(cache.n_bytes, 2*ENTRY_BYTES)
+		self.assertEqual(len(cache.pop("a")), 200)
+		self.assertEqual(cache.n_bytes, 0)
+		self.assertIsNone(cache.pop("a"))
+
+class TestArrayCache(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.cache_dir = os.path.join(self.tmp_dir.name, "arrays")
+
+	def tearDown(self):
+		self.tmp_dir.cleanup()
+
+	def test_persistence(self):
+		value = (np.arange(10, dtype=np.float32), np.ones((2, 3)))
+		cache_tools.ArrayCache(cache_dir=self.cache_dir).put("key", value)
+		# A new cache, as after a restart, finds the entry on disk
+		cache = cache_tools.ArrayCache(cache_dir=self.cache_dir, mmap_mode='r')
+		loaded = cache.get("key")
+		self.assertEqual(len(loaded), 2)
+		for arr, expected in zip(loaded, value):
+			np.testing.assert_array_equal(arr, expected)
+			self.assertFalse(arr.flags.writeable)
+		self.assertIn("key", cache)
+		self.assertIsNone(cache.get("missing"))
+		# No temporary file is left behind
+		self.assertFalse([name for name in os.listdir(self.cache_dir) if name.endswith(".tmp")])
+
+	def test_partial_entry(self):
+		cache = cache_tools.ArrayCache(cache_dir=self.cache_dir)
+		cache.put("key", (np.zeros(10),))
+		os.remove(os.path.join(self.cache_dir, "key_0.npy"))
+		self.assertIsNone(cache_tools.ArrayCache(cache_dir=self.cache_dir).get("key"))
+
+	def test_prune(self):
+		cache = cache_tools.ArrayCache(max_items=1, cache_dir=self.cache_dir, max_disk_bytes=3*(ENTRY_BYTES+256))
+		for key in ["a", "b", "c"]:
+			cache.put(key, (np.zeros(100),))
+			time.sleep(0.05) # Distinct modification times
+		cache.get("a") # "b" becomes the least recently used entry on disk
+		time.sleep(0.05)
+		cache.put("d", (np.zeros(100),))
+		names = set(os.listdir(self.cache_dir))
+		self.assertNotIn("b.json", names)
+		self.assertNotIn("b_0.npy", names)
+		for key in ["a", "c", "d"]:
+			self.assertIn(f"{key}.json", names)
+		self.assertIsNone(cache.get("b"))
+
+	def test_prune_keeps_last_entry(self):
+		cache = cache_tools.ArrayCache(cache_dir=self.cache_dir, max_disk_bytes=1)
+		cache.put("a", (np.zeros(100),))
+		cache.put("b", (np.zeros(100),))
+		self.assertEqual(sorted(os.listdir(self.cache_dir)), ["b.json", "b_0.npy"])
+
+class TestFunctions(unittest.TestCase):
+	def test_make_key(self):
+		self.assertEqual(cache_tools.make_key({'a': 1, 'b': 2}, "x"), cache_tools.make_key({'b': 2, 'a': 1}, "x"))
+		self.assertNotEqual(cache_tools.make_key(1, 2), cache_tools.make_key(2, 1))
+
+	def test_array_digest(self):
+		arr = np.arange(6, dtype=np.float32)
+		self.assertEqual(cache_tools.array_digest(arr), cache_tools.array_digest(arr.copy()))
+		self.assertNotEqual(cache_tools.array_digest(arr), cache_tools.array_digest(arr.reshape(2, 3)))
+		self.assertNotEqual(cache_tools.array_digest(arr), cache_tools.array_digest(arr.astype(np.float64)))
+
+	def test_size_of(self):
+		self.assertEqual(cache_tools.size_of((np.zeros(100), [np.zeros(100), None])), 2*ENTRY_BYTES)
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
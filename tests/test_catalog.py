@@ -0,0 +1,115 @@
+# Tests of the query parsing and search of utils/catalog.py, over catalog entries built by hand
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import unittest
+
+import numpy as np
+
+# Custom imports
+import catalog
+
+###############
+## Constants ##
+###############
+
+#############
+## Classes ##
+#############
+
+class TestParseQuery(unittest.TestCase):
+	def check_period(self, query : str, start : str, end : str):
+		criteria = catalog.parse_query(query)
+		self.assertEqual((criteria['start'], criteria['end']), (np.datetime64(start, 's'), np.datetime64(end, 's')), query)
+		return criteria
+
+	def test_periods(self):
+		self.check_period("2019", "2019-01-01", "2020-01-01")
+		self.check_period("Jan 2019", "2019-01-01", "2019-02-01")
+		self.check_period("december 2019", "2019-12-01", "2020-01-01")
+		self.check_period("2019-2", "2019-02-01", "2019-03-01")
+		self.check_period("2019-02-28", "2019-02-28", "2019-03-01")
+		self.check_period("2019-02-28 06:00", "2019-02-28T06:00", "2019-02-28T06:01")
+
+	def test_terms_and_level(self):
+		criteria = self.check_period("T2M, Jan 2019, 850 hPa", "2019-01-01", "2019-02-01")
+		self.assertEqual(criteria['terms'], ["t2m"])
+		self.assertEqual(criteria['level'], 850.)
+		criteria = catalog.parse_query("temperature")
+		self.assertEqual(criteria, {'terms': ["temperature"], 'start': None, 'end': None, 'level': None})
+		self.assertEqual(catalog.parse_query("")['terms'], [])
+
+	def test_invalid_dates(self):
+		for query in ["2019-13", "2019-02-30"]:
+			with self.assertRaises(ValueError):
+				catalog.parse_query(query)
+
+class TestSearch(unittest.TestCase):
+	def setUp(self):
+		self.catalog = catalog.Catalog("/data", [
+			self.entry("/data/surface_2019.nc", {'t2m': "2 metre temperature", 'u10': "10 metre U wind component"},
+					   "2019-01-01T00:00:00", "2019-12-31T23:00:00"),
+			self.entry("/data/pressure_2019_06.nc", {'t': "Temperature", 'z': "Geopotential"},
+					   "2019-06-01T00:00:00", "2019-06-30T18:00:00", [1000., 850., 500.]),
+			self.entry("/data/surface_2020.nc", {'t2m': "2 metre temperature"}, "2020-01-01T00:00:00", "2020-12-31T23:00:00")
+		])
+
+	@staticmethod
+	def entry(path : str, variables : dict, time_start : str, time_end : str, levels : list = None):
+		"""
+		Return a catalog entry, as built by catalog.read_entry.
+		"""
+		return {
+			'path': path,
+			'variables': {name: {'long_name': long_name, 'units': ''} for name, long_name in variables.items()},
+			'n_steps': 1,
+			'time_start': time_start,
+			'time_end': time_end,
+			'levels': levels,
+			'grid': None
+		}
+
+	def test_variable(self):
+		matches = self.catalog.search("t2m")
+		self.assertEqual([match['path'] for match in matches], ["/data/surface_2019.nc", "/data/surface_2020.nc"])
+		self.assertTrue(all(match['date'] is None for match in matches))
+		# Words of the long name match as well
+		self.assertEqual(sorted(match['variable'] for match in self.catalog.search("temperature")), ["t", "t2m", "t2m"])
+
+	def test_period(self):
+		matches = self.catalog.search("t2m, Mar 2020")
+		self.assertEqual(len(matches), 1)
+		self.assertEqual(matches[0]['date'], "2020-03-01 00:00:00")
+		# The first timestep of the file within the period
+		matches = self.catalog.search("geopotential, 2019")
+		self.assertEqual([match['date'] for match in matches], ["2019-06-01 00:00:00"])
+
+	def test_level(self):
+		matches = self.catalog.search("z, 500 hPa")
+		self.assertEqual(len(matches), 1)
+		self.assertEqual(matches[0]['pl_index'], 2)
+		self.assertIn("500 hPa", matches[0]['label'])
+		self.assertEqual(self.catalog.search("z, 700 hPa"), [])
+		# Files without levels do not match a level
+		self.assertEqual(self.catalog.search("t2m, 850 hPa"), [])
+
+	def test_max_results(self):
+		self.assertEqual(len(self.catalog.search("", max_results=3)), 3)
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
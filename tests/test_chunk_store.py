@@ -0,0 +1,109 @@
+# Tests of the chunk stores of utils/chunk_store.py, against reads of the source variable
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import tempfile
+import unittest
+
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import nc_tools
+import chunk_store
+
+###############
+## Constants ##
+###############
+
+SHAPE = (12, 2, 7, 9) # (time, level, lat, lon)
+
+#############
+## Classes ##
+#############
+
+class TestChunkStore(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.store_path = chunk_store.STORE_PATH
+		self.budget = chunk_store.CHUNK_BUDGET
+		chunk_store.STORE_PATH = os.path.join(self.tmp_dir.name, "stores")
+		rng = np.random.default_rng(0)
+		self.data = np.ma.masked_invalid(rng.normal(size=SHAPE).astype(np.float32))
+		self.data[3, 1, 2, 4] = np.ma.masked
+		path = os.path.join(self.tmp_dir.name, "source.nc")
+		with nc.Dataset(path, 'w') as ds:
+			for dim, size in zip(['time', 'level', 'lat', 'lon'], SHAPE):
+				ds.createDimension(dim, size)
+			ds.createVariable('t', 'f4', ('time', 'level', 'lat', 'lon'))[:] = self.data
+			ds.createVariable('sp', 'f4', ('time', 'lat', 'lon'))[:] = self.data[:, 0]
+		self.dataset = nc.Dataset(path)
+
+	def tearDown(self):
+		nc_tools.detach_stores()
+		self.dataset.close()
+		chunk_store.STORE_PATH = self.store_path
+		chunk_store.CHUNK_BUDGET = self.budget
+		self.tmp_dir.cleanup()
+
+	def check(self, store):
+		for key in [
+					(5,), (slice(2, 9), 1), (slice(None), 0, 3, 4), (slice(None), 1, 2, 4), (7, 1, slice(1, 5), slice(None))
+					]:
+			read = store.read(key)
+			expected = self.data[key]
+			np.testing.assert_array_equal(np.ma.getmaskarray(read), np.ma.getmaskarray(expected), err_msg=str(key))
+			np.testing.assert_array_equal(np.ma.filled(read, 0.), np.ma.filled(expected, 0.), err_msg=str(key))
+
+	def test_convert(self):
+		self.assertIsNone(chunk_store.find_store(self.dataset, 't'))
+		store = chunk_store.convert(self.dataset, 't')
+		self.assertEqual(store.shape, SHAPE)
+		self.assertEqual(store.layouts['series'].shape, SHAPE[1:]+SHAPE[:1])
+		self.check(store)
+		self.check(chunk_store.find_store(self.dataset, 't'))
+
+	def test_small_budget(self):
+		# Timesteps read one by one, time series transposed by runs of 3 grid points of a row
+		chunk_store.CHUNK_BUDGET = 3*SHAPE[0]*4
+		fractions = []
+		store = chunk_store.convert(self.dataset, 't', progress=lambda fraction, message: fractions.append(fraction))
+		self.check(store)
+		self.assertEqual(fractions, sorted(fractions))
+		self.assertEqual(fractions[-1], 1.)
+
+	def test_interrupted_conversion(self):
+		def progress(fraction : float, message : str):
+			if fraction > 0.5:
+				raise KeyboardInterrupt()
+		with self.assertRaises(KeyboardInterrupt):
+			chunk_store.convert(self.dataset, 't', progress=progress)
+		self.assertIsNone(chunk_store.find_store(self.dataset, 't'))
+		self.assertEqual(os.listdir(chunk_store.STORE_PATH), [])
+
+	def test_attach(self):
+		chunk_store.convert(self.dataset, 'sp')
+		self.assertEqual(chunk_store.attach_stores(self.dataset), ['sp'])
+		# Reads of the attached variable go through its store and give the source values
+		self.assertIsInstance(nc_tools.read_point_series(self.dataset['sp'], 2, 4), np.ma.MaskedArray)
+		np.testing.assert_array_equal(nc_tools.read_point_series(self.dataset['sp'], 3, 4), self.data[:, 0, 3, 4])
+		self.assertEqual(chunk_store.attach_stores(self.dataset), ['sp'])
+		self.assertIsNone(chunk_store.find_store(self.dataset, 't'))
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
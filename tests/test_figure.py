@@ -0,0 +1,175 @@
+# Smoke tests of the drawing engines of utils/figure, on every map preset, with a synthetic global dataset
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import json
+import tempfile
+import unittest
+
+import numpy as np
+import netCDF4 as nc
+
+# matplotlib imports, without any GUI backend
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure as MplFig
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Custom imports
+import figure
+import map_tools
+import grid_tools
+import lookup_tools
+
+###############
+## Constants ##
+###############
+
+PRESETS_FILE = os.path.join(UTILS_PATH, "figure", "map_presets.json")
+N_STEPS = 2
+LONS = np.arange(0., 360., 2.5) # ERA5 convention: 0..360
+LATS = np.arange(90., -90.1, -2.5)
+# Plot types drawing a scalar variable (t2m of the synthetic dataset)
+SCALAR_PLOT_TYPES = ["pcolormesh", "imshow", "transform", "lookup", "lookup_bilinear"]
+CONTOUR_PLOT_TYPES = ["contour", "contourf"]
+# Plot types drawing the wind of a u/v pair (u10 and v10 of the synthetic dataset)
+VECTOR_PLOT_TYPES = ["quiver", "barbs", "streamplot"]
+
+#############
+## Classes ##
+#############
+
+class TestEngines(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		with open(PRESETS_FILE, 'r') as foo:
+			cls.presets = json.load(foo)
+		# Caches are written in a temporary directory
+		cls.tmp_dir = tempfile.TemporaryDirectory()
+		cls.cache_dirs = (figure.PROJECTION_CACHE.cache_dir, lookup_tools.LOOKUP_CACHE.cache_dir, map_tools.BASEMAP_CACHE_PATH)
+		figure.PROJECTION_CACHE.cache_dir = os.path.join(cls.tmp_dir.name, "projections")
+		lookup_tools.LOOKUP_CACHE.cache_dir = os.path.join(cls.tmp_dir.name, "lookup")
+		map_tools.BASEMAP_CACHE_PATH = os.path.join(cls.tmp_dir.name, "basemaps")
+		cls.dataset = make_dataset()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.dataset.close()
+		figure.PROJECTION_CACHE.cache_dir, lookup_tools.LOOKUP_CACHE.cache_dir, map_tools.BASEMAP_CACHE_PATH = cls.cache_dirs
+		cls.tmp_dir.cleanup()
+
+	def render(self, preset : str, plot_type : str, variable : str):
+		"""
+		Draw a first frame, then update it with the next timestep, as when scrubbing through time.
+		"""
+		mpl_fig = MplFig(figsize=(6, 4), dpi=50)
+		canvas = FigureCanvasAgg(mpl_fig)
+		ax = mpl_fig.add_subplot(111)
+		map_options = dict(figure.DEFAULT_MAP_OPTIONS, variable=variable, time_index=0, preset=preset, plot_type=plot_type,
+						   resolution='c', colorbar=True)
+		fig = figure.Figure(figure=mpl_fig, ax=ax, dataset=self.dataset, map_options=map_options, presets=self.presets)
+		fig.plot_data()
+		canvas.draw()
+		self.assertTrue(fig.get_animated_artists())
+		fig.update_data(fig.read_frame(1))
+		fig.update_style(dict(map_options, cmap="viridis", norm=True, c_min=-10, c_max=10, midpoint=0))
+		canvas.draw()
+		self.assertEqual(np.asarray(canvas.buffer_rgba()).shape[:2], (200, 300))
+		return fig
+
+	def check(self, plot_types : list, variable : str):
+		for preset in self.presets:
+			for plot_type in plot_types:
+				with self.subTest(preset=preset, plot_type=plot_type):
+					self.render(preset, plot_type, variable)
+
+	def test_scalar_engines(self):
+		self.check(SCALAR_PLOT_TYPES, "t2m")
+
+	def test_contour_engines(self):
+		self.check(CONTOUR_PLOT_TYPES, "t2m")
+
+	def test_vector_engines(self):
+		self.check(VECTOR_PLOT_TYPES, "u10")
+		with self.assertRaises(Exception):
+			self.render("cyl_world", "quiver", "t2m")
+
+	def test_redrawn_artists(self):
+		# Artists of the previous frame are removed when streamlines are drawn again
+		fig = self.render("default", "streamplot", "v10")
+		n_artists = len(fig.ax.get_children())-len(fig.extra_artists)
+		for time_index in [0, 1]:
+			previous = fig.extra_artists
+			self.assertTrue(previous)
+			fig.update_data(fig.read_frame(time_index))
+			# The number of arrow heads depends on the streamlines: only the other artists are counted
+			self.assertEqual(len(fig.ax.get_children())-len(fig.extra_artists), n_artists)
+			self.assertFalse(any(artist in fig.ax.patches for artist in previous))
+			self.assertTrue(all(artist in fig.ax.patches for artist in fig.extra_artists))
+
+	def test_readout(self):
+		for preset, plot_type, variable in [("cyl_world", "pcolormesh", "t2m"), ("default", "quiver", "u10")]:
+			fig = self.render(preset, plot_type, variable)
+			self.assertEqual(fig.get_readout(0, 0), (None, None, None)) # Raster not built yet
+			fig.readout = fig.build_readout(fig.get_view())
+			_, _, nx, ny = fig.get_view()
+			lon, lat, value = fig.get_readout(nx//2, ny//2)
+			self.assertAlmostEqual(lon, 0., delta=2.)
+			self.assertAlmostEqual(lat, 0., delta=2.)
+			j, i = grid_tools.get_grid_index(fig.lons, fig.lats).locate(lon, lat)
+			expected = np.hypot(*fig.data[:, j, i]) if fig.vector_pair is not None else fig.data[j, i]
+			self.assertAlmostEqual(value, float(expected), places=4)
+		# Corners of the Mollweide map are outside of the globe
+		self.assertEqual(fig.get_readout(0, 0), (None, None, None))
+
+	def test_transform_outside_globe(self):
+		# Pixels of the Mollweide map outside of the globe are masked, the others have values
+		fig = self.render("default", "transform", "t2m")
+		image = fig.mesh.get_array()
+		self.assertTrue(np.ma.getmaskarray(image).any())
+		self.assertTrue(np.all(np.isfinite(np.ma.compressed(image))))
+		self.assertGreater(np.ma.count(image), image.size//2)
+
+###############
+## Functions ##
+###############
+
+def make_dataset():
+	"""
+	Return an in-memory (time, lat, lon) dataset with a temperature and a pair of wind components.
+	"""
+	ds = nc.Dataset("synthetic.nc", 'w', diskless=True)
+	ds.createDimension('time', N_STEPS)
+	ds.createDimension('latitude', len(LATS))
+	ds.createDimension('longitude', len(LONS))
+	time = ds.createVariable('time', 'f8', ('time',))
+	time.units = "hours since 2019-01-01 00:00:00"
+	time[:] = np.arange(N_STEPS)*6.
+	ds.createVariable('latitude', 'f4', ('latitude',))[:] = LATS
+	ds.createVariable('longitude', 'f4', ('longitude',))[:] = LONS
+	lon, lat = np.meshgrid(np.deg2rad(LONS), np.deg2rad(LATS))
+	phase = np.arange(N_STEPS)[:, None, None]
+	fields = {
+		't2m': 20.*np.cos(lat)*np.cos(lon-phase)-5.,
+		'u10': 10.*np.cos(2.*lat)+phase,
+		'v10': 5.*np.sin(lon+phase)*np.cos(lat)
+	}
+	for name, values in fields.items():
+		var = ds.createVariable(name, 'f4', ('time', 'latitude', 'longitude'))
+		var.units = "K" if name == 't2m' else "m s**-1"
+		var[:] = values
+	return ds
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,152 @@
+# Tests of the read planning of utils/figure/grid_tools.py, against reads of the whole grid
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import unittest
+
+import numpy as np
+
+# Custom imports
+import grid_tools
+
+###############
+## Constants ##
+###############
+
+LONS_360 = np.arange(0., 360., 1.) # 0..360 global grid
+LONS_180 = np.arange(-180., 180., 1.) # -180..180 global grid
+LATS = np.arange(90., -90.5, -1.) # Descending, as ERA5
+
+#############
+## Classes ##
+#############
+
+class TestReadPlan(unittest.TestCase):
+	def setUp(self):
+		self.data = np.arange(2*len(LATS)*len(LONS_360), dtype=np.float32).reshape(2, len(LATS), len(LONS_360))
+
+	def test_regional_window(self):
+		plan = grid_tools.plan_window(LONS_360, LATS, 10., 20., 40., 50.)
+		self.assertTrue(plan.lon_windowed)
+		self.assertEqual(len(plan.lon_slices), 1)
+		# Padded by one cell on each side
+		self.assertEqual((plan.lons[0], plan.lons[-1]), (9., 21.))
+		self.assertEqual((plan.lats.max(), plan.lats.min()), (51., 39.))
+		window = plan.read(self.data, 1)
+		self.assertEqual(window.shape, plan.shape)
+		np.testing.assert_array_equal(window, self.data[1][plan.lat_slice][:, 9:22])
+
+	def test_window_across_greenwich(self):
+		# A 0..360 grid seen from -20..20: two slices, concatenated by increasing longitude
+		plan = grid_tools.plan_window(LONS_360, LATS, -20., 20., -10., 10.)
+		self.assertEqual(len(plan.lon_slices), 2)
+		np.testing.assert_array_equal(plan.lons, np.arange(-21., 22., 1.))
+		window = plan.read(self.data, 0)
+		expected = np.concatenate([self.data[0][plan.lat_slice][:, 339:], self.data[0][plan.lat_slice][:, :22]], axis=-1)
+		np.testing.assert_array_equal(window, expected)
+
+	def test_window_across_dateline(self):
+		plan = grid_tools.plan_window(LONS_180, LATS, 170., 190., -10., 10.)
+		self.assertEqual(len(plan.lon_slices), 2)
+		np.testing.assert_array_equal(plan.lons, np.arange(169., 192., 1.))
+
+	def test_whole_globe(self):
+		plan = grid_tools.plan_window(LONS_360, LATS, -180., 180., -90., 90.)
+		self.assertFalse(plan.lon_windowed)
+		np.testing.assert_array_equal(plan.read(self.data, 0), self.data[0])
+
+	def test_outside_grid(self):
+		regional_lats = np.arange(30., 60., 0.25)
+		with self.assertRaises(Exception):
+			grid_tools.plan_window(LONS_360, regional_lats, 0., 10., -40., -20.)
+
+	def test_plan_read(self):
+		cylindrical = {'projection': 'cyl', 'llcrnrlon': -10., 'urcrnrlon': 30., 'llcrnrlat': 35., 'urcrnrlat': 70.}
+		self.assertEqual(grid_tools.get_bounds(cylindrical), (-10., 30., 35., 70.))
+		self.assertEqual(grid_tools.get_bounds({'projection': 'npstere', 'boundinglat': 40.}), (-180., 180., 40., 90.))
+		self.assertIsNone(grid_tools.get_bounds({'projection': 'ortho', 'lon_0': 0., 'lat_0': 45.}))
+		plan = grid_tools.plan_read(LONS_360, LATS, {'projection': 'ortho', 'lon_0': 0., 'lat_0': 45.})
+		self.assertEqual(plan.shape, (len(LATS), len(LONS_360)))
+
+	def test_grid_helpers(self):
+		self.assertTrue(grid_tools.is_global(LONS_360))
+		self.assertFalse(grid_tools.is_global(np.arange(0., 90., 1.)))
+		self.assertTrue(grid_tools.is_regular(LATS))
+		self.assertFalse(grid_tools.is_regular(np.array([0., 1., 3.])))
+		self.assertEqual(grid_tools.detect_lon_convention(LONS_360), '0..360')
+		self.assertEqual(grid_tools.detect_lon_convention(LONS_180), '-180..180')
+		slices = grid_tools._runs_to_slices(np.array([5, 6, 7, 0, 1]))
+		self.assertEqual(slices, [slice(5, 8), slice(0, 2)])
+
+class TestNormalizeLongitudes(unittest.TestCase):
+	def test_global_grid(self):
+		data = np.tile(LONS_360, (2, 3, 1)) # Each value is its longitude
+		lons, new_data = grid_tools.normalize_longitudes(LONS_360, data)
+		np.testing.assert_array_equal(lons, LONS_180)
+		np.testing.assert_array_equal(new_data[1, 2], np.mod(LONS_180, 360.))
+		lons, _ = grid_tools.normalize_longitudes(LONS_360, data, center=100.)
+		self.assertEqual((lons[0], lons[-1]), (-80., 279.))
+
+	def test_masked_data(self):
+		data = np.ma.masked_greater(np.tile(LONS_360, (3, 1)), 300.)
+		_, new_data = grid_tools.normalize_longitudes(LONS_360, data)
+		self.assertTrue(np.ma.isMaskedArray(new_data))
+		np.testing.assert_array_equal(np.ma.getmaskarray(new_data), np.ma.getmaskarray(data)[:, np.argsort(np.mod(LONS_360+180., 360.))])
+
+	def test_no_copy(self):
+		# Grids already in order are returned as they are
+		data = np.zeros((3, len(LONS_180)))
+		lons, new_data = grid_tools.normalize_longitudes(LONS_180, data)
+		self.assertIs(new_data, data)
+		regional = np.arange(0., 40., 1.)
+		data = np.tile(regional, (3, 1))
+		lons, new_data = grid_tools.normalize_longitudes(regional[::-1], data[:, ::-1])
+		np.testing.assert_array_equal(lons, regional)
+		np.testing.assert_array_equal(new_data, data)
+		self.assertTrue(np.shares_memory(new_data, data))
+
+class TestGridIndex(unittest.TestCase):
+	def brute_force(self, lons : np.ndarray, lats : np.ndarray, lon : float, lat : float):
+		lon_distance = np.abs(np.mod(lons-lon+180., 360.)-180.)
+		return int(np.argmin(np.abs(lats-lat))), int(np.argmin(lon_distance))
+
+	def test_global_grid(self):
+		rng = np.random.default_rng(0)
+		for lons in [LONS_360, LONS_180]:
+			index = grid_tools.GridIndex(lons, LATS)
+			for lon, lat in zip(rng.uniform(-540., 540., 200), rng.uniform(-90., 90., 200)):
+				self.assertEqual(index.locate(lon, lat), self.brute_force(lons, LATS, lon, lat), (lon, lat))
+		# Between the last and the first longitude
+		self.assertEqual(grid_tools.GridIndex(LONS_360, LATS).locate(359.8, 0.), (90, 0))
+		self.assertEqual(grid_tools.GridIndex(LONS_360, LATS).locate(359.2, 0.), (90, 359))
+
+	def test_regional_grid(self):
+		lons = np.arange(-10., 30.1, 0.5)
+		lats = np.arange(70., 34.9, -0.5)
+		index = grid_tools.GridIndex(lons, lats)
+		self.assertEqual(index.locate(2.1, 48.9), (42, 24))
+		self.assertEqual(index.locate(30.2, 35.), (70, 80)) # Within half a cell of the grid
+		self.assertIsNone(index.locate(31., 50.))
+		self.assertIsNone(index.locate(0., 30.))
+
+	def test_shared_index(self):
+		self.assertIs(grid_tools.get_grid_index(LONS_360, LATS), grid_tools.get_grid_index(LONS_360.copy(), LATS.copy()))
+		self.assertIsNot(grid_tools.get_grid_index(LONS_360, LATS), grid_tools.get_grid_index(LONS_180, LATS))
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,124 @@
+# Tests of the reprojection lookup tables of utils/figure/lookup_tools.py, against direct interpolations
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import tempfile
+import unittest
+
+import numpy as np
+
+# Custom imports
+import lookup_tools
+
+###############
+## Constants ##
+###############
+
+LONS = np.arange(0., 360., 10.) # Global grid, 0..360
+LATS = np.arange(80., -80.1, -10.) # Descending
+
+#############
+## Classes ##
+#############
+
+class TestLookupTables(unittest.TestCase):
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		self.pixel_lons = np.ma.masked_array(rng.uniform(-180., 180., size=(20, 30)))
+		self.pixel_lats = np.ma.masked_array(rng.uniform(-79., 79., size=(20, 30)))
+		self.pixel_lats[0, :5] = np.ma.masked # Outside of the globe
+		self.data = rng.normal(size=(len(LATS), len(LONS))).astype(np.float32)
+
+	def test_nearest(self):
+		table = lookup_tools.build_table(self.pixel_lons, self.pixel_lats, LONS, LATS, "nearest")
+		image = lookup_tools.apply_table(table, self.data)
+		self.assertTrue(np.all(np.ma.getmaskarray(image)[0, :5]))
+		# Closest cell, longitudes being compared around the globe
+		lon_distance = np.abs(np.mod(self.pixel_lons[..., None]-LONS+180., 360.)-180.)
+		i = np.argmin(lon_distance, axis=-1)
+		j = np.argmin(np.abs(self.pixel_lats[..., None]-LATS), axis=-1)
+		expected = np.ma.masked_array(self.data[j, i], mask=np.ma.getmaskarray(self.pixel_lats))
+		np.testing.assert_array_equal(np.ma.filled(image, np.nan), np.ma.filled(expected, np.nan))
+
+	def test_bilinear(self):
+		# A field linear in latitude is reproduced exactly
+		field = np.repeat(LATS[:, None], len(LONS), axis=1).astype(np.float32)
+		table = lookup_tools.build_table(self.pixel_lons, self.pixel_lats, LONS, LATS, "bilinear")
+		image = lookup_tools.apply_table(table, field)
+		valid = ~np.ma.getmaskarray(self.pixel_lats)
+		np.testing.assert_allclose(image[valid], self.pixel_lats[valid], atol=1e-3)
+		# Across the 350..360 gap: halfway between the last and the first column
+		table = lookup_tools.build_table(np.ma.masked_array([[355.]]), np.ma.masked_array([[0.]]), LONS, LATS, "bilinear")
+		field = np.zeros((len(LATS), len(LONS)), dtype=np.float32)
+		field[:, 0], field[:, -1] = 2., 4.
+		self.assertAlmostEqual(float(lookup_tools.apply_table(table, field)[0, 0]), 3., places=5)
+
+	def test_regional_grid(self):
+		lons = np.arange(-10., 30.1, 1.)
+		lats = np.arange(35., 70.1, 1.)
+		pixel_lons = np.ma.masked_array([[0., 40., -20., 29.6]])
+		pixel_lats = np.ma.masked_array([[50., 50., 50., 69.6]])
+		data = np.arange(len(lats)*len(lons), dtype=np.float32).reshape(len(lats), len(lons))
+		image = lookup_tools.apply_table(lookup_tools.build_table(pixel_lons, pixel_lats, lons, lats, "nearest"), data)
+		# No wrapping: pixels beyond the grid are masked
+		self.assertEqual(list(np.ma.getmaskarray(image)[0]), [False, True, True, False])
+		self.assertEqual(float(image[0, 0]), data[15, 10])
+		self.assertEqual(float(image[0, 3]), data[35, 40])
+
+	def test_missing_values(self):
+		self.data[:, :] = np.nan
+		for method in lookup_tools.METHODS:
+			table = lookup_tools.build_table(self.pixel_lons, self.pixel_lats, LONS, LATS, method)
+			self.assertTrue(np.all(np.ma.getmaskarray(lookup_tools.apply_table(table, self.data))))
+
+class TestGetTable(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.cache_dir = lookup_tools.LOOKUP_CACHE.cache_dir
+		lookup_tools.LOOKUP_CACHE.cache_dir = self.tmp_dir.name
+		lookup_tools.LOOKUP_CACHE.clear()
+		self.n_builds = 0
+
+	def tearDown(self):
+		lookup_tools.LOOKUP_CACHE.clear()
+		lookup_tools.LOOKUP_CACHE.cache_dir = self.cache_dir
+		self.tmp_dir.cleanup()
+
+	def pixel_coordinates(self):
+		self.n_builds += 1
+		lons, lats = np.meshgrid(np.linspace(-170., 170., 8), np.linspace(-70., 70., 5))
+		return np.ma.masked_array(lons), np.ma.masked_array(lats)
+
+	def test_cache(self):
+		key_parts = ({'projection': 'cyl'}, (0., 1.), (0., 1.), 8, 5)
+		table = lookup_tools.get_table(key_parts, self.pixel_coordinates, LONS, LATS, "bilinear")
+		self.assertEqual(self.n_builds, 1)
+		# From memory, then from disk once memory is cleared
+		lookup_tools.get_table(key_parts, self.pixel_coordinates, LONS, LATS, "bilinear")
+		lookup_tools.LOOKUP_CACHE.clear()
+		loaded = lookup_tools.get_table(key_parts, self.pixel_coordinates, LONS, LATS, "bilinear")
+		self.assertEqual(self.n_builds, 1)
+		for arr, expected in zip(loaded, table):
+			np.testing.assert_array_equal(arr, expected)
+		# Another method or grid is another table
+		lookup_tools.get_table(key_parts, self.pixel_coordinates, LONS, LATS, "nearest")
+		lookup_tools.get_table(key_parts, self.pixel_coordinates, LONS[:-1], LATS, "nearest")
+		self.assertEqual(self.n_builds, 3)
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,109 @@
+# Tests of the timestep decoding of utils/nc_tools.py, against netCDF4.num2date
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import unittest
+
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+#############
+## Classes ##
+#############
+
+class TestDecodeTimes(unittest.TestCase):
+	def setUp(self):
+		self.datasets = []
+
+	def tearDown(self):
+		for ds in self.datasets:
+			ds.close()
+
+	def make_time(self, values, units : str, calendar : str = None):
+		"""
+		Return the time variable of an in-memory dataset.
+		"""
+		ds = nc.Dataset(f"time_{len(self.datasets)}.nc", 'w', diskless=True)
+		self.datasets.append(ds)
+		ds.createDimension('time', len(values))
+		time = ds.createVariable('time', 'f8', ('time',))
+		time.units = units
+		if calendar is not None:
+			time.calendar = calendar
+		time[:] = values
+		return time
+
+	def expected(self, time):
+		dates = nc.num2date(time[:], time.units, getattr(time, 'calendar', 'standard'))
+		return np.array([np.datetime64(d.strftime("%Y-%m-%dT%H:%M:%S"), 's') for d in dates])
+
+	def test_gregorian(self):
+		for values, units in [
+							  (np.arange(0., 240., 6.)+1042872., nc_tools.DEFAULT_TIME_UNITS),
+							  (np.arange(10)*86400., "seconds since 2000-1-1"),
+							  (np.array([0., 1.5, 31.]), "days since 1970-01-01 00:00:00"),
+							  (np.arange(5)*30., "Minutes since 2019-06-30T23:00:00Z")
+							  ]:
+			time = self.make_time(values, units, 'gregorian')
+			np.testing.assert_array_equal(nc_tools.decode_times(time), self.expected(time), err_msg=units)
+
+	def test_default_calendar(self):
+		time = self.make_time(np.arange(4.)*6., "hours since 2019-01-01")
+		times = nc_tools.decode_times(time)
+		self.assertEqual(times.dtype, np.dtype('datetime64[s]'))
+		self.assertEqual(str(times[-1]), "2019-01-01T18:00:00")
+
+	def test_other_calendar(self):
+		# 365-day years: 2020-02-29 does not exist
+		time = self.make_time(np.arange(58., 61.), "days since 2020-01-01", 'noleap')
+		self.assertEqual([str(t)[:10] for t in nc_tools.decode_times(time)], ["2020-02-28", "2020-03-01", "2020-03-02"])
+
+class TestTimestepList(unittest.TestCase):
+	def test_labels(self):
+		hourly = nc_tools.TimestepList(np.datetime64("2019-01-01T00:00", 's')+np.arange(48)*np.timedelta64(1, 'h'))
+		self.assertEqual(len(hourly), 48)
+		self.assertEqual(hourly[25], "25 : 2019-01-02 01:00")
+		self.assertEqual(hourly[-1], "47 : 2019-01-02 23:00")
+		self.assertEqual(hourly[:2], ["0 : 2019-01-01 00:00", "1 : 2019-01-01 01:00"])
+		daily = nc_tools.TimestepList(np.datetime64("2019-01-01", 's')+np.arange(3)*np.timedelta64(1, 'D'))
+		self.assertEqual(list(daily), ["0 : 2019-01-01", "1 : 2019-01-02", "2 : 2019-01-03"])
+
+	def test_index_of(self):
+		steps = nc_tools.TimestepList(np.datetime64("2019-01-01T00:00", 's')+np.arange(8)*np.timedelta64(6, 'h'))
+		self.assertEqual(steps.index_of("2019-01-01 13:00"), 2)
+		self.assertEqual(steps.index_of(np.datetime64("2019-01-01T16:00")), 3)
+		self.assertEqual(steps.index_of("2018-06-01"), 0)
+		self.assertEqual(steps.index_of("2020-01-01"), 7)
+		with self.assertRaises(ValueError):
+			steps.index_of("2019-13-01")
+
+	def test_index_of_unordered(self):
+		times = np.array(["2019-01-03", "2019-01-01", "2019-01-02"], dtype='datetime64[s]')
+		steps = nc_tools.TimestepList(times)
+		self.assertEqual(steps.index_of("2019-01-01 02:00"), 1)
+		self.assertEqual(steps.index_of("2019-01-03"), 0)
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,94 @@
+# Tests of the packed 16-bit read path of utils/figure/packed_tools.py, against the unpacking of netCDF4
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import unittest
+
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import nc_tools
+import packed_tools
+
+###############
+## Constants ##
+###############
+
+SCALE_FACTOR = 0.0018
+ADD_OFFSET = 265.3
+MISSING_VALUE = -32766
+
+#############
+## Classes ##
+#############
+
+class TestPacked(unittest.TestCase):
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		raw = rng.integers(-32768, 32768, size=(3, 20, 30)).astype(np.int16)
+		raw[0, 0, :3] = [nc.default_fillvals['i2'], MISSING_VALUE, -32768]
+		self.ds = nc.Dataset("packed.nc", 'w', diskless=True)
+		for dim, size in zip(['time', 'lat', 'lon'], raw.shape):
+			self.ds.createDimension(dim, size)
+		var = self.ds.createVariable('t2m', 'i2', ('time', 'lat', 'lon'), fill_value=nc.default_fillvals['i2'])
+		var.scale_factor = SCALE_FACTOR
+		var.add_offset = ADD_OFFSET
+		var.missing_value = np.int16(MISSING_VALUE)
+		var.set_auto_maskandscale(False)
+		var[:] = raw
+		var.set_auto_maskandscale(True)
+		self.raw = raw
+
+	def tearDown(self):
+		self.ds.close()
+
+	def test_read_packed(self):
+		raw, packing = nc_tools.read_packed(self.ds['t2m'], (1, slice(None), slice(None)))
+		self.assertEqual(raw.dtype, np.int16)
+		np.testing.assert_array_equal(raw, self.raw[1])
+		self.assertEqual(packing, {'scale_factor': SCALE_FACTOR, 'add_offset': ADD_OFFSET,
+								   'fill_values': sorted([int(nc.default_fillvals['i2']), MISSING_VALUE])})
+		# Auto scaling is enabled again
+		self.assertTrue(np.ma.isMaskedArray(self.ds['t2m'][0]))
+
+	def test_unpack(self):
+		raw, packing = nc_tools.read_packed(self.ds['t2m'], (0, slice(None), slice(None)))
+		values = packed_tools.unpack(raw, packing)
+		self.assertEqual(values.dtype, np.float32)
+		expected = self.ds['t2m'][0]
+		np.testing.assert_array_equal(np.isnan(values), np.ma.getmaskarray(expected))
+		self.assertTrue(np.isnan(values[0, :2]).all() and np.isfinite(values[0, 2]))
+		np.testing.assert_allclose(values[~np.isnan(values)], np.ma.compressed(expected), rtol=1e-6)
+
+	def test_corrections(self):
+		raw, packing = nc_tools.read_packed(self.ds['t2m'], (2, slice(None), slice(None)))
+		values = packed_tools.unpack(raw, packing, coef=2, offset=-273.15)
+		expected = np.ma.filled(self.ds['t2m'][2].astype(np.float64)*2-273.15, np.nan)
+		np.testing.assert_allclose(values, expected, rtol=1e-5, equal_nan=True)
+
+	def test_shared_tables(self):
+		packing = {'scale_factor': SCALE_FACTOR, 'add_offset': ADD_OFFSET, 'fill_values': [MISSING_VALUE]}
+		table = packed_tools.get_table(packing)
+		self.assertIs(packed_tools.get_table(dict(packing)), table)
+		self.assertIsNot(packed_tools.get_table(packing, coef=2), table)
+		self.assertEqual(len(table), packed_tools.N_CODES)
+		self.assertFalse(table.flags.writeable)
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+# Tests of the read-ahead of utils/prefetch_tools.py
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import threading
+import unittest
+
+import numpy as np
+
+# Custom imports
+import prefetch_tools
+
+###############
+## Constants ##
+###############
+
+N_STEPS = 20
+FIELD_BYTES = 8*100 # One float64 field of 100 values
+
+#############
+## Classes ##
+#############
+
+class TestPrefetcher(unittest.TestCase):
+	def setUp(self):
+		self.reads = []
+		self.prefetcher = None
+
+	def tearDown(self):
+		if self.prefetcher is not None:
+			self.prefetcher.shutdown()
+
+	def read(self, time_index : int):
+		self.reads.append(time_index)
+		return np.full(100, time_index, dtype=np.float64)
+
+	def wait(self):
+		# The worker runs tasks in order: once this one is done, the read-ahead is done too
+		done = threading.Event()
+		self.prefetcher._executor.submit(done.set)
+		self.assertTrue(done.wait(5.))
+
+	def test_read_ahead(self):
+		self.prefetcher = prefetch_tools.Prefetcher(self.read, N_STEPS, n_ahead=3, n_behind=1)
+		self.prefetcher.request(5)
+		self.wait()
+		self.assertEqual(self.reads, [6, 7, 8, 4])
+		# Prefetched fields are served without reading
+		self.assertEqual(self.prefetcher.get(7)[0], 7)
+		self.assertEqual(self.reads, [6, 7, 8, 4])
+		self.assertEqual(self.prefetcher.get(5)[0], 5)
+		self.assertEqual(self.reads[-1], 5)
+
+	def test_axis_ends(self):
+		self.prefetcher = prefetch_tools.Prefetcher(self.read, N_STEPS, n_ahead=3, n_behind=2)
+		self.prefetcher.request(N_STEPS-2)
+		self.wait()
+		self.assertEqual(sorted(self.reads), [N_STEPS-4, N_STEPS-3, N_STEPS-1])
+		self.prefetcher.request(0)
+		self.wait()
+		self.assertNotIn(-1, self.reads)
+
+	def test_budget(self):
+		self.prefetcher = prefetch_tools.Prefetcher(self.read, N_STEPS, n_ahead=6, n_behind=0, max_bytes=3*FIELD_BYTES)
+		self.prefetcher.request(0)
+		self.wait()
+		self.assertEqual(len(self.prefetcher.cache), 3)
+		self.assertLessEqual(self.prefetcher.cache.n_bytes, 3*FIELD_BYTES)
+		# The least recently read fields are evicted first
+		self.assertIn(6, self.prefetcher)
+		self.assertNotIn(1, self.prefetcher)
+
+	def test_stale_request(self):
+		self.prefetcher = prefetch_tools.Prefetcher(self.read, N_STEPS, n_ahead=5, n_behind=0)
+		blocked = threading.Event()
+		self.prefetcher._executor.submit(blocked.wait, 5.)
+		self.prefetcher.request(0)
+		self.prefetcher.request(10) # Drops the pending read-ahead of the first request
+		blocked.set()
+		self.wait()
+		self.assertEqual(self.reads, [11, 12, 13, 14, 15])
+
+	def test_read_error(self):
+		def read(time_index : int):
+			if time_index == 3:
+				raise OSError("Broken file")
+			return self.read(time_index)
+		self.prefetcher = prefetch_tools.Prefetcher(read, N_STEPS, n_ahead=4, n_behind=0)
+		self.prefetcher.request(0)
+		self.wait()
+		# The read-ahead stops at the first error, without raising in the worker
+		self.assertEqual(self.reads, [1, 2])
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,132 @@
+# Tests of the overview levels of utils/figure/pyramid_tools.py, against reductions of each block
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import pyramid_tools
+
+###############
+## Constants ##
+###############
+
+SHAPE = (3, 2, 11, 14) # (time, level, lat, lon): incomplete blocks along both axes for all factors
+
+#############
+## Classes ##
+#############
+
+class TestCoarsen(unittest.TestCase):
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		self.data = rng.normal(size=SHAPE).astype(np.float32)
+		self.data[0, 0, :4, :4] = np.nan # A whole 4x4 block without values
+		self.data[1, 1, 5, 7] = np.nan
+
+	def expected(self, factor : int, method : str):
+		"""
+		Reduce each block with numpy, one at a time.
+		"""
+		function = {"mean": np.nanmean, "min": np.nanmin, "max": np.nanmax}[method]
+		ny, nx = -(-SHAPE[-2]//factor), -(-SHAPE[-1]//factor)
+		output = np.full(SHAPE[:-2]+(ny, nx), np.nan)
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore", RuntimeWarning)
+			for j in range (ny):
+				for i in range (nx):
+					block = self.data[..., j*factor:(j+1)*factor, i*factor:(i+1)*factor]
+					output[..., j, i] = function(block.reshape(SHAPE[:-2]+(-1,)), axis=-1)
+		return output
+
+	def test_methods(self):
+		for factor in pyramid_tools.FACTORS:
+			for method in pyramid_tools.METHODS:
+				reduced = pyramid_tools.coarsen(self.data, factor, method)
+				np.testing.assert_allclose(np.ma.filled(reduced.astype(np.float64), np.nan), self.expected(factor, method),
+										   rtol=1e-5, equal_nan=True, err_msg=f"{factor} {method}")
+
+	def test_masked_input(self):
+		masked = np.ma.masked_invalid(self.data)
+		np.testing.assert_allclose(np.ma.filled(pyramid_tools.coarsen(masked, 2), np.nan), self.expected(2, "mean"), rtol=1e-5, equal_nan=True)
+		self.assertTrue(pyramid_tools.coarsen(masked, 4)[0, 0, 0, 0] is np.ma.masked)
+
+	def test_coordinates(self):
+		lats = np.arange(90., 79., -1.)
+		np.testing.assert_allclose(pyramid_tools.coarsen_coordinates(lats, 4), [88.5, 84.5, 81.])
+
+	def test_choose_factor(self):
+		self.assertEqual(pyramid_tools.choose_factor((721, 1440), (400, 600)), 1)
+		self.assertEqual(pyramid_tools.choose_factor((721, 1440), (300, 500)), 2)
+		self.assertEqual(pyramid_tools.choose_factor((721, 1440), (80, 150)), 8)
+
+class TestPyramid(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.pyramid_path = pyramid_tools.PYRAMID_PATH
+		pyramid_tools.PYRAMID_PATH = os.path.join(self.tmp_dir.name, "pyramids")
+		rng = np.random.default_rng(1)
+		self.data = rng.normal(size=SHAPE).astype(np.float32)
+		path = os.path.join(self.tmp_dir.name, "source.nc")
+		with nc.Dataset(path, 'w') as ds:
+			for dim, size in zip(['time', 'level', 'lat', 'lon'], SHAPE):
+				ds.createDimension(dim, size)
+			ds.createVariable('lat', 'f8', ('lat',))[:] = np.linspace(50., 40., SHAPE[2])
+			ds.createVariable('lon', 'f8', ('lon',))[:] = np.linspace(0., 13., SHAPE[3])
+			ds.createVariable('t', 'f4', ('time', 'level', 'lat', 'lon'))[:] = self.data
+		self.dataset = nc.Dataset(path)
+
+	def tearDown(self):
+		self.dataset.close()
+		pyramid_tools.PYRAMID_PATH = self.pyramid_path
+		self.tmp_dir.cleanup()
+
+	def test_build(self):
+		pyramid = pyramid_tools.Pyramid(self.dataset, 't', "max", factors=[2, 4])
+		self.assertFalse(pyramid.is_built())
+		pyramid_tools.BUILD_BUDGET, budget = int(np.prod(SHAPE[1:]))*8, pyramid_tools.BUILD_BUDGET # One timestep at a time
+		try:
+			pyramid.build()
+		finally:
+			pyramid_tools.BUILD_BUDGET = budget
+		self.assertTrue(pyramid.is_built())
+		self.assertEqual(os.listdir(pyramid_tools.PYRAMID_PATH), [os.path.basename(pyramid.path)])
+		try:
+			for factor in [2, 4]:
+				lons, lats = pyramid.coordinates(factor)
+				self.assertEqual((len(lats), len(lons)), (-(-SHAPE[2]//factor), -(-SHAPE[3]//factor)))
+				np.testing.assert_allclose(pyramid.get_variable(factor)[:], pyramid_tools.coarsen(self.data, factor, "max"), rtol=1e-6)
+		finally:
+			pyramid.close()
+
+	def test_interrupted_build(self):
+		def progress(fraction : float, message : str):
+			raise KeyboardInterrupt()
+		pyramid = pyramid_tools.Pyramid(self.dataset, 't')
+		with self.assertRaises(KeyboardInterrupt):
+			pyramid.build(progress=progress)
+		self.assertFalse(pyramid.is_built())
+		self.assertEqual(os.listdir(pyramid_tools.PYRAMID_PATH), [])
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
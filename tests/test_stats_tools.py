@@ -0,0 +1,119 @@
+# Tests of the streaming statistics of utils/stats_tools.py, against numpy statistics of the whole data
+
+#############
+## Imports ##
+#############
+
+# Paths fixing
+import os
+import sys
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils")
+sys.path.append(UTILS_PATH)
+sys.path.append(os.path.join(UTILS_PATH, "features"))
+sys.path.append(os.path.join(UTILS_PATH, "figure"))
+
+# General imports
+import tempfile
+import unittest
+
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import stats_tools
+
+###############
+## Constants ##
+###############
+
+SHAPE = (40, 3, 30, 50) # (time, level, lat, lon)
+
+#############
+## Classes ##
+#############
+
+class TestStreamingStats(unittest.TestCase):
+	def test_exact_statistics(self):
+		rng = np.random.default_rng(0)
+		data = rng.normal(280., 10., size=(20, 100, 100))
+		data[0, :10] = np.nan
+		stats = stats_tools.StreamingStats()
+		for chunk in np.array_split(data, 7):
+			stats.add(np.ma.masked_greater(chunk, 310.))
+		values = data[np.isfinite(data) & (data <= 310.)]
+		result = stats.result()
+		self.assertEqual(result['count'], len(values))
+		self.assertAlmostEqual(result['min'], values.min())
+		self.assertAlmostEqual(result['max'], values.max())
+		self.assertAlmostEqual(result['mean'], values.mean(), places=6)
+		self.assertAlmostEqual(result['std'], values.std(), places=4)
+
+	def test_quantiles(self):
+		# The sample is uniform over the whole stream, even for a trend along time
+		values = np.linspace(0., 1., 1_000_000)
+		stats = stats_tools.StreamingStats(sample_size=20000)
+		for chunk in np.array_split(values, 50):
+			stats.add(chunk)
+		self.assertEqual(len(stats.sample), 20000)
+		self.assertEqual(stats.keys.dtype, np.float64)
+		for q, value in stats.result()['quantiles'].items():
+			self.assertAlmostEqual(value, float(q), delta=0.01)
+
+	def test_empty(self):
+		stats = stats_tools.StreamingStats()
+		stats.add(np.array([np.nan, np.inf]))
+		self.assertIsNone(stats.result())
+		self.assertEqual(stats_tools.format_stats(None), "no valid value")
+
+	def test_colour_limits(self):
+		stats = {'quantiles': {'0.02': 250.2, '0.5': 280.6, '0.98': 300.1}}
+		self.assertEqual(stats_tools.get_colour_limits(stats), (250, 301, 281))
+		# Kelvin to Celsius
+		self.assertEqual(stats_tools.get_colour_limits(stats, offset=-273.15), (-23, 27, 7))
+		# A negative coefficient swaps the limits
+		self.assertEqual(stats_tools.get_colour_limits(stats, coef=-1), (-301, -250, -281))
+
+class TestComputeStats(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.index = stats_tools.STATS_INDEX
+		stats_tools.STATS_INDEX = stats_tools.StatsIndex(os.path.join(self.tmp_dir.name, "stats.sqlite"))
+		rng = np.random.default_rng(1)
+		self.data = (rng.normal(size=SHAPE)*np.arange(1, SHAPE[1]+1)[:, None, None]).astype(np.float32)
+		self.path = os.path.join(self.tmp_dir.name, "source.nc")
+		with nc.Dataset(self.path, 'w') as ds:
+			for dim, size in zip(['time', 'level', 'lat', 'lon'], SHAPE):
+				ds.createDimension(dim, size)
+			ds.createVariable('t', 'f4', ('time', 'level', 'lat', 'lon'))[:] = self.data
+		self.dataset = nc.Dataset(self.path)
+		self.budget = stats_tools.CHUNK_BUDGET
+
+	def tearDown(self):
+		self.dataset.close()
+		stats_tools.STATS_INDEX = self.index
+		stats_tools.CHUNK_BUDGET = self.budget
+		self.tmp_dir.cleanup()
+
+	def test_levels(self):
+		stats_tools.CHUNK_BUDGET = 3*int(np.prod(SHAPE[1:]))*8 # 3 timesteps per chunk
+		fractions = []
+		stats = stats_tools.compute_stats(self.dataset, 't', progress=lambda fraction, message: fractions.append(fraction))
+		self.assertEqual(len(stats), SHAPE[1])
+		for i, level in enumerate(stats):
+			self.assertEqual(level['count'], self.data[:, i].size)
+			self.assertAlmostEqual(level['max'], float(self.data[:, i].max()), places=5)
+			self.assertAlmostEqual(level['std'], float(self.data[:, i].std()), places=3)
+		self.assertEqual(fractions[-1], 1.)
+		self.assertEqual(len(fractions), -(-SHAPE[0]//3))
+
+	def test_cache(self):
+		stats = stats_tools.get_stats(self.dataset, 't')
+		stats_tools.CHUNK_BUDGET = None # Any computation would fail: statistics are read from the index
+		self.assertEqual(stats_tools.get_stats(self.dataset, 't'), stats)
+
+###############
+## Functions ##
+###############
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,386 @@
+# Aggregation: temporal reductions of variables (daily/monthly statistics, climatology, anomalies)
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import multiprocessing
+import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import netCDF4 as nc
+import numpy as np
+
+# Custom imports
+import cache_tools
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+AGGREGATION_PATH = os.path.join(cache_tools.CACHE_PATH, "aggregations")
+AGGREGATION_VERSION = 1 # Version of the result format, results of other versions are not attached
+CHUNK_BUDGET = 64*1024**2 # Memory used by the timesteps read at once, in bytes
+SEPARATOR = "@" # Pseudo-variables are named {variable}@{period}_{reduction}[_{baseline}], e.g. t2m@daily_mean
+# Worker processes are spawned, not forked: a fork could inherit locks held by other threads (e.g. nc_tools.READ_LOCK)
+POOL_START_METHOD = "spawn"
+
+# Periods: daily and monthly reductions are computed from the source variable. The climatology (one step per
+# calendar month, averaged over the baseline years) and the anomalies (each month minus its climatology) are
+# computed from the monthly result, without reading the source again.
+PERIODS = ["daily", "monthly", "climatology", "anomaly"]
+REDUCTIONS = ["mean", "min", "max", "sum"]
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def make_name(variable : str, period : str, reduction : str, baseline : tuple = None):
+	"""
+	Return the name of a pseudo-variable, e.g. t2m@monthly_max or t2m@anomaly_mean_1991-2020.
+	"""
+	name = f"{variable}{SEPARATOR}{period}_{reduction}"
+	if period in ["climatology", "anomaly"]:
+		name += f"_{baseline[0]}-{baseline[1]}"
+	return name
+
+def parse_name(name : str):
+	"""
+	Return the (variable, period, reduction) of a pseudo-variable name, or None for other names.
+	"""
+	if SEPARATOR not in name:
+		return None
+	variable, _, suffix = name.rpartition(SEPARATOR)
+	period, _, reduction = suffix.partition("_")
+	reduction = reduction.partition("_")[0]
+	if period not in PERIODS or reduction not in REDUCTIONS:
+		return None
+	return variable, period, reduction
+
+def get_source_key(dataset):
+	"""
+	Return the key of the source files of a dataset, or None if it is not read from files.
+	"""
+	identities = nc_tools.get_file_identities(dataset)
+	if identities is None:
+		return None
+	return cache_tools.make_key(identities, AGGREGATION_VERSION)
+
+def get_result_path(dataset, variable : str, period : str, reduction : str, baseline : tuple = None):
+	"""
+	Return the path of the netCDF file holding a reduction. :baseline: is the (first, last) years of the climatology.
+	"""
+	source_key = get_source_key(dataset)
+	if source_key is None:
+		raise Exception("AggregationError: Aggregations are only available for datasets read from files.")
+	key = cache_tools.make_key(source_key, variable, period, reduction, baseline if period in ["climatology", "anomaly"] else None)
+	return os.path.join(AGGREGATION_PATH, f"{variable}_{period}_{reduction}_{key}.nc")
+
+def _get_period_codes(times : np.ndarray, period : str):
+	"""
+	Return the period of each timestep as an index into the sorted periods, and the first date of each period.
+	"""
+	unit = 'D' if period == "daily" else 'M'
+	periods, codes = np.unique(times.astype(f"datetime64[{unit}]"), return_inverse=True)
+	return codes, periods.astype('datetime64[s]')
+
+def _reduce_block(block : np.ndarray, reduction : str):
+	"""
+	Reduce a block of consecutive timesteps of the same period: return (value, count of valid values) maps.
+	"""
+	block = np.ma.masked_invalid(np.ma.asarray(block, dtype=np.float64))
+	count = block.count(axis=0)
+	if reduction in ["mean", "sum"]:
+		value = np.ma.filled(block, 0.).sum(axis=0)
+	elif reduction == "min":
+		value = np.ma.filled(block.min(axis=0), np.inf)
+	else:
+		value = np.ma.filled(block.max(axis=0), -np.inf)
+	return value, count
+
+def _combine(state : tuple, new : tuple, reduction : str):
+	"""
+	Merge the partial reductions of two blocks of the same period.
+	"""
+	if state is None:
+		return new
+	(value, count), (new_value, new_count) = state, new
+	if reduction in ["mean", "sum"]:
+		value = value+new_value
+	elif reduction == "min":
+		value = np.minimum(value, new_value)
+	else:
+		value = np.maximum(value, new_value)
+	return value, count+new_count
+
+def _finish(state : tuple, reduction : str):
+	"""
+	Return the float32 map of a complete period, NaN where there is no valid value.
+	"""
+	value, count = state
+	if reduction == "mean":
+		value = value/np.maximum(count, 1)
+	return np.where(count > 0, value, np.nan).astype(np.float32)
+
+def reduce_tile(dataset, variable : str, codes : np.ndarray, reduction : str, output : np.ndarray, lat_slice : slice = slice(None), progress = None):
+	"""
+	Reduce the latitude band :lat_slice: of a (time, [level], lat, lon) variable over the periods of :codes:
+	(see _get_period_codes), in a single pass over time chunks. Each period is written to :output: (period, [level], lat, lon)
+	as soon as it is complete: only the partial reductions of the periods of the current chunk are kept in memory.
+	"""
+	source = dataset[variable]
+	n_steps = source.shape[0]
+	leading = (slice(None),)*(len(source.shape)-3)
+	n_lats = len(range(*lat_slice.indices(source.shape[-2])))
+	step_bytes = int(np.prod(source.shape[1:-2]))*n_lats*source.shape[-1]*8
+	n_chunk = max(1, CHUNK_BUDGET//max(step_bytes, 1))
+	states = {}
+	for start in range (0, n_steps, n_chunk):
+		stop = min(start+n_chunk, n_steps)
+		data = nc_tools.read_slice(source, (slice(start, stop),)+leading+(lat_slice,))
+		chunk_codes = codes[start:stop]
+		for code in np.unique(chunk_codes):
+			states[code] = _combine(states.get(code), _reduce_block(data[chunk_codes == code], reduction), reduction)
+		# Timesteps are in chronological order: periods before the next timestep are complete
+		next_code = codes[stop] if stop < n_steps else np.inf
+		for code in [code for code in states if code < next_code]:
+			output[code][..., lat_slice, :] = _finish(states.pop(code), reduction)
+		if progress is not None:
+			progress(stop/n_steps, f"Aggregating {variable} ({stop}/{n_steps})")
+
+def _reduce_tile_worker(data_path, variable : str, codes : np.ndarray, reduction : str, output_path : str, lat_slice : slice):
+	"""
+	Process pool job: reduce one latitude band, writing into the shared memory-mapped output.
+	"""
+	dataset = nc_tools.open_dataset(data_path)
+	try:
+		output = np.load(output_path, mmap_mode='r+')
+		reduce_tile(dataset, variable, codes, reduction, output, lat_slice)
+		output.flush()
+	finally:
+		dataset.close()
+
+def _get_data_path(dataset):
+	return dataset.paths if isinstance(dataset, nc_tools.VirtualDataset) else nc_tools.get_path(dataset)
+
+def _create_result(path : str, dataset, variable : str, name : str, times : np.ndarray, attributes : dict, source_key : str):
+	"""
+	Create a result file with the coordinates of :dataset: and an empty variable :name: on the :times: axis.
+	The file is tied to the source files through its :source_key: attribute (see get_source_key).
+	Return the open result dataset and its variable.
+	"""
+	source = dataset[variable]
+	if not any(lon_name in source.dimensions and lat_name in source.dimensions for lon_name, lat_name in nc_tools.COORDINATE_NAMES):
+		raise Exception(f"AggregationError: {variable} has no longitude and latitude dimensions.")
+	result = nc.Dataset(path, 'w')
+	result.setncattr('source_key', source_key)
+	result.createDimension('time', len(times))
+	time = result.createVariable('time', 'f8', ('time',))
+	time.units = nc_tools.DEFAULT_TIME_UNITS
+	time.calendar = 'standard'
+	time[:] = (times-np.datetime64("1900-01-01T00:00:00", 's'))/np.timedelta64(1, 'h')
+	for dim in source.dimensions[1:]:
+		coordinate = dataset[dim]
+		result.createDimension(dim, len(coordinate))
+		out = result.createVariable(dim, np.dtype(coordinate.dtype), (dim,))
+		for attr in ['units', 'long_name']:
+			if attr in coordinate.ncattrs():
+				out.setncattr(attr, coordinate.getncattr(attr))
+		out[:] = nc_tools.read_slice(coordinate, slice(None))
+	shape = (1,)+tuple(result.dimensions[dim].size for dim in source.dimensions[1:])
+	out = result.createVariable(name, 'f4', source.dimensions, fill_value=nc.default_fillvals['f4'], chunksizes=shape)
+	for attr, value in attributes.items():
+		out.setncattr(attr, value)
+	return result, out
+
+def _attributes(dataset, variable : str, period : str, reduction : str, baseline : tuple):
+	source = dataset[variable]
+	long_name = getattr(source, 'long_name', variable)
+	attributes = {
+		'units': getattr(source, 'units', ''),
+		'long_name': f"{period} {reduction} of {long_name}",
+		'source_variable': variable,
+		'period': period,
+		'reduction': reduction
+	}
+	if period in ["climatology", "anomaly"]:
+		attributes['baseline'] = f"{baseline[0]}-{baseline[1]}"
+	return attributes
+
+def _aggregate_source(dataset, variable : str, period : str, reduction : str, path : str, processes : int, progress):
+	"""
+	Compute a daily or monthly reduction of the source variable into :path:.
+	With :processes: > 1, latitude bands are reduced in parallel by a process pool.
+	"""
+	source = dataset[variable]
+	if len(source.dimensions) not in (3, 4) or source.dimensions[0] != 'time' or len(source.dimensions) == 4 and source.dimensions[1] != 'level':
+		raise Exception(f"AggregationError: {variable} is not a (time, [level], lat, lon) variable.")
+	times = nc_tools.get_timesteps(dataset).times
+	if np.any(times[1:] < times[:-1]):
+		raise Exception("AggregationError: Timesteps are not in chronological order.")
+	codes, periods = _get_period_codes(times, period)
+	shape = (len(periods),)+tuple(source.shape[1:])
+	tmp_path = f"{path}.{os.getpid()}.npy"
+	output = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+	try:
+		if processes is None or processes <= 1:
+			reduce_tile(dataset, variable, codes, reduction, output, progress=progress)
+		else:
+			output.flush()
+			n_lats = shape[-2]
+			band_size = -(-n_lats//processes)
+			bands = [slice(start, min(start+band_size, n_lats)) for start in range (0, n_lats, band_size)]
+			executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+			futures = [executor.submit(_reduce_tile_worker, _get_data_path(dataset), variable, codes, reduction, tmp_path, band) for band in bands]
+			try:
+				for n_done, future in enumerate(as_completed(futures), start=1):
+					future.result()
+					progress(n_done/len(bands), f"Aggregating {variable} ({n_done}/{len(bands)} tiles)")
+			finally:
+				for future in futures:
+					future.cancel()
+				executor.shutdown(wait=False)
+			output = np.load(tmp_path, mmap_mode='r')
+		result, out = _create_result(path+".tmp", dataset, variable, make_name(variable, period, reduction), periods,
+									 _attributes(dataset, variable, period, reduction, None), get_source_key(dataset))
+		try:
+			n_chunk = max(1, CHUNK_BUDGET//(int(np.prod(shape[1:]))*4))
+			for start in range (0, len(periods), n_chunk):
+				out[start:start+n_chunk] = np.ma.masked_invalid(output[start:start+n_chunk])
+		finally:
+			result.close()
+	finally:
+		del output
+		os.remove(tmp_path)
+	os.replace(path+".tmp", path)
+
+def _aggregate_monthly(dataset, variable : str, period : str, reduction : str, baseline : tuple, path : str, processes : int, progress):
+	"""
+	Compute the climatology or the anomalies of the monthly reduction (computed first if needed) into :path:.
+	"""
+	name = make_name(variable, period, reduction, baseline)
+	monthly = nc.Dataset(aggregate(dataset, variable, "monthly", reduction, processes=processes,
+								   progress=lambda fraction, message: progress(0.8*fraction, message)))
+	try:
+		monthly_var = monthly[make_name(variable, "monthly", reduction)]
+		months = nc_tools.get_timesteps(monthly).times.astype('datetime64[M]')
+		years = months.astype(int)//12+1970
+		calendar_months = months.astype(int)%12
+		in_baseline = (years >= baseline[0]) & (years <= baseline[1])
+		if not np.any(in_baseline):
+			raise Exception(f"AggregationError: No data between {baseline[0]} and {baseline[1]}.")
+		attributes = _attributes(dataset, variable, period, reduction, baseline)
+		source_key = get_source_key(dataset)
+		climatology = []
+		for month in range (12):
+			# Mean of the monthly maps of the baseline years, read one at a time
+			total, count = None, None
+			for index in np.nonzero(in_baseline & (calendar_months == month))[0]:
+				field = np.ma.masked_invalid(np.ma.asarray(nc_tools.read_slice(monthly_var, index), dtype=np.float64))
+				valid = (~np.ma.getmaskarray(field)).astype(np.int32)
+				total = np.ma.filled(field, 0.) if total is None else total+np.ma.filled(field, 0.)
+				count = valid if count is None else count+valid
+			climatology.append(None if total is None else np.where(count > 0, total/np.maximum(count, 1), np.nan).astype(np.float32))
+			progress(0.8+0.1*(month+1)/12, f"Climatology of {variable} ({month+1}/12)")
+		if period == "climatology":
+			times = np.array([f"{baseline[0]}-{month+1:02d}" for month in range (12)], dtype='datetime64[M]').astype('datetime64[s]')
+			result, out = _create_result(path+".tmp", monthly, make_name(variable, "monthly", reduction), name, times, attributes, source_key)
+			try:
+				for month, field in enumerate(climatology):
+					if field is not None:
+						out[month] = np.ma.masked_invalid(field)
+			finally:
+				result.close()
+		else:
+			result, out = _create_result(path+".tmp", monthly, make_name(variable, "monthly", reduction), name, months.astype('datetime64[s]'), attributes, source_key)
+			try:
+				for index, month in enumerate(calendar_months):
+					if climatology[month] is not None:
+						field = np.ma.filled(np.ma.asarray(nc_tools.read_slice(monthly_var, index), dtype=np.float32), np.nan)
+						out[index] = np.ma.masked_invalid(field-climatology[month])
+					progress(0.9+0.1*(index+1)/len(months), f"Anomalies of {variable} ({index+1}/{len(months)})")
+			finally:
+				result.close()
+	finally:
+		monthly.close()
+	os.replace(path+".tmp", path)
+
+def aggregate(dataset, variable : str, period : str, reduction : str = "mean", baseline : tuple = None, processes : int = None, progress = None):
+	"""
+	Compute a temporal reduction of a (time, [level], lat, lon) variable and return the path of the result file.
+	Results are netCDF files cached in AGGREGATION_PATH, tied to the identity of the source files.
+	:baseline: is the (first, last) years of the climatology (default: all years); :processes: is the number of worker
+	processes reducing latitude bands in parallel (default: a single pass in the calling process).
+	:progress: is an optional callable taking a fraction and a message; no result file is written if it raises.
+	"""
+	if period not in PERIODS:
+		raise Exception(f"AggregationError: Unknown period {period}, expected one of {PERIODS}.")
+	if reduction not in REDUCTIONS:
+		raise Exception(f"AggregationError: Unknown reduction {reduction}, expected one of {REDUCTIONS}.")
+	if progress is None:
+		progress = lambda fraction, message: None
+	if period in ["climatology", "anomaly"] and baseline is None:
+		years = nc_tools.get_timesteps(dataset).times.astype('datetime64[Y]').astype(int)+1970
+		baseline = (int(years.min()), int(years.max()))
+	path = get_result_path(dataset, variable, period, reduction, baseline)
+	if os.path.exists(path):
+		return path
+	os.makedirs(AGGREGATION_PATH, exist_ok=True)
+	try:
+		if period in ["daily", "monthly"]:
+			_aggregate_source(dataset, variable, period, reduction, path, processes, progress)
+		else:
+			_aggregate_monthly(dataset, variable, period, reduction, baseline, path, processes, progress)
+	except BaseException:
+		if os.path.exists(path+".tmp"):
+			os.remove(path+".tmp")
+		raise
+	return path
+
+def attach_result(dataset, path : str):
+	"""
+	Expose the reduction stored in :path: as a pseudo-variable of :dataset: (see nc_tools.attach_pseudo_variable).
+	Return the name of the pseudo-variable. A pseudo-variable already attached is kept: it may be displayed.
+	"""
+	result = nc.Dataset(path)
+	name = [name for name in result.variables if parse_name(name) is not None][0]
+	if name in nc_tools.get_pseudo_variables(dataset):
+		result.close()
+	else:
+		nc_tools.attach_pseudo_variable(dataset, name, result)
+	return name
+
+def attach_aggregations(dataset):
+	"""
+	Expose all the cached reductions of :dataset: as pseudo-variables. Pseudo-variables of previously loaded
+	datasets are released. Return their names.
+	"""
+	nc_tools.detach_pseudo_variables()
+	source_key = get_source_key(dataset)
+	if source_key is None:
+		return []
+	names = []
+	for path in sorted(glob.glob(os.path.join(AGGREGATION_PATH, "*.nc"))):
+		try:
+			with nc.Dataset(path) as result:
+				if getattr(result, 'source_key', None) != source_key:
+					continue
+			names.append(attach_result(dataset, path))
+		except (OSError, IndexError) as e:
+			print(f"Cache warning: aggregation {path} could not be read.\n{e}", flush=True)
+	return names
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
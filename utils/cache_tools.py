@@ -0,0 +1,262 @@
+# Cache tools, shared by data readers and figures
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+###############
+## Constants ##
+###############
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache")
+
+#############
+## Classes ##
+#############
+
+class LRUCache():
+	"""
+	Bounded in-memory cache, evicting the least recently used entries first.
+	It is bounded by a number of items and, optionally, by a total size in bytes.
+	"""
+	def __init__(self, max_items : int = 16, max_bytes : int = None):
+		self.max_items = max_items
+		self.max_bytes = max_bytes
+		self.n_bytes = 0
+		self._entries = OrderedDict()
+		self._lock = threading.RLock()
+
+	def __contains__(self, key):
+		with self._lock:
+			return key in self._entries
+
+	def __len__(self):
+		with self._lock:
+			return len(self._entries)
+
+	def get(self, key, default=None):
+		"""
+		Return the value associated with :key: and mark it as recently used.
+		"""
+		with self._lock:
+			if key not in self._entries:
+				return default
+			self._entries.move_to_end(key)
+			return self._entries[key][0]
+
+	def put(self, key, value):
+		"""
+		Store a value, then evict old entries until the cache fits its bounds again.
+		"""
+		size = size_of(value)
+		with self._lock:
+			if key in self._entries:
+				self.n_bytes -= self._entries.pop(key)[1]
+			self._entries[key] = (value, size)
+			self.n_bytes += size
+			self._evict()
+
+	def pop(self, key, default=None):
+		"""
+		Remove an entry and return its value.
+		"""
+		with self._lock:
+			if key not in self._entries:
+				return default
+			value, size = self._entries.pop(key)
+			self.n_bytes -= size
+			return value
+
+	def clear(self):
+		"""
+		Remove all entries.
+		"""
+		with self._lock:
+			self._entries.clear()
+			self.n_bytes = 0
+
+	def _evict(self):
+		"""
+		Drop least recently used entries. The last inserted entry is always kept.
+		"""
+		while len(self._entries) > 1:
+			too_many = self.max_items is not None and len(self._entries) > self.max_items
+			too_big = self.max_bytes is not None and self.n_bytes > self.max_bytes
+			if not (too_many or too_big):
+				break
+			_, (_, size) = self._entries.popitem(last=False)
+			self.n_bytes -= size
+
+class ArrayCache(LRUCache):
+	"""
+	LRU cache of numpy array tuples, with an optional persistence layer made of .npy files.
+	Entries evicted from memory are still found on disk when :cache_dir: is set.
+	With :max_disk_bytes:, the least recently used entries on disk are deleted once the directory exceeds this size.
+	"""
+	def __init__(self, max_items : int = 16, max_bytes : int = None, cache_dir : str = None, mmap_mode : str = None, max_disk_bytes : int = None):
+		super(ArrayCache, self).__init__(max_items=max_items, max_bytes=max_bytes)
+		self.cache_dir = cache_dir
+		self.mmap_mode = mmap_mode
+		self.max_disk_bytes = max_disk_bytes
+
+	def _paths(self, key : str, n_arrays : int):
+		return [os.path.join(self.cache_dir, f"{key}_{i}.npy") for i in range (n_arrays)]
+
+	def get(self, key, default=None):
+		"""
+		Return the array tuple associated with :key:, looking in memory first and on disk then.
+		"""
+		value = super(ArrayCache, self).get(key)
+		if value is not None or not self.cache_dir:
+			return value if value is not None else default
+		value = self._load(key)
+		if value is None:
+			return default
+		super(ArrayCache, self).put(key, value)
+		return value
+
+	def put(self, key, value : tuple):
+		"""
+		Store an array tuple in memory, and on disk if persistence is enabled.
+		"""
+		super(ArrayCache, self).put(key, value)
+		if self.cache_dir:
+			try:
+				self._save(key, value)
+				if self.max_disk_bytes is not None:
+					self._prune(keep=key)
+			except OSError as e:
+				# A read-only or full disk must not prevent plotting
+				print(f"Cache warning: could not persist entry {key}.\n{e}", flush=True)
+
+	def _load(self, key : str):
+		"""
+		Load an entry from disk. Return None if it is missing.
+		"""
+		index_path = os.path.join(self.cache_dir, f"{key}.json")
+		if not os.path.exists(index_path):
+			return None
+		try:
+			with open(index_path, 'r') as foo:
+				n_arrays = json.load(foo)['n_arrays']
+			arrays = tuple(np.load(path, mmap_mode=self.mmap_mode) for path in self._paths(key, n_arrays))
+			if self.max_disk_bytes is not None:
+				# The modification time of the index file is the last use of the entry
+				os.utime(index_path)
+		except (OSError, ValueError, KeyError):
+			return None
+		for arr in arrays:
+			arr.flags.writeable = False
+		return arrays
+
+	def _prune(self, keep : str = None):
+		"""
+		Delete the least recently used entries on disk until the cache directory fits :max_disk_bytes:.
+		The entry :keep: is never deleted.
+		"""
+		sizes, last_uses, n_arrays = {}, {}, {}
+		for entry in os.scandir(self.cache_dir):
+			if entry.name.endswith(".json"):
+				key = entry.name[:-len(".json")]
+				last_uses[key] = entry.stat().st_mtime
+			elif entry.name.endswith(".npy"):
+				key = entry.name.rsplit('_', 1)[0]
+				n_arrays[key] = n_arrays.get(key, 0)+1
+			else:
+				continue
+			sizes[key] = sizes.get(key, 0)+entry.stat().st_size
+		total = sum(sizes.values())
+		for key in sorted(last_uses, key=last_uses.get):
+			if total <= self.max_disk_bytes:
+				break
+			if key == keep:
+				continue
+			index_path = os.path.join(self.cache_dir, f"{key}.json")
+			# The index file goes first: a partially deleted entry is never loaded
+			os.remove(index_path)
+			for path in self._paths(key, n_arrays.get(key, 0)):
+				if os.path.exists(path):
+					os.remove(path)
+			total -= sizes[key]
+
+	def _save(self, key : str, value : tuple):
+		"""
+		Write an entry on disk. The index file is written last so that partial entries are never loaded.
+		"""
+		os.makedirs(self.cache_dir, exist_ok=True)
+		for arr, path in zip(value, self._paths(key, len(value))):
+			# Each writer (process or thread) has its own temporary file: the same key may be saved concurrently
+			tmp_path = get_tmp_path(path)
+			try:
+				with open(tmp_path, 'wb') as foo:
+					np.save(foo, np.asarray(arr))
+				os.replace(tmp_path, path)
+			finally:
+				if os.path.exists(tmp_path):
+					os.remove(tmp_path)
+		index_path = os.path.join(self.cache_dir, f"{key}.json")
+		tmp_path = get_tmp_path(index_path)
+		with open(tmp_path, 'w') as foo:
+			json.dump({'n_arrays': len(value)}, foo)
+		os.replace(tmp_path, index_path)
+
+###############
+## Functions ##
+###############
+
+def get_tmp_path(path : str):
+	"""
+	Return a temporary path next to :path:, unique to the calling process and thread, to be moved onto :path: once written.
+	"""
+	return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def size_of(value):
+	"""
+	Return an estimation of the memory used by a cached value, in bytes.
+	"""
+	if isinstance(value, np.ndarray):
+		return value.nbytes
+	if isinstance(value, (tuple, list)):
+		return sum(size_of(elt) for elt in value)
+	return 0
+
+def array_digest(arr : np.ndarray):
+	"""
+	Return a short hexadecimal digest of an array content, shape and type.
+	"""
+	arr = np.ascontiguousarray(np.ma.getdata(arr))
+	h = hashlib.sha1()
+	h.update(str((arr.shape, arr.dtype.str)).encode())
+	h.update(arr.tobytes())
+	return h.hexdigest()
+
+def file_identity(path : str):
+	"""
+	Return an identity of a file which changes whenever the file is modified: (absolute path, size, modification time).
+	"""
+	stat = os.stat(path)
+	return (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+def make_key(*parts):
+	"""
+	Return a hashable key built from JSON-serializable parts (dictionaries, numbers, strings...).
+	"""
+	raw = json.dumps(parts, sort_keys=True, default=str)
+	return hashlib.sha1(raw.encode()).hexdigest()
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
@@ -0,0 +1,247 @@
+# Catalog of a data directory: find files and slices by variable, date and pressure level
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import multiprocessing
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Custom imports
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+DATA_EXTENSIONS = ('.nc', '.nc4', '.netcdf')
+MIN_POOL_FILES = 4 # Below this number of files to read, starting worker processes costs more than it saves
+MAX_RESULTS = 200
+# Start method of the header extraction pool: forked children could inherit a lock held by a GUI worker thread
+POOL_START_METHOD = "spawn"
+
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+LEVEL_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*hpa\b", re.IGNORECASE)
+ISO_PATTERN = re.compile(r"\b(\d{4})-(\d{1,2})(?:-(\d{1,2})(?:[ T](\d{1,2}):(\d{2}))?)?\b")
+MONTH_PATTERN = re.compile(r"\b("+"|".join(MONTHS)+r")[a-z]*\.?\s+(\d{4})\b", re.IGNORECASE)
+YEAR_PATTERN = re.compile(r"\b(\d{4})\b")
+
+#############
+## Classes ##
+#############
+
+class Catalog():
+	"""
+	Searchable list of the netCDF files of a directory, built from their headers.
+	Each entry holds the path of a file, its variables (long name and units), time span, pressure levels and grid.
+	"""
+	def __init__(self, directory : str, entries : list):
+		self.directory = directory
+		self.entries = entries
+		for entry in self.entries:
+			entry['start'] = np.datetime64(entry['time_start'], 's') if entry['time_start'] else None
+			entry['end'] = np.datetime64(entry['time_end'], 's') if entry['time_end'] else None
+
+	def __len__(self):
+		return len(self.entries)
+
+	def search(self, query : str, max_results : int = MAX_RESULTS):
+		"""
+		Return the slices matching a query such as "t2m, Jan 2019, 850 hPa".
+		A query is made of comma separated terms: variable names (or words of their long name), a date
+		(YYYY, Mon YYYY, YYYY-MM, YYYY-MM-DD, YYYY-MM-DD hh:mm) and a pressure level (850 hPa). All terms are optional.
+		Each match is a dictionary: {'path', 'variable', 'date', 'pl_index', 'label'}, 'date' being the first
+		timestep of the file within the requested period (None without period).
+		"""
+		criteria = parse_query(query)
+		matches = []
+		for entry in self.entries:
+			if criteria['start'] is not None:
+				if entry['start'] is None or entry['start'] >= criteria['end'] or entry['end'] < criteria['start']:
+					continue
+			pl_index = None
+			if criteria['level'] is not None:
+				close = np.nonzero(np.isclose(entry['levels'], criteria['level']))[0] if entry['levels'] else []
+				if len(close) == 0:
+					continue
+				pl_index = int(close[0])
+			elif entry['levels']:
+				pl_index = 0
+			date = None
+			if criteria['start'] is not None:
+				date = str(max(criteria['start'], entry['start'])).replace('T', ' ')
+			for var_name, var_info in entry['variables'].items():
+				if not all(_matches(term, var_name, var_info) for term in criteria['terms']):
+					continue
+				matches.append({
+					'path': entry['path'],
+					'variable': var_name,
+					'date': date,
+					'pl_index': pl_index,
+					'label': _label(entry, var_name, date, pl_index)
+				})
+				if len(matches) >= max_results:
+					return matches
+		return matches
+
+###############
+## Functions ##
+###############
+
+def _matches(term : str, var_name : str, var_info : dict):
+	"""
+	Return True if a search term designates a variable: same name, or part of its long name.
+	"""
+	return term == var_name.lower() or term in var_info['long_name'].lower()
+
+def _label(entry : dict, var_name : str, date : str, pl_index : int):
+	"""
+	Return the label of a search result.
+	"""
+	parts = [var_name, entry['variables'][var_name]['long_name'] or "?"]
+	parts.append(date if date else f"{entry['time_start']} - {entry['time_end']}")
+	if pl_index is not None:
+		parts.append(f"{entry['levels'][pl_index]:g} hPa")
+	parts.append(os.path.basename(entry['path']))
+	return " | ".join(parts)
+
+def parse_query(query : str):
+	"""
+	Parse a search query into criteria: {'terms': [...], 'start': datetime64, 'end': datetime64, 'level': float}.
+	The requested period is [start, end). Unspecified criteria are None. Invalid dates (e.g. 2019-13) raise a ValueError.
+	"""
+	criteria = {'terms': [], 'start': None, 'end': None, 'level': None}
+	text = query
+	match = LEVEL_PATTERN.search(text)
+	if match:
+		criteria['level'] = float(match.group(1))
+		text = text[:match.start()]+text[match.end():]
+	start, end = None, None
+	match = ISO_PATTERN.search(text)
+	if match:
+		year, month, day, hours, minutes = match.groups()
+		if hours is not None:
+			start = np.datetime64(f"{year}-{int(month):02d}-{int(day):02d}T{int(hours):02d}:{minutes}", 's')
+			end = start+np.timedelta64(1, 'm')
+		elif day is not None:
+			start = np.datetime64(f"{year}-{int(month):02d}-{int(day):02d}", 's')
+			end = start+np.timedelta64(1, 'D')
+		else:
+			period = np.datetime64(f"{year}-{int(month):02d}", 'M')
+			start, end = period.astype('datetime64[s]'), (period+1).astype('datetime64[s]')
+	if not match:
+		match = MONTH_PATTERN.search(text)
+		if match:
+			period = np.datetime64(f"{match.group(2)}-{MONTHS.index(match.group(1).lower()[:3])+1:02d}", 'M')
+			start, end = period.astype('datetime64[s]'), (period+1).astype('datetime64[s]')
+	if not match:
+		match = YEAR_PATTERN.search(text)
+		if match:
+			period = np.datetime64(match.group(1), 'Y')
+			start, end = period.astype('datetime64[s]'), (period+1).astype('datetime64[s]')
+	if match:
+		criteria['start'], criteria['end'] = start, end
+		text = text[:match.start()]+text[match.end():]
+	criteria['terms'] = [term.strip().lower() for term in text.split(',') if term.strip()]
+	return criteria
+
+def list_files(directory : str):
+	"""
+	Return the sorted list of netCDF files found in :directory: and its subdirectories.
+	"""
+	paths = []
+	for root, _, files in os.walk(directory):
+		for name in files:
+			if name.lower().endswith(DATA_EXTENSIONS):
+				paths.append(os.path.abspath(os.path.join(root, name)))
+	return sorted(paths)
+
+def read_entry(path : str):
+	"""
+	Return the catalog entry of a file. Headers are read once, then served by the metadata index.
+	This function runs in worker processes, or on the calling thread for a few files: the read lock is then held
+	while the file is opened and its headers read, as render and statistics threads may be reading other files.
+	"""
+	with nc_tools.READ_LOCK:
+		meta = nc_tools.retrieve_meta(path)
+		info = nc_tools.retrieve_info(path)
+	variables = {}
+	for var_name in nc_tools.get_variables(meta=meta):
+		attributes = meta[var_name]['attributes']
+		variables[var_name] = {
+			'long_name': str(attributes.get('long_name', '')),
+			'units': str(attributes.get('units', ''))
+		}
+	return {
+		'path': path,
+		'variables': variables,
+		'n_steps': info['n_steps'],
+		'time_start': info['time_start'],
+		'time_end': info['time_end'],
+		'levels': info['levels'],
+		'grid': info['grid']
+	}
+
+def build_catalog(directory : str, processes : int = None, progress = None):
+	"""
+	Build the catalog of :directory:.
+	Files already in the metadata index are read from it; headers of new or modified files are extracted
+	by a pool of :processes: worker processes (default: number of CPUs), and indexed for the next scans.
+	:progress: is an optional callable taking a fraction and a message.
+	"""
+	paths = list_files(directory)
+	entries = []
+	to_read = []
+	for path in paths:
+		if nc_tools.is_indexed(path):
+			entries.append(read_entry(path))
+		else:
+			to_read.append(path)
+	n_done = len(entries)
+	if progress is not None:
+		progress(n_done/max(len(paths), 1), f"{n_done}/{len(paths)} files")
+	if len(to_read) < MIN_POOL_FILES:
+		results = ((path, _try_read_entry(path)) for path in to_read)
+	else:
+		executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+		futures = {executor.submit(_try_read_entry, path): path for path in to_read}
+		results = ((futures[future], future.result()) for future in as_completed(futures))
+	try:
+		for path, entry in results:
+			n_done += 1
+			if entry is not None:
+				entries.append(entry)
+			if progress is not None:
+				progress(n_done/len(paths), f"{n_done}/{len(paths)} files")
+	finally:
+		if len(to_read) >= MIN_POOL_FILES:
+			# Drop the pending files if the scan is interrupted
+			for future in futures:
+				future.cancel()
+			executor.shutdown(wait=False)
+	entries.sort(key=lambda entry: entry['path'])
+	return Catalog(directory, entries)
+
+def _try_read_entry(path : str):
+	"""
+	Return the catalog entry of a file, or None if it can not be read: a broken download must not stop the scan.
+	"""
+	try:
+		return read_entry(path)
+	except (OSError, sqlite3.Error, KeyError, ValueError) as e:
+		print(f"Catalog warning: {path} could not be read.\n{e}", flush=True)
+		return None
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
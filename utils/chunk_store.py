@@ -0,0 +1,192 @@
+# Chunk store: local, analysis-ready copies of variables, laid out for map reads and for time series reads
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import json
+import shutil
+
+import numpy as np
+
+# Custom imports
+import cache_tools
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+STORE_PATH = os.path.join(cache_tools.CACHE_PATH, "stores")
+STORE_VERSION = 1 # Version of the store format, stores of other versions are ignored
+CHUNK_BUDGET = 256*1024**2 # Memory used by the timesteps read at once while converting, in bytes
+
+# Layouts of a store, as the order of the source dimensions in the file:
+# - map: (time, [level], lat, lon), a whole map is one contiguous block;
+# - series: ([level], lat, lon, time), the time series of a grid point is one contiguous block.
+LAYOUTS = ["map", "series"]
+
+#############
+## Classes ##
+#############
+
+class ChunkStore():
+	"""
+	Local copy of a (time, [level], lat, lon) variable, as float32 values (NaN for missing values) in memory-mapped
+	.npy files, one per layout. The index file (index.json) describes the variable and its layouts, and is written last.
+	"""
+	def __init__(self, path : str):
+		self.path = path
+		with open(os.path.join(path, "index.json"), 'r') as foo:
+			self.index = json.load(foo)
+		self.shape = tuple(self.index['shape'])
+		self.layouts = {name: np.load(os.path.join(path, layout['file']), mmap_mode='r') for name, layout in self.index['layouts'].items()}
+
+	def read(self, key : tuple):
+		"""
+		Read variable[key] (indices and slices over the source dimensions) from the layout which fits the access:
+		the series layout for the time series of single grid points, the map layout otherwise.
+		"""
+		if not isinstance(key, tuple):
+			key = (key,)
+		key = key+(slice(None),)*(len(self.shape)-len(key))
+		point = all(isinstance(index, (int, np.integer)) for index in key[-2:])
+		if point and not isinstance(key[0], (int, np.integer)):
+			# Time moves back to the first axis, as read from the source variable
+			data = np.moveaxis(self.layouts['series'][key[1:]+key[:1]], -1, 0)
+		else:
+			data = self.layouts['map'][key]
+		return np.ma.masked_invalid(np.array(data))
+
+###############
+## Functions ##
+###############
+
+def get_store_path(dataset, variable : str):
+	"""
+	Return the directory of the store of a variable, or None if the dataset is not read from files.
+	Stores are tied to the identity of the source files: a modified file gets a new store.
+	"""
+	identities = nc_tools.get_file_identities(dataset)
+	if identities is None:
+		return None
+	return os.path.join(STORE_PATH, f"{variable}_{cache_tools.make_key(identities, STORE_VERSION)}")
+
+def find_store(dataset, variable : str):
+	"""
+	Return the store of a variable, or None if it has not been converted.
+	"""
+	path = get_store_path(dataset, variable)
+	if path is None or not os.path.exists(os.path.join(path, "index.json")):
+		return None
+	try:
+		return ChunkStore(path)
+	except (OSError, ValueError, KeyError) as e:
+		print(f"Cache warning: chunk store {path} could not be opened.\n{e}", flush=True)
+		return None
+
+def convert(dataset, variable : str, progress = None):
+	"""
+	Copy a variable into its chunk store, with both layouts. The conversion runs out-of-core, in two passes of
+	CHUNK_BUDGET bytes: timesteps are copied to the map layout, then spatial tiles of the map layout are transposed
+	over the whole time axis into the series layout. Both layouts are thus written as contiguous blocks. Return the store.
+	:progress: is an optional callable taking a fraction and a message; the store is not created if it raises.
+	"""
+	path = get_store_path(dataset, variable)
+	if path is None:
+		raise Exception("StoreError: Chunk stores are only available for datasets read from files.")
+	source = dataset[variable]
+	dims = tuple(source.dimensions)
+	if len(dims) not in (3, 4) or dims[0] != 'time':
+		raise Exception(f"StoreError: {variable} is not a (time, [level], lat, lon) variable.")
+	shape = tuple(source.shape)
+	n_steps = shape[0]
+	step_bytes = int(np.prod(shape[1:]))*8
+	n_chunk = max(1, CHUNK_BUDGET//step_bytes)
+
+	tmp_path = f"{path}.{os.getpid()}.tmp"
+	os.makedirs(tmp_path, exist_ok=True)
+	try:
+		layouts = {
+			"map": np.lib.format.open_memmap(os.path.join(tmp_path, "map.npy"), mode='w+', dtype=np.float32, shape=shape),
+			"series": np.lib.format.open_memmap(os.path.join(tmp_path, "series.npy"), mode='w+', dtype=np.float32, shape=shape[1:]+shape[:1])
+		}
+		for start in range (0, n_steps, n_chunk):
+			stop = min(start+n_chunk, n_steps)
+			data = np.ma.filled(np.ma.asarray(nc_tools.read_slice(source, (slice(start, stop),)), dtype=np.float32), np.nan)
+			layouts["map"][start:stop] = data
+			if progress is not None:
+				progress(0.5*stop/n_steps, f"Converting {variable}: maps ({stop}/{n_steps})")
+		layouts["map"].flush()
+		_transpose_tiles(layouts["map"], layouts["series"], variable, progress)
+		for layout in layouts.values():
+			layout.flush()
+		del layouts
+		index = {
+			'version': STORE_VERSION,
+			'variable': variable,
+			'dimensions': list(dims),
+			'shape': list(shape),
+			'dtype': 'float32',
+			'layouts': {
+				"map": {'file': "map.npy", 'order': list(dims)},
+				"series": {'file': "series.npy", 'order': list(dims[1:]+dims[:1])}
+			}
+		}
+		with open(os.path.join(tmp_path, "index.json"), 'w') as foo:
+			json.dump(index, foo, indent=4)
+	except BaseException:
+		shutil.rmtree(tmp_path, ignore_errors=True)
+		raise
+	if os.path.exists(path):
+		shutil.rmtree(path)
+	os.replace(tmp_path, path)
+	return ChunkStore(path)
+
+def _transpose_tiles(map_layout : np.ndarray, series_layout : np.ndarray, variable : str, progress = None):
+	"""
+	Fill the series layout from the map layout, one spatial tile at a time: each tile is read over the whole time axis
+	and written as contiguous rows of the series layout. Tiles are runs of whole rows when they fit in CHUNK_BUDGET,
+	runs of grid points of a single row otherwise.
+	"""
+	shape = map_layout.shape
+	n_lats, n_lons = shape[-2], shape[-1]
+	n_points = max(1, CHUNK_BUDGET//(shape[0]*4))
+	n_rows, n_cols = (n_points//n_lons, n_lons) if n_points >= n_lons else (1, n_points)
+	leadings = list(np.ndindex(*shape[1:-2]))
+	n_tiles = len(leadings)*-(-n_lats//n_rows)*-(-n_lons//n_cols)
+	n_done = 0
+	for leading in leadings:
+		for j in range (0, n_lats, n_rows):
+			for i in range (0, n_lons, n_cols):
+				tile = leading+(slice(j, j+n_rows), slice(i, i+n_cols))
+				series_layout[tile] = np.moveaxis(np.asarray(map_layout[(slice(None),)+tile]), 0, -1)
+				n_done += 1
+				if progress is not None:
+					progress(0.5+0.5*n_done/n_tiles, f"Converting {variable}: time series ({n_done}/{n_tiles})")
+
+def attach_stores(dataset):
+	"""
+	Serve the reads of the variables of :dataset: from their chunk stores, when they have been converted
+	(see nc_tools.attach_store). Stores attached to previously loaded datasets are released. Return the served variables.
+	"""
+	nc_tools.detach_stores()
+	if nc_tools.get_file_identities(dataset) is None:
+		return []
+	attached = []
+	for variable in nc_tools.get_variables(ds=dataset):
+		store = find_store(dataset, variable)
+		if store is not None:
+			nc_tools.attach_store(dataset[variable], store)
+			attached.append(variable)
+	return attached
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
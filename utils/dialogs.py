@@ -7,6 +7,10 @@
 # wxPython import
 import wx
 
+# matplotlib import
+from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
+from matplotlib.figure import Figure as MplFig
+
 # Custom import
 from features.subpanels import PresetPanel
 
@@ -39,6 +43,191 @@ class PresetDialog(wx.Dialog):
 
 		self.Show()
 
+class CatalogDialog(wx.Dialog):
+	"""
+	Catalog search dialog: type a query, then open one of the matching files and slices.
+
+	This is a modeless dialog: :on_open: is called with the chosen match (see catalog.Catalog.search).
+	"""
+	def __init__(self, parent, title : str, catalog, on_open, size : tuple = (700, 450)):
+		super(CatalogDialog, self).__init__(parent=parent, id=wx.ID_ANY, title=title, size=size, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+		self.parent = parent
+		self.catalog = catalog
+		self.on_open = on_open
+		self.matches = []
+		# Create sizer
+		self.sizer = wx.BoxSizer(wx.VERTICAL)
+
+		# Search entry and results
+		text_info = wx.StaticText(self, label=f"{len(catalog)} files in {catalog.directory}")
+		self.te_query = wx.TextCtrl(self, id=wx.ID_ANY, style=wx.TE_PROCESS_ENTER)
+		self.te_query.SetHint("Example: t2m, Jan 2019, 850 hPa")
+		self.list_results = wx.ListBox(self, id=wx.ID_ANY, style=wx.LB_SINGLE)
+		self.button_open = wx.Button(self, label="Open", size=(200, 30))
+		self.button_open.Enable(False)
+
+		# Bindings
+		self.te_query.Bind(wx.EVT_TEXT_ENTER, handler=self.on_search)
+		self.list_results.Bind(wx.EVT_LISTBOX, handler=self.on_result_selected)
+		self.list_results.Bind(wx.EVT_LISTBOX_DCLICK, handler=self.on_open_selected)
+		self.button_open.Bind(wx.EVT_BUTTON, handler=self.on_open_selected)
+
+		# Sizer setup
+		self.sizer.Add(text_info, 0, wx.ALL, 10)
+		self.sizer.Add(self.te_query, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 10)
+		self.sizer.Add(self.list_results, 1, wx.EXPAND | wx.ALL, 10)
+		self.sizer.Add(self.button_open, 0, wx.ALIGN_CENTER | wx.BOTTOM, 10)
+		self.SetSizer(self.sizer)
+
+		self.Show()
+
+	def on_search(self, event):
+		"""
+		Search the catalog and list the matches.
+		"""
+		try:
+			self.matches = self.catalog.search(self.te_query.GetValue())
+		except ValueError as e:
+			# Dates such as 2019-13 or 2019-02-30
+			wx.MessageBox(message=f"Invalid query: {e}\nExample: t2m, Jan 2019, 850 hPa", caption="Error", style=wx.OK | wx.ICON_ERROR)
+			return
+		self.list_results.Set([match['label'] for match in self.matches])
+		self.button_open.Enable(False)
+
+	def on_result_selected(self, event):
+		self.button_open.Enable(self.list_results.GetSelection() != wx.NOT_FOUND)
+
+	def on_open_selected(self, event):
+		"""
+		Open the selected match.
+		"""
+		index = self.list_results.GetSelection()
+		if index != wx.NOT_FOUND:
+			self.on_open(self.matches[index])
+
+class SeriesDialog(wx.Dialog):
+	"""
+	Time series at a grid point, and vertical profile at the displayed timestep for pressure level datasets.
+
+	This is a modeless dialog. :series: is a dictionary: {'title', 'label', 'times', 'values', 'date',
+	'levels', 'profile'}, the last two being None without pressure levels.
+	"""
+	def __init__(self, parent, title : str, series : dict, size : tuple = (900, 450)):
+		super(SeriesDialog, self).__init__(parent=parent, id=wx.ID_ANY, title=title, size=size, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+		self.parent = parent
+		self.series = series
+		# Create sizer
+		self.sizer = wx.BoxSizer(wx.VERTICAL)
+
+		# Plots
+		with_profile = series['profile'] is not None
+		self.figure = MplFig(figsize=(9, 4))
+		self.canvas = FigureCanvas(self, -1, self.figure)
+		if with_profile:
+			grid = self.figure.add_gridspec(1, 4)
+			ax_series = self.figure.add_subplot(grid[0, :3])
+			ax_profile = self.figure.add_subplot(grid[0, 3])
+		else:
+			ax_series = self.figure.add_subplot(111)
+		ax_series.plot(series['times'], series['values'], linewidth=0.8)
+		ax_series.set_title(series['title'])
+		ax_series.set_ylabel(series['label'])
+		ax_series.grid(True, alpha=0.3)
+		if with_profile:
+			ax_profile.plot(series['profile'], series['levels'], marker='.')
+			ax_profile.set_title(series['date'])
+			ax_profile.set_ylabel("Pressure (hPa)")
+			ax_profile.invert_yaxis()
+			ax_profile.grid(True, alpha=0.3)
+		self.figure.autofmt_xdate()
+		self.figure.tight_layout()
+
+		# Sizer setup
+		self.sizer.Add(self.canvas, 1, wx.EXPAND | wx.ALL, 10)
+		self.SetSizer(self.sizer)
+
+		self.Show()
+
+class AggregationDialog(wx.Dialog):
+	"""
+	Temporal aggregation dialog: choose a variable, a period and a reduction, then compute it in the background.
+
+	This is a modeless dialog: :on_compute: is called with a request {'variable', 'period', 'reduction',
+	'baseline', 'processes'}, 'baseline' being None or (first year, last year). Progress is shown through set_progress.
+	"""
+	def __init__(self, parent, title : str, variables : list, periods : list, reductions : list, on_compute, size : tuple = (450, 330)):
+		super(AggregationDialog, self).__init__(parent=parent, id=wx.ID_ANY, title=title, size=size, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+		self.parent = parent
+		self.on_compute = on_compute
+		# Create sizer
+		self.sizer = wx.BoxSizer(wx.VERTICAL)
+
+		# Choices
+		grid_sizer = wx.FlexGridSizer(cols=2, gap=(10, 10))
+		self.c_box_variables = wx.ComboBox(self, id=wx.ID_ANY, choices=variables, style=wx.CB_DROPDOWN | wx.CB_READONLY)
+		self.c_box_periods = wx.ComboBox(self, id=wx.ID_ANY, choices=periods, style=wx.CB_DROPDOWN | wx.CB_READONLY)
+		self.c_box_reductions = wx.ComboBox(self, id=wx.ID_ANY, choices=reductions, style=wx.CB_DROPDOWN | wx.CB_READONLY)
+		for c_box in [self.c_box_variables, self.c_box_periods, self.c_box_reductions]:
+			c_box.SetSelection(0)
+		self.te_baseline = wx.TextCtrl(self, id=wx.ID_ANY)
+		self.te_baseline.SetHint("Example: 1991-2020 (default: all years)")
+		self.te_baseline.SetToolTip(wx.ToolTip("Years averaged by the climatology, also used by the anomalies."))
+		self.spin_processes = wx.SpinCtrl(self, id=wx.ID_ANY, min=1, max=64, initial=1)
+		self.spin_processes.SetToolTip(wx.ToolTip("Worker processes, each reducing a band of latitudes."))
+		for label, control in [("Variable : ", self.c_box_variables), ("Period : ", self.c_box_periods),
+							   ("Reduction : ", self.c_box_reductions), ("Baseline years : ", self.te_baseline),
+							   ("Processes : ", self.spin_processes)]:
+			grid_sizer.Add(wx.StaticText(self, label=label), 0, wx.ALIGN_CENTER_VERTICAL)
+			grid_sizer.Add(control, 1, wx.EXPAND)
+		grid_sizer.AddGrowableCol(1)
+
+		# Progress
+		self.gauge = wx.Gauge(self, id=wx.ID_ANY, range=100)
+		self.text_progress = wx.StaticText(self, label="")
+		self.button_compute = wx.Button(self, label="Compute", size=(200, 30))
+
+		# Bindings
+		self.button_compute.Bind(wx.EVT_BUTTON, handler=self.on_compute_selected)
+
+		# Sizer setup
+		self.sizer.Add(grid_sizer, 0, wx.EXPAND | wx.ALL, 10)
+		self.sizer.Add(self.gauge, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 10)
+		self.sizer.Add(self.text_progress, 0, wx.ALL, 10)
+		self.sizer.Add(self.button_compute, 0, wx.ALIGN_CENTER | wx.BOTTOM, 10)
+		self.SetSizer(self.sizer)
+
+		self.Show()
+
+	def on_compute_selected(self, event):
+		"""
+		Check the baseline years and request the aggregation.
+		"""
+		text = self.te_baseline.GetValue().strip()
+		baseline = None
+		if text:
+			try:
+				first, last = (int(year) for year in text.split("-"))
+			except ValueError:
+				wx.MessageBox(message=f"Invalid baseline: {text}\nExpected format: YYYY-YYYY", caption="Error", style=wx.OK | wx.ICON_ERROR)
+				return
+			baseline = (min(first, last), max(first, last))
+		self.on_compute({
+						 'variable': self.c_box_variables.GetValue(),
+						 'period': self.c_box_periods.GetValue(),
+						 'reduction': self.c_box_reductions.GetValue(),
+						 'baseline': baseline,
+						 'processes': self.spin_processes.GetValue()
+						 })
+
+	def set_progress(self, fraction : float, message : str):
+		"""
+		Display the progress of the aggregation.
+		"""
+		if not self:
+			return
+		self.gauge.SetValue(int(100*fraction))
+		self.text_progress.SetLabel(message)
+
 ###############
 ## Functions ##
 ###############
@@ -44,15 +44,21 @@ class VariablePanel(wx.Panel):
 		
 		dimensions = wx.StaticText(stbox_gen, label=f"Dimensions : {var_meta['dimensions']}")
 		shape = wx.StaticText(stbox_gen, label=f"Shape : {var_meta['shape']}")
+		chunking = wx.StaticText(stbox_gen, label=f"Chunking : {var_meta.get('chunking')}")
+		compression = wx.StaticText(stbox_gen, label=f"Compression : {var_meta.get('compression')}")
 		
 		font = font.GetBaseFont()
 		font.PointSize -= 5
 		font.MakeItalic()
 		dimensions.SetFont(font)
 		shape.SetFont(font)
+		chunking.SetFont(font)
+		compression.SetFont(font)
 
 		stbox_gen_sizer.Add(dimensions, 0, wx.LEFT, 20)
 		stbox_gen_sizer.Add(shape, 0, wx.LEFT, 20)
+		stbox_gen_sizer.Add(chunking, 0, wx.LEFT, 20)
+		stbox_gen_sizer.Add(compression, 0, wx.LEFT, 20)
 
 		# Second StaticBox with attributes information
 		stbox_attr = wx.StaticBox(parent=self, label="Attributes", size=(600, 350))
@@ -71,11 +77,34 @@ class VariablePanel(wx.Panel):
 			attr_text.SetFont(font)
 			stbox_attr_sizer.Add(attr_text, 0, wx.LEFT, 20)
 
+		# Third StaticBox with statistics over the whole time axis, computed in the background
+		stbox_stats = wx.StaticBox(parent=self, label="Statistics", size=(600, 100))
+		font = stbox_stats.GetFont()
+		font.PointSize += 5
+		stbox_stats.SetFont(font.Bold())
+		stbox_stats_sizer = wx.StaticBoxSizer(stbox_stats, wx.VERTICAL)
+
+		font = font.GetBaseFont()
+		font.PointSize -= 5
+		font.MakeItalic()
+
+		self.text_stats = wx.StaticText(stbox_stats, label="Computing...")
+		self.text_stats.SetFont(font)
+		stbox_stats_sizer.Add(self.text_stats, 0, wx.LEFT, 20)
+
 		self.main_sizer.Add(stbox_gen_sizer, 0, wx.LEFT, 20)
 		self.main_sizer.Add(stbox_attr_sizer, 0, wx.LEFT, 20)
+		self.main_sizer.Add(stbox_stats_sizer, 0, wx.LEFT, 20)
 
 		self.SetSizer(self.main_sizer)
 
+	def set_stats(self, lines : list):
+		"""
+		Display statistics, given as lines of text (one per pressure level).
+		"""
+		self.text_stats.SetLabel("\n".join(lines))
+		self.Layout()
+
 class PresetPanel(wx.Panel):
 	"""
 	A panel for preset generator dialog.
@@ -5,21 +5,80 @@
 #############
 
 # Matplotlib imports
-from mpl_toolkits.basemap import Basemap
 from matplotlib import pyplot as plt
+from matplotlib import colors
+from matplotlib import ticker
+from matplotlib.contour import ContourSet
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+from mpl_toolkits.basemap import interp
 
 # Other imports
+import os
 import netCDF4 as nc
 import numpy as np
 
 # Custom imports
 import display_tools
+import cache_tools
+import map_tools
+import grid_tools
+import pyramid_tools
+import lookup_tools
+import packed_tools
+import nc_tools
 
 ###############
 ## Constants ##
 ###############
 
+# Default map options, as set by the option panel before any user choice
+DEFAULT_MAP_OPTIONS = {
+	"variable": None,
+	"time_index": None,
+	"pl_index": None,
+	"lon_offset": 0,
+	"coef": 1,
+	"offset": 0,
+	"preset": "default",
+	"resolution": 'i',
+	"countries": False,
+	"rivers": False,
+	"cmap": "seismic",
+	"colorbar": False,
+	"norm": False,
+	"c_min": 0,
+	"c_max": 50,
+	"midpoint": 25,
+	"plot_type": "pcolormesh",
+	"pyramid": "off",
+	"packed": False
+}
+
+# Plot types available in the option panel
+PLOT_TYPES = ["pcolormesh", "imshow", "transform", "lookup", "lookup_bilinear", "contour", "contourf", "quiver", "barbs", "streamplot"]
+CONTOUR_PLOT_TYPES = ["contour", "contourf"]
+# Plot types drawing wind vectors from a pair of u/v components
+VECTOR_PLOT_TYPES = ["quiver", "barbs", "streamplot"]
+# Plot types whose artists can not be updated in place: they are drawn again for each frame
+REDRAWN_PLOT_TYPES = ["contour", "contourf", "streamplot"]
+N_CONTOUR_LEVELS = 15
+# Distance between arrows (quiver, barbs) or streamplot grid points, in pixels
+VECTOR_SPACING = {"quiver": 25, "barbs": 35, "streamplot": 8}
+# Interpolation method of the lookup engine, for each of its plot types
+LOOKUP_METHODS = {"lookup": "nearest", "lookup_bilinear": "bilinear"}
+
+# Projected meshes are shared between figures: redrawing the same map only changes data, not coordinates.
+# Zoomed and panned views add entries: the least recently used ones are deleted beyond 512 MB on disk.
+PROJECTION_CACHE = cache_tools.ArrayCache(max_items=8, cache_dir=os.path.join(cache_tools.CACHE_PATH, "projections"), max_disk_bytes=512*1024**2)
+# Geographic coordinates of the pixels of a view, for the transform engine
+PIXEL_COORDINATES_CACHE = cache_tools.ArrayCache(max_items=8, max_bytes=128*1024**2)
+# Projected positions of subsampled vectors and rotations of their components into map coordinates
+ROTATION_CACHE = cache_tools.ArrayCache(max_items=8)
+_CONTOUR_LEVELS = cache_tools.LRUCache(max_items=32)
+# Rendered images (RGBA canvas buffers) of whole maps, kept on disk between sessions
+RENDER_CACHE_PATH = os.path.join(cache_tools.CACHE_PATH, "renders")
+RENDER_CACHE = cache_tools.ArrayCache(max_items=16, max_bytes=256*1024**2, cache_dir=RENDER_CACHE_PATH, max_disk_bytes=1024**3)
+
 #############
 ## Classes ##
 #############
@@ -29,32 +88,91 @@ class Figure():
 	Figure is an object containing data to plot and map options.
 	It enables to easily draw a map with data on it.
 	"""
-	def __init__(self, figure : plt.Figure, ax : plt.Axes, dataset : nc.Dataset, map_options : dict, presets : dict):
+	def __init__(self, figure : plt.Figure, ax : plt.Axes, dataset : nc.Dataset, map_options : dict, presets : dict, lazy : bool = False, viewport : tuple = None):
 		self.figure = figure
 		self.ax = ax
+		# Pseudo-variables (temporal aggregations) are read from their own dataset
+		self.dataset = nc_tools.resolve_dataset(dataset, map_options['variable'])
 		self.presets = presets
 		self.map_options = map_options
 		self.map_settings = self._get_map_settings()
-		
-		self.map = Basemap(ax=self.ax, **self.map_settings)
+		# (lon_min, lon_max, lat_min, lat_max) box of a zoomed view: only this window is read. None for the whole map.
+		self.viewport = viewport
+
+		self.map = None
+		self.plan = None
+		self.pyramid = None
+		self.pyramid_factor = 1 # Overview level read, 1 being the full resolution
+		self.lons = None
+		self.lats = None
+		self.data = None
+		self.vector_pair = None # (u, v) variables of vector plot types: data is then a (2, lat, lon) stack
+		self.vector_strides = None
+		self.mesh = None # Data artist (QuadMesh, AxesImage, ContourSet, Quiver...), used as colorbar mappable
+		self.extra_artists = [] # Other artists drawing data (streamplot arrow heads)
+		self.colorbar = None
+		self.units = "" # Units of the variable, shown by the hover readout
+		self.readout = None # (view, lookup table, pixel longitudes, pixel latitudes) of get_readout, see build_readout
+		self.engine = self._get_engine()
+
+		# A lazy figure is loaded and drawn later on, e.g. loaded by a worker thread and drawn by the GUI thread.
+		if not lazy:
+			self.load()
+			self.draw_map()
+
+	def load(self, progress = None):
+		"""
+		Build the map projection, then read, transform and project data. Nothing is drawn at this stage.
+		:progress: is an optional callable taking a fraction and a message.
+		"""
+		if progress is None:
+			progress = lambda fraction, message: None
+
+		progress(0., "Building map")
+		self.map = map_tools.get_basemap(self.map_settings)
+
+		progress(0.2, "Reading coordinates")
+		lons, lats = nc_tools.get_coordinates(self.dataset)
+		lons = lons+self.map_options['lon_offset']
+		with nc_tools.READ_LOCK:
+			self.units = getattr(self.dataset[self.map_options['variable']], 'units', "")
+		if self.engine in VECTOR_PLOT_TYPES:
+			self.vector_pair = nc_tools.get_vector_pair(self.map_options['variable'], ds=self.dataset)
+			if self.vector_pair is None:
+				raise Exception(f"DatasetError: {self.map_options['variable']} is not a wind component with a u/v pair in this dataset.")
+
+		# Only the part of the grid covered by the map (or by the zoomed view) is read
+		self.plan = self._plan(lons, lats)
+		if self.map_options['pyramid'] in pyramid_tools.METHODS and self.vector_pair is None:
+			self._select_pyramid_level(lambda fraction, message: progress(0.2+0.1*fraction, message))
+		self.lons = self.plan.lons
+		self.lats = self.plan.lats
+
+		progress(0.3, "Reading data")
+		self.data = self._retrieve_data_from_dataset(self.dataset)
+
+		progress(0.6, "Transforming data")
+		self.transform_data()
+
+		if self.engine in ["pcolormesh"]+CONTOUR_PLOT_TYPES:
+			progress(0.7, "Projecting coordinates")
+			self.adapt_coordinates()
+
+		progress(1., "Data ready")
+		return self
+
+	def draw_map(self):
+		"""
+		Draw the map background and boundaries on the axes.
+		"""
+		self.map.ax = self.ax
 		self.map.drawmapboundary(fill_color='aqua')
 		self.map.drawcoastlines()
 		if self.map_options['countries']:
 			self.map.drawcountries()
 		if self.map_options['rivers']:
 			self.map.drawrivers()
-		
-		# Extract longitude and latitude arrays (try 2 different name formats)
-		try:
-			self.lons = np.ma.getdata(dataset['lon'][:])
-			self.lats = np.ma.getdata(dataset['lat'][:])
-		except:
-			self.lons = np.ma.getdata(dataset['longitude'][:])
-			self.lats = np.ma.getdata(dataset['latitude'][:])
-
-		self.data = self._retrieve_data_from_dataset(dataset)
-		
-		self.transform_data()
+		map_tools.update_basemap(self.map_settings, self.map)
 
 	def _get_map_settings(self):
 		"""
@@ -64,71 +182,544 @@ class Figure():
 		settings['resolution'] = self.map_options['resolution']
 		return settings
 
-	def _retrieve_data_from_dataset(self, dataset : nc.Dataset):
+	def _get_engine(self):
 		"""
-		Extract data from the dataset and process it.
+		Return the drawing engine of the chosen plot type.
+		imshow needs a map whose coordinates are longitudes and latitudes: other projections go through the transform engine.
 		"""
-		if self.map_options['pl_index'] is not None:
-			data = dataset[self.map_options['variable']][self.map_options['time_index'], self.map_options['pl_index'], :, :]
+		plot_type = self.map_options['plot_type']
+		if plot_type == "imshow" and self.map_settings.get('projection', 'cyl') != "cyl":
+			return "transform"
+		if plot_type in LOOKUP_METHODS:
+			return "lookup"
+		if plot_type in PLOT_TYPES:
+			return plot_type
+		return "pcolormesh"
+
+	def _plan(self, lons : np.ndarray, lats : np.ndarray):
+		"""
+		Return the read plan of the map, or of the viewport if any.
+		"""
+		if self.viewport is None:
+			return grid_tools.plan_read(lons, lats, self.map_settings)
+		return grid_tools.plan_window(lons, lats, *self.viewport)
+
+	def _select_pyramid_level(self, progress):
+		"""
+		Switch the read plan to the coarsest overview level still meeting the pixel density of the axes.
+		Overviews are built on first use.
+		"""
+		width, height = self.ax.get_window_extent().size
+		factor = pyramid_tools.choose_factor(self.plan.shape, (height, width))
+		if factor == 1:
+			return
+		pyramid = pyramid_tools.get_pyramid(self.dataset, self.map_options['variable'], self.map_options['pyramid'])
+		if pyramid is None:
+			return
+		if not pyramid.is_built():
+			pyramid.build(progress=progress)
+		lons, lats = pyramid.coordinates(factor)
+		self.plan = self._plan(lons+self.map_options['lon_offset'], lats)
+		self.pyramid = pyramid
+		self.pyramid_factor = factor
+
+	def _retrieve_data_from_dataset(self, dataset : nc.Dataset, map_options : dict = None):
+		"""
+		Extract data from the dataset (or from the selected overview level) and process it.
+		"""
+		if map_options is None:
+			map_options = self.map_options
+		leading = (map_options['time_index'],)
+		if map_options['pl_index'] is not None:
+			leading += (map_options['pl_index'],)
+		if self.vector_pair is not None:
+			data = np.ma.stack([self.plan.read(dataset[name], *leading) for name in self.vector_pair])
+		elif self.pyramid is not None:
+			data = self.plan.read(self.pyramid.get_variable(self.pyramid_factor), *leading)
 		else:
-			data = dataset[self.map_options['variable']][self.map_options['time_index'], :, :]
-		data = data*self.map_options['coef']+self.map_options['offset']
+			variable = dataset[map_options['variable']]
+			if map_options['packed'] and nc_tools.is_packed(variable):
+				# Raw 16-bit codes: unpacking and corrections are a single lookup into a float32 table, NaN for fill values
+				raw, packing = self.plan.read_packed(variable, *leading)
+				return packed_tools.unpack(raw, packing, map_options['coef'], map_options['offset'])
+			data = self.plan.read(variable, *leading)
+		data = data*map_options['coef']+map_options['offset']
 		return data
 
 	def transform_data(self):
 		"""
-		Transform the data.
+		Transform the data: order it by increasing longitude around the central meridian of the map.
+		"""
+		self.lons, self.data = grid_tools.normalize_longitudes(self.lons, self.data, center=self.map_settings.get('lon_0', 0.))
+
+	def read_frame(self, time_index : int, **changes):
+		"""
+		Read and transform the data of another timestep on the same grid, without modifying the figure.
+		Other data options (pl_index, coef, offset) may be changed with keyword arguments.
 		"""
-		lon_offset = self.map_options['lon_offset']
-		self.lons = self.lons+lon_offset
-		temp = self.data[:, 0:720].copy()
-		self.data[:, 0:720] = self.data[:, 720:1440].copy()
-		self.data[:, 720:1440] = temp
+		map_options = dict(self.map_options, time_index=time_index, **changes)
+		data = self._retrieve_data_from_dataset(self.dataset, map_options)
+		_, data = grid_tools.normalize_longitudes(self.plan.lons, data, center=self.map_settings.get('lon_0', 0.))
+		return data
 
 	def adapt_coordinates(self):
 		"""
 		Adapt coordinates to the chosen projection.
+		Projected meshes are cached: returned arrays are shared and read-only.
 		"""
+		key = cache_tools.make_key(
+								   self.map_settings,
+								   self.map_options['lon_offset'],
+								   cache_tools.array_digest(self.lons),
+								   cache_tools.array_digest(self.lats)
+								   )
+		cached = PROJECTION_CACHE.get(key)
+		if cached is not None:
+			return cached
 		x, y = np.meshgrid(self.lons, self.lats)
 		xx, yy = self.map(x, y)
 		xx[~np.isfinite(xx)] =-180
 		yy[~np.isfinite(yy)] = 0
+		xx.flags.writeable = False
+		yy.flags.writeable = False
+		PROJECTION_CACHE.put(key, (xx, yy))
 		return xx, yy
 
-	def plot_data(self):
+	def _mask_outside(self, data : np.ndarray, lon : np.ndarray, lat : np.ndarray):
 		"""
-		Plot data on the map.
+		Hide data outside of the projection domain (points not visible on an orthographic map).
 		"""
-		lon, lat = self.adapt_coordinates()
-
 		if self.map_settings['projection'] == "ortho":
-			self.data[lon>1e20] = np.nan
-			self.data[lat>1e20] = np.nan
-			self.data[lon<-1e20] = np.nan
-			self.data[lat<-1e20] = np.nan
+			data[lon>1e20] = np.nan
+			data[lat>1e20] = np.nan
+			data[lon<-1e20] = np.nan
+			data[lat<-1e20] = np.nan
+		return data
 
+	def _get_norm(self):
+		"""
+		Return the colour normalization chosen in map options (None for automatic limits).
+		"""
 		if self.map_options['norm']:
-			norm = display_tools.MidpointNormalize(
+			return display_tools.MidpointNormalize(
 												   vmin=self.map_options['c_min'],
 												   vmax=self.map_options['c_max'],
 												   midpoint=self.map_options['midpoint']
 												   )
+		return None
+
+	def _draw_mesh(self):
+		"""
+		Draw the data with the engine of the plot type and return the data artist.
+		"""
+		if self.engine == "imshow" and grid_tools.is_regular(self.lons) and grid_tools.is_regular(self.lats):
+			return self._draw_image()
+		if self.engine in ["imshow", "transform"]:
+			return self._draw_transform()
+		if self.engine == "lookup":
+			return self._draw_view_image(self._lookup(self.data))
+		if self.engine in CONTOUR_PLOT_TYPES:
+			return self._draw_contour()
+		if self.engine in ["quiver", "barbs"]:
+			return self._draw_vectors()
+		if self.engine == "streamplot":
+			return self._draw_streamlines()
+		lon, lat = self.adapt_coordinates()
+
+		self.data = self._mask_outside(self.data, lon, lat)
+
+		return self.map.pcolormesh(lon, lat, self.data, cmap=self.map_options['cmap'], norm=self._get_norm())
+
+	def _draw_contour(self):
+		"""
+		contour and contourf engines, on the projected mesh.
+		"""
+		lon, lat = self.adapt_coordinates()
+		self.data = np.ma.masked_invalid(self._mask_outside(self.data, lon, lat))
+		draw = self.map.contourf if self.engine == "contourf" else self.map.contour
+		return draw(lon, lat, self.data, levels=self._get_contour_levels(self.data), cmap=self.map_options['cmap'], norm=self._get_norm())
+
+	def _get_contour_levels(self, data : np.ndarray):
+		"""
+		Return the contour levels: round values between the colour limits (fixed by the norm, or the data range).
+		"""
+		if self.map_options['norm']:
+			vmin, vmax = float(self.map_options['c_min']), float(self.map_options['c_max'])
 		else:
-			norm = None
+			vmin, vmax = float(np.ma.min(data)), float(np.ma.max(data))
+		key = (vmin, vmax, N_CONTOUR_LEVELS)
+		levels = _CONTOUR_LEVELS.get(key)
+		if levels is None:
+			levels = ticker.MaxNLocator(N_CONTOUR_LEVELS).tick_values(vmin, vmax)
+			_CONTOUR_LEVELS.put(key, levels)
+		return levels
+
+	def _get_vector_strides(self):
+		"""
+		Return the (lat, lon) subsampling of the grid giving one vector every VECTOR_SPACING pixels.
+		"""
+		width, height = self.ax.get_window_extent().size
+		spacing = VECTOR_SPACING[self.engine]
+		n_lats, n_lons = self.data.shape[-2:]
+		return max(1, int(np.ceil(n_lats*spacing/max(height, 1)))), max(1, int(np.ceil(n_lons*spacing/max(width, 1))))
+
+	def _get_rotation(self, strides : tuple):
+		"""
+		Return the projected positions of the subsampled vectors and the rotation of their components into
+		map coordinates (cached, read-only): (x, y, a, b, c, d), with u' = a*u+b*v and v' = c*u+d*v.
+		The rotation is obtained once by rotating unit vectors with Basemap.rotate_vector.
+		"""
+		key = cache_tools.make_key(
+								   self.map_settings,
+								   strides,
+								   cache_tools.array_digest(self.lons),
+								   cache_tools.array_digest(self.lats)
+								   )
+		cached = ROTATION_CACHE.get(key)
+		if cached is not None:
+			return cached
+		lons, lats = np.meshgrid(self.lons[::strides[1]], self.lats[::strides[0]])
+		ones, zeros = np.ones(lons.shape), np.zeros(lons.shape)
+		a, c, x, y = self.map.rotate_vector(ones, zeros, lons, lats, returnxy=True)
+		b, d = self.map.rotate_vector(zeros, ones, lons, lats)
+		arrays = tuple(np.array(np.ma.getdata(arr), dtype=np.float64) for arr in (x, y, a, b, c, d))
+		for arr in arrays:
+			arr.flags.writeable = False
+		ROTATION_CACHE.put(key, arrays)
+		return arrays
+
+	def _get_vector_components(self, data : np.ndarray):
+		"""
+		Return the positions, components in map coordinates and speed of the subsampled vectors of :data:.
+		"""
+		y_stride, x_stride = self.vector_strides
+		u, v = data[0, ::y_stride, ::x_stride], data[1, ::y_stride, ::x_stride]
+		x, y, a, b, c, d = self._get_rotation(self.vector_strides)
+		# Points outside of the projection domain are mapped to huge values
+		outside = ~(np.isfinite(x) & np.isfinite(y)) | (np.abs(x) > 1e20) | (np.abs(y) > 1e20)
+		speed = np.ma.masked_where(outside, np.ma.sqrt(u**2+v**2))
+		map_u = np.ma.masked_where(outside, a*u+b*v)
+		map_v = np.ma.masked_where(outside, c*u+d*v)
+		return np.where(outside, 0., x), np.where(outside, 0., y), map_u, map_v, speed
+
+	def _draw_vectors(self):
+		"""
+		quiver and barbs engines: subsampled vectors, coloured by wind speed.
+		"""
+		self.vector_strides = self._get_vector_strides()
+		x, y, u, v, speed = self._get_vector_components(self.data)
+		draw = self.ax.barbs if self.engine == "barbs" else self.ax.quiver
+		return draw(x, y, u, v, speed, cmap=self.map_options['cmap'], norm=self._get_norm())
+
+	def _draw_streamlines(self):
+		"""
+		streamplot engine: vectors are interpolated on a regular grid of projection coordinates (Basemap.transform_vector).
+		The grid spans the projection limits of the map: coordinates returned by transform_vector are not finite
+		outside of the globe (e.g. moll, spstere), while streamplot needs strictly increasing ones.
+		Grids run from the lower left to the upper right corner, which are swapped on south polar maps.
+		"""
+		width, height = self.ax.get_window_extent().size
+		spacing = VECTOR_SPACING[self.engine]
+		nx, ny = max(int(width/spacing), 2), max(int(height/spacing), 2)
+		lats, data = self.lats, self.data
+		if len(lats) > 1 and lats[0] > lats[-1]:
+			# Basemap.transform_vector needs increasing coordinates
+			lats, data = lats[::-1], data[:, ::-1]
+		u, v = self.map.transform_vector(data[0], data[1], self.lons, lats, nx, ny, masked=True)
+		u, v = np.ma.masked_invalid(u), np.ma.masked_invalid(v)
+		x = np.linspace(self.map.llcrnrx, self.map.urcrnrx, nx)
+		y = np.linspace(self.map.llcrnry, self.map.urcrnry, ny)
+		if x[0] > x[-1]:
+			x, u, v = x[::-1], u[:, ::-1], v[:, ::-1]
+		if y[0] > y[-1]:
+			y, u, v = y[::-1], u[::-1], v[::-1]
+		speed = np.ma.sqrt(u**2+v**2)
+		patches = set(id(patch) for patch in self.ax.patches)
+		stream = self.ax.streamplot(x, y, u, v, color=np.ma.filled(speed, np.nan),
+									cmap=self.map_options['cmap'], norm=self._get_norm())
+		# Arrow heads are added to the axes one by one: stream.arrows is never added, and can not be removed
+		self.extra_artists = [patch for patch in self.ax.patches if id(patch) not in patches]
+		return stream.lines
+
+	def _get_data_artists(self):
+		"""
+		Return the artists drawing data: the mesh and the extra artists, or the collections of a contour set
+		with older matplotlib versions (where contour sets are not artists themselves).
+		"""
+		if self.mesh is None:
+			return []
+		if isinstance(self.mesh, ContourSet) and self.mesh not in self.ax.get_children():
+			return list(self.mesh.collections)
+		return [self.mesh]+self.extra_artists
+
+	def _redraw_mesh(self):
+		"""
+		Draw the data again in place of the current data artists. The view limits and the colorbar are kept.
+		"""
+		xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+		artists = self._get_data_artists()
+		# Contour sets of older matplotlib versions have no z-order: it is taken from their collections
+		zorder = artists[0].get_zorder() if artists else None
+		for artist in artists:
+			artist.remove()
+		self.extra_artists = []
+		self.mesh = self._draw_mesh()
+		for artist in self._get_data_artists():
+			if zorder is not None:
+				artist.set_zorder(zorder)
+		if self.colorbar is not None:
+			self.colorbar.update_normal(self.mesh)
+		# Basemap resets the limits to the whole map when plotting
+		self.ax.set_xlim(xlim)
+		self.ax.set_ylim(ylim)
+
+	def _draw_image(self):
+		"""
+		imshow engine: a regular lat/lon grid on a cylindrical equidistant map is an image, no mesh is needed.
+		"""
+		self.engine = "imshow"
+		lon_step = (self.lons[-1]-self.lons[0])/max(len(self.lons)-1, 1)
+		lat_step = (self.lats[-1]-self.lats[0])/max(len(self.lats)-1, 1)
+		# Cell edges; the first row is at the top of the image for descending latitudes (ERA5)
+		extent = (
+				  self.lons[0]-lon_step/2, self.lons[-1]+lon_step/2,
+				  self.lats[-1]+lat_step/2, self.lats[0]-lat_step/2
+				  )
+		xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+		image = self.ax.imshow(self.data, extent=extent, origin='upper', interpolation='nearest', aspect=self.ax.get_aspect(),
+							   cmap=self.map_options['cmap'], norm=self._get_norm())
+		self.ax.set_xlim(xlim)
+		self.ax.set_ylim(ylim)
+		return image
+
+	def _draw_transform(self):
+		"""
+		transform engine: like Basemap.transform_scalar, data is interpolated on a regular grid of projection
+		coordinates with one point per pixel of the current view, then drawn as an image.
+		"""
+		self.engine = "transform"
+		return self._draw_view_image(self._transform(self.data))
+
+	def _draw_view_image(self, image : np.ndarray):
+		"""
+		Draw an image covering the current view, with one value per pixel. Return the image artist.
+		"""
+		xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+		artist = self.ax.imshow(image, extent=xlim+ylim, origin='lower', interpolation='nearest',
+								aspect=self.ax.get_aspect(), cmap=self.map_options['cmap'], norm=self._get_norm())
+		self.ax.set_xlim(xlim)
+		self.ax.set_ylim(ylim)
+		return artist
+
+	def get_view(self):
+		"""
+		Return the limits of the current view and its size in pixels: (xlim, ylim, nx, ny).
+		"""
+		width, height = self.ax.get_window_extent().size
+		return tuple(self.ax.get_xlim()), tuple(self.ax.get_ylim()), max(int(width), 2), max(int(height), 2)
+
+	def _get_pixel_coordinates(self, view : tuple = None):
+		"""
+		Return the longitudes and latitudes of the pixels of :view: (default: the current view), cached and read-only.
+		Points outside of the globe are masked.
+		"""
+		xlim, ylim, nx, ny = view if view is not None else self.get_view()
+		key = cache_tools.make_key(self.map_settings, xlim, ylim, nx, ny)
+		cached = PIXEL_COORDINATES_CACHE.get(key)
+		if cached is not None:
+			return cached
+		x, y = np.meshgrid(np.linspace(xlim[0], xlim[1], nx), np.linspace(ylim[0], ylim[1], ny))
+		lons, lats = self.map(x, y, inverse=True)
+		outside = ~(np.isfinite(lons) & np.isfinite(lats) & (np.abs(lons) < 1e20) & (np.abs(lats) < 1e20))
+		lons = np.ma.masked_array(lons, mask=outside)
+		lats = np.ma.masked_array(lats, mask=outside)
+		PIXEL_COORDINATES_CACHE.put(key, (lons, lats))
+		return lons, lats
+
+	def _transform(self, data : np.ndarray):
+		"""
+		Interpolate :data: (on the lons/lats grid of the figure) at the pixels of the current view.
+		"""
+		lons, lats = self._get_pixel_coordinates()
+		data_lons, data_lats = self.lons, self.lats
+		if len(data_lats) > 1 and data_lats[0] > data_lats[-1]:
+			# basemap.interp needs increasing coordinates
+			data_lats = data_lats[::-1]
+			data = data[::-1]
+		if grid_tools.is_global(data_lons):
+			# Close the globe: pixels between the last and the first longitude are interpolated too
+			data_lons = np.append(data_lons, data_lons[0]+360.)
+			data = np.ma.concatenate([data, data[..., :1]], axis=-1)
+		# Pixels outside of the globe get a valid position in the grid for interp, and are masked again afterwards
+		outside = np.ma.getmaskarray(lons) | np.ma.getmaskarray(lats) | ~np.isfinite(np.ma.getdata(lons)) | ~np.isfinite(np.ma.getdata(lats))
+		pixel_lons = np.where(outside, data_lons[0], np.ma.getdata(lons))
+		pixel_lats = np.where(outside, data_lats[0], np.ma.getdata(lats))
+		# Same longitude range as the data grid
+		pixel_lons = np.mod(pixel_lons-data_lons[0], 360.)+data_lons[0]
+		image = interp(data, data_lons, data_lats, pixel_lons, pixel_lats, checkbounds=False, masked=True, order=1)
+		return np.ma.masked_where(outside | np.ma.getmaskarray(image), image)
 
-		mesh = self.map.pcolormesh(lon, lat, self.data, cmap=self.map_options['cmap'], norm=norm)
+	def _lookup(self, data : np.ndarray):
+		"""
+		Reproject :data: at the pixels of the current view through a precomputed lookup table (see lookup_tools).
+		"""
+		table = lookup_tools.get_table(
+									   (self.map_settings,)+self.get_view(),
+									   self._get_pixel_coordinates,
+									   self.lons,
+									   self.lats,
+									   LOOKUP_METHODS[self.map_options['plot_type']]
+									   )
+		return lookup_tools.apply_table(table, data)
+
+	def build_readout(self, view : tuple):
+		"""
+		Return the raster of get_readout for :view: (see get_view), to be assigned to self.readout: the nearest
+		lookup table and the coordinates of the pixels. The axes are not used: it runs on a worker thread.
+		"""
+		table = lookup_tools.get_table((self.map_settings,)+view, lambda: self._get_pixel_coordinates(view), self.lons, self.lats, "nearest")
+		return (view, table)+tuple(self._get_pixel_coordinates(view))
+
+	def get_readout(self, px : int, py : int):
+		"""
+		Return (lon, lat, value) at the pixel (px, py) of the axes, counted from their lower left corner.
+		lon and lat are None outside of the globe, value is None without data (the speed for vector plot types).
+		Pixels are sent to grid cells by the raster of build_readout: each call is a single lookup.
+		Nothing is returned (None, None, None) until the raster of the current view has been built.
+		"""
+		view = self.get_view()
+		if self.readout is None or self.readout[0] != view:
+			return None, None, None
+		_, (index, valid), pixel_lons, pixel_lats = self.readout
+		_, _, nx, ny = view
+		row, col = min(max(int(py), 0), ny-1), min(max(int(px), 0), nx-1)
+		if np.ma.getmaskarray(pixel_lons)[row, col]:
+			return None, None, None
+		lon, lat = float(pixel_lons[row, col]), float(pixel_lats[row, col])
+		if not valid[row, col]:
+			return lon, lat, None
+		j, i = divmod(int(index[row, col]), len(self.lons))
+		values = np.ma.asarray(self.data)[..., j, i]
+		if np.ma.is_masked(values) or not np.all(np.isfinite(np.ma.getdata(values))):
+			return lon, lat, None
+		value = float(np.hypot(*values)) if self.vector_pair is not None else float(values)
+		return lon, lat, value
+
+	def plot_data(self):
+		"""
+		Plot data on the map.
+		"""
+		self.mesh = self._draw_mesh()
 
 		if self.map_options['colorbar']:
 			divider = make_axes_locatable(self.ax)
 			cax = divider.append_axes("right", size='3%', pad=0.1)
-			plt.colorbar(mappable=mesh, ax=self.ax, cax=cax, orientation='vertical', extend='both')
-		
+			self.colorbar = plt.colorbar(mappable=self.mesh, ax=self.ax, cax=cax, orientation='vertical', extend='both')
+		return self.mesh
 
+	def update_data(self, data : np.ndarray):
+		"""
+		Replace the plotted data in place (same grid), without rebuilding the map nor the mesh.
+		"""
+		if self.engine == "imshow":
+			self.data = data
+			self.mesh.set_data(data)
+			return
+		if self.engine == "transform":
+			self.data = data
+			self.mesh.set_data(self._transform(data))
+			return
+		if self.engine == "lookup":
+			self.data = data
+			self.mesh.set_data(self._lookup(data))
+			return
+		if self.engine in ["quiver", "barbs"]:
+			self.data = data
+			_, _, u, v, speed = self._get_vector_components(data)
+			self.mesh.set_UVC(u, v, speed)
+			return
+		if self.engine in REDRAWN_PLOT_TYPES:
+			self.data = data
+			self._redraw_mesh()
+			return
+		lon, lat = self.adapt_coordinates()
+		self.data = self._mask_outside(data, lon, lat)
+		array = self.mesh.get_array()
+		if array is not None and array.ndim == 1:
+			# Flat shading of older matplotlib versions: one value less per dimension, flattened
+			self.mesh.set_array(self.data[:-1, :-1].ravel())
+		elif array is not None and array.shape != self.data.shape:
+			self.mesh.set_array(self.data[:array.shape[0], :array.shape[1]])
+		else:
+			self.mesh.set_array(self.data)
+
+	def replace_data(self, other):
+		"""
+		Take the window, overview level and data of :other:, a figure loaded with the same options
+		(typically for a zoomed view), and draw them in place of the current mesh. The map and the view limits are kept.
+		"""
+		self.viewport = other.viewport
+		self.plan = other.plan
+		self.pyramid = other.pyramid
+		self.pyramid_factor = other.pyramid_factor
+		self.lons = other.lons
+		self.lats = other.lats
+		self.data = other.data
+		self.readout = other.readout
+		self._redraw_mesh()
+
+	def update_style(self, map_options : dict):
+		"""
+		Apply new colour options (cmap, norm and its limits) to the plotted mesh and colorbar.
+		"""
+		self.map_options = map_options
+		if self.engine in REDRAWN_PLOT_TYPES:
+			# Contour levels and streamline colours depend on the colour options
+			self._redraw_mesh()
+			return
+		self.mesh.set_cmap(self.map_options['cmap'])
+		norm = self._get_norm()
+		if norm is None:
+			self.mesh.set_norm(colors.Normalize())
+			self.mesh.autoscale_None()
+		else:
+			self.mesh.set_norm(norm)
+		if self.colorbar is not None:
+			self.colorbar.update_normal(self.mesh)
+
+	def get_animated_artists(self):
+		"""
+		Return the mesh and the artists drawn over it, i.e. the artists to redraw when data changes.
+		"""
+		children = self.ax.get_children()
+		drawn = list(self.ax.collections)+list(self.ax.lines)+list(self.ax.patches)+list(self.ax.images)
+		data_artists = self._get_data_artists()
+		mesh_index = max(children.index(artist) for artist in data_artists)
+		mesh_zorder = max(artist.get_zorder() for artist in data_artists)
+		overlays = [
+					artist for artist in drawn
+					if not any(artist is data_artist for data_artist in data_artists) and artist.get_visible()
+					and (artist.get_zorder() > mesh_zorder or (artist.get_zorder() == mesh_zorder and children.index(artist) > mesh_index))
+					]
+		# Same ordering as Axes.draw: by zorder, then by insertion order
+		overlays.sort(key=lambda artist: (artist.get_zorder(), children.index(artist)))
+		return data_artists+overlays
 
 ###############
 ## Functions ##
 ###############
 
+def get_render_key(dataset : nc.Dataset, map_options : dict, presets : dict, size : tuple):
+	"""
+	Return the key of the rendered image of a map in RENDER_CACHE, or None if the dataset is not read from files.
+	The key covers the identity (path, size, modification time) of the source files, every map option,
+	the settings of the map preset and the canvas :size: in pixels.
+	"""
+	identities = nc_tools.get_file_identities(nc_tools.resolve_dataset(dataset, map_options['variable']))
+	if identities is None:
+		return None
+	return cache_tools.make_key(identities, map_options, presets.get(map_options['preset']), list(size))
+
 def main():
 	pass
 
@@ -0,0 +1,159 @@
+# Animation export: stream timesteps through a single figure into a video encoder
+
+#############
+## Imports ##
+#############
+
+# Matplotlib imports
+from matplotlib import animation
+from matplotlib import rcParams
+from matplotlib.figure import Figure as MplFig
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Other imports
+import os
+import subprocess
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import display_tools
+from figure import Figure
+
+###############
+## Constants ##
+###############
+
+FIGURE_SIZE = (10.8, 6)
+
+#############
+## Classes ##
+#############
+
+class FFmpegEncoder():
+	"""
+	Encoder piping raw RGBA frames to ffmpeg. Memory use does not depend on the number of frames.
+	"""
+	def __init__(self, path : str, size : tuple, fps : float):
+		self.path = path
+		width, height = size
+		command = [
+				   rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+				   '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f"{width}x{height}", '-r', str(fps),
+				   '-i', '-'
+				   ]
+		if not path.lower().endswith(".gif"):
+			# Most video codecs need yuv420p, i.e. even dimensions
+			command += ['-vf', "pad=ceil(iw/2)*2:ceil(ih/2)*2", '-pix_fmt', 'yuv420p']
+		command.append(path)
+		self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+	def write(self, rgba : np.ndarray):
+		self.process.stdin.write(np.ascontiguousarray(rgba).tobytes())
+
+	def close(self):
+		self.process.stdin.close()
+		if self.process.wait() != 0:
+			raise Exception(f"EncoderError: ffmpeg failed to write {self.path}.")
+
+	def abort(self):
+		"""
+		Stop ffmpeg and remove the partial output file.
+		"""
+		self.process.kill()
+		self.process.wait()
+		try:
+			self.process.stdin.close()
+		except OSError:
+			pass
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+class PillowGifEncoder():
+	"""
+	Fallback GIF encoder when ffmpeg is not available.
+	Pillow writes GIF files in one go: frames are kept as palette images (1 byte per pixel) until closing.
+	"""
+	def __init__(self, path : str, size : tuple, fps : float):
+		self.path = path
+		self.size = size
+		self.duration = int(1000/fps)
+		self.frames = []
+
+	def write(self, rgba : np.ndarray):
+		from PIL import Image
+		image = Image.fromarray(np.asarray(rgba)[..., :3])
+		self.frames.append(image.quantize())
+
+	def close(self):
+		if not self.frames:
+			return
+		self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:], duration=self.duration, loop=0)
+		self.frames = []
+
+	def abort(self):
+		"""
+		Drop the frames: nothing has been written yet.
+		"""
+		self.frames = []
+
+###############
+## Functions ##
+###############
+
+def get_encoder(path : str, size : tuple, fps : float):
+	"""
+	Return the best available encoder for :path: (ffmpeg pipe, Pillow for GIF files otherwise).
+	"""
+	if animation.FFMpegWriter.isAvailable():
+		return FFmpegEncoder(path, size, fps)
+	if path.lower().endswith(".gif"):
+		return PillowGifEncoder(path, size, fps)
+	raise Exception(f"EncoderError: ffmpeg is required to export {path}. Use a .gif file or install ffmpeg.")
+
+def export_animation(dataset : nc.Dataset, map_options : dict, presets : dict, time_indices : list, path : str,
+					 fps : float = 10, dpi : int = 100, figsize : tuple = FIGURE_SIZE, progress = None):
+	"""
+	Export an animation of :time_indices: to :path:.
+	The map is drawn once: each frame only reads a field, updates the mesh colours and blits the map area.
+	:progress: is an optional callable taking the number of written frames and the total number of frames.
+	No file is left at :path: if a frame fails or :progress: raises.
+	"""
+	mpl_fig = MplFig(figsize=figsize, dpi=dpi)
+	canvas = FigureCanvasAgg(mpl_fig)
+	ax = mpl_fig.add_subplot(111)
+	fig = Figure(figure=mpl_fig, ax=ax, dataset=dataset, map_options=dict(map_options, time_index=time_indices[0]), presets=presets)
+	fig.plot_data()
+	mpl_fig.tight_layout()
+	blitter = display_tools.BlitManager(canvas, ax, fig.get_animated_artists())
+
+	encoder = None
+	try:
+		for i, time_index in enumerate(time_indices):
+			if i > 0:
+				fig.update_data(fig.read_frame(time_index))
+				# Some plot types (contours, streamlines) draw new artists for each frame
+				blitter.artists = fig.get_animated_artists()
+			blitter.update()
+			rgba = np.asarray(canvas.buffer_rgba())
+			if encoder is None:
+				encoder = get_encoder(path, (rgba.shape[1], rgba.shape[0]), fps)
+			encoder.write(rgba)
+			if progress is not None:
+				progress(i+1, len(time_indices))
+	except BaseException:
+		# close() may raise as well and hide the original error
+		if encoder is not None:
+			encoder.abort()
+		raise
+	if encoder is not None:
+		encoder.close()
+	return path
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
@@ -79,6 +79,56 @@ class MidpointNormalize(colors.Normalize):
 		x, y = [self.vmin, self.midpoint, self.vmax], [0,0.5,1]
 		return np.ma.masked_array(np.interp(value, x, y))
 
+class BlitManager():
+	"""
+	Redraw only some animated artists over a cached background, instead of the whole figure.
+	The background is captured with the animated artists hidden, at the first update or after a full redraw.
+	"""
+	def __init__(self, canvas, ax : plt.Axes, artists : list):
+		self.canvas = canvas
+		self.ax = ax
+		self.artists = artists
+		self.background = None
+		self._capturing = False
+		# Any other full redraw (resize, zoom...) makes the background outdated
+		self._cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+
+	def _on_draw(self, event):
+		if not self._capturing:
+			self.background = None
+
+	def disconnect(self):
+		"""
+		Stop listening to canvas draws.
+		"""
+		self.canvas.mpl_disconnect(self._cid)
+
+	def capture(self):
+		"""
+		Draw the whole figure without the animated artists and save the axes area.
+		"""
+		self._capturing = True
+		try:
+			for artist in self.artists:
+				artist.set_visible(False)
+			self.canvas.draw()
+			self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+		finally:
+			for artist in self.artists:
+				artist.set_visible(True)
+			self._capturing = False
+
+	def update(self):
+		"""
+		Restore the background, draw animated artists and blit the axes area.
+		"""
+		if self.background is None:
+			self.capture()
+		self.canvas.restore_region(self.background)
+		for artist in self.artists:
+			self.ax.draw_artist(artist)
+		self.canvas.blit(self.ax.bbox)
+
 ###############
 ## Functions ##
 ###############
@@ -0,0 +1,290 @@
+# Grid tools: geographic windows and read planning over lat/lon grids
+
+#############
+## Imports ##
+#############
+
+import numpy as np
+
+# Custom imports
+import cache_tools
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+# Projections for which the lat/lon box given by map corners covers exactly the map
+CYLINDRICAL_PROJECTIONS = ["cyl", "merc", "mill", "gall", "cea"]
+NORTH_POLAR_PROJECTIONS = ["npstere", "nplaea", "npaeqd"]
+SOUTH_POLAR_PROJECTIONS = ["spstere", "splaea", "spaeqd"]
+CORNERS = ["llcrnrlon", "urcrnrlon", "llcrnrlat", "urcrnrlat"]
+VIEWPORT_SAMPLES = 25 # Number of points sampled along each side of a view to find the lat/lon box it covers
+
+# Longitude permutations only depend on the grid, they are shared between frames
+_PERMUTATIONS = cache_tools.LRUCache(max_items=8)
+# Grid indices, built once per grid
+_GRID_INDICES = cache_tools.LRUCache(max_items=4)
+
+#############
+## Classes ##
+#############
+
+class ReadPlan():
+	"""
+	Hyperslab read plan over a (..., lat, lon) variable.
+	Longitudes may be split in several slices (0..360 grids seen from a window crossing the Greenwich meridian, dateline...):
+	pieces are concatenated in the order of increasing longitude.
+	"""
+	def __init__(self, lat_slice : slice, lon_slices : list, lats : np.ndarray, lons : np.ndarray, lon_windowed : bool):
+		self.lat_slice = lat_slice
+		self.lon_slices = lon_slices
+		self.lats = lats
+		self.lons = lons
+		self.lon_windowed = lon_windowed
+
+	@property
+	def shape(self):
+		return (len(self.lats), len(self.lons))
+
+	def read(self, variable, *leading):
+		"""
+		Read the planned window of :variable:, :leading: being the indices of the first dimensions (time, level...).
+		"""
+		pieces = [nc_tools.read_slice(variable, tuple(leading)+(self.lat_slice, lon_slice)) for lon_slice in self.lon_slices]
+		if len(pieces) == 1:
+			return pieces[0]
+		return np.ma.concatenate(pieces, axis=-1)
+
+	def read_packed(self, variable, *leading):
+		"""
+		Read the planned window of a packed variable as raw 16-bit integers. Return (raw, packing), see nc_tools.read_packed.
+		"""
+		pieces = [nc_tools.read_packed(variable, tuple(leading)+(self.lat_slice, lon_slice)) for lon_slice in self.lon_slices]
+		if len(pieces) == 1:
+			return pieces[0]
+		return np.concatenate([raw for raw, _ in pieces], axis=-1), pieces[0][1]
+
+class GridIndex():
+	"""
+	Index from geographic coordinates to the closest cell of a (lats, lons) grid.
+	Coordinates are sorted once; each lookup is then a binary search along each axis.
+	Global grids wrap around in longitude.
+	"""
+	def __init__(self, lons : np.ndarray, lats : np.ndarray):
+		self.lons = np.asarray(lons, dtype=np.float64)
+		self.lats = np.asarray(lats, dtype=np.float64)
+		self.wrap = is_global(self.lons)
+		self._lon_order = np.argsort(self.lons, kind='stable')
+		self._lat_order = np.argsort(self.lats, kind='stable')
+		self._sorted_lons = self.lons[self._lon_order]
+		self._sorted_lats = self.lats[self._lat_order]
+
+	@staticmethod
+	def _closest(sorted_coords : np.ndarray, value : float):
+		"""
+		Return the position of the closest value in :sorted_coords:, or None beyond half a cell from its ends.
+		"""
+		half_step = get_step(sorted_coords)/2
+		if value < sorted_coords[0]-half_step or value > sorted_coords[-1]+half_step:
+			return None
+		right = int(np.clip(np.searchsorted(sorted_coords, value), 0, len(sorted_coords)-1))
+		left = max(right-1, 0)
+		return left if abs(sorted_coords[left]-value) <= abs(sorted_coords[right]-value) else right
+
+	def locate(self, lon : float, lat : float):
+		"""
+		Return the (lat, lon) indices of the cell closest to a point, or None if the point is outside of the grid.
+		"""
+		j = self._closest(self._sorted_lats, lat)
+		if self.wrap:
+			west = self._sorted_lons[0]
+			lon = np.mod(lon-west, 360.)+west
+			if lon > self._sorted_lons[-1] and lon-self._sorted_lons[-1] > west+360.-lon:
+				# Between the last and the first longitude, closer to the first one
+				lon = west
+		i = self._closest(self._sorted_lons, lon)
+		if j is None or i is None:
+			return None
+		return int(self._lat_order[j]), int(self._lon_order[i])
+
+###############
+## Functions ##
+###############
+
+def get_grid_index(lons : np.ndarray, lats : np.ndarray):
+	"""
+	Return the (shared) index of a grid.
+	"""
+	key = (cache_tools.array_digest(lons), cache_tools.array_digest(lats))
+	index = _GRID_INDICES.get(key)
+	if index is None:
+		index = GridIndex(lons, lats)
+		_GRID_INDICES.put(key, index)
+	return index
+
+def get_step(coords : np.ndarray):
+	"""
+	Return the typical spacing of a coordinate vector.
+	"""
+	if len(coords) < 2:
+		return 0.
+	return float(np.median(np.abs(np.diff(coords))))
+
+def is_regular(coords : np.ndarray):
+	"""
+	Return True if a coordinate vector is evenly spaced (and monotonic).
+	"""
+	if len(coords) < 2:
+		return True
+	steps = np.diff(coords)
+	return bool(np.allclose(steps, steps[0], rtol=1e-3, atol=1e-6) and steps[0] != 0)
+
+def get_bounds(settings : dict):
+	"""
+	Return the (lon_min, lon_max, lat_min, lat_max) box covered by a map, or None if the whole globe may be visible.
+	"""
+	projection = settings.get('projection', 'cyl')
+	if projection in CYLINDRICAL_PROJECTIONS and all(corner in settings for corner in CORNERS):
+		return (
+				float(settings['llcrnrlon']),
+				float(settings['urcrnrlon']),
+				float(settings['llcrnrlat']),
+				float(settings['urcrnrlat'])
+				)
+	if projection in NORTH_POLAR_PROJECTIONS and 'boundinglat' in settings:
+		return (-180., 180., float(settings['boundinglat']), 90.)
+	if projection in SOUTH_POLAR_PROJECTIONS and 'boundinglat' in settings:
+		return (-180., 180., -90., float(settings['boundinglat']))
+	return None
+
+def _runs_to_slices(indices : np.ndarray):
+	"""
+	Group consecutive indices into slices.
+	"""
+	breaks = np.nonzero(np.diff(indices) != 1)[0]+1
+	return [slice(int(run[0]), int(run[-1])+1) for run in np.split(indices, breaks)]
+
+def plan_window(lons : np.ndarray, lats : np.ndarray, lon_min : float, lon_max : float, lat_min : float, lat_max : float):
+	"""
+	Return the read plan of the window [lon_min, lon_max] x [lat_min, lat_max], padded by one grid cell.
+	Longitudes of the plan are continuous from :lon_min:, whatever the convention of the grid (-180..180 or 0..360).
+	"""
+	lat_pad = get_step(lats)
+	lat_indices = np.nonzero((lats >= lat_min-lat_pad) & (lats <= lat_max+lat_pad))[0]
+	if len(lat_indices) == 0:
+		raise Exception("GridError: The map window does not intersect the dataset grid.")
+	lat_slice = slice(int(lat_indices.min()), int(lat_indices.max())+1)
+
+	lon_pad = get_step(lons)
+	span = lon_max-lon_min+2*lon_pad
+	if span >= 360.:
+		return ReadPlan(lat_slice, [slice(None)], lats[lat_slice], lons, lon_windowed=False)
+	start = lon_min-lon_pad
+	rel = np.mod(lons-start, 360.)
+	lon_indices = np.nonzero(rel <= span)[0]
+	if len(lon_indices) == 0:
+		raise Exception("GridError: The map window does not intersect the dataset grid.")
+	lon_indices = lon_indices[np.argsort(rel[lon_indices], kind='stable')]
+	return ReadPlan(lat_slice, _runs_to_slices(lon_indices), lats[lat_slice], start+rel[lon_indices], lon_windowed=True)
+
+def plan_read(lons : np.ndarray, lats : np.ndarray, settings : dict):
+	"""
+	Return the read plan covering the map described by the basemap :settings:.
+	"""
+	bounds = get_bounds(settings)
+	if bounds is None:
+		return ReadPlan(slice(None), [slice(None)], lats, lons, lon_windowed=False)
+	return plan_window(lons, lats, *bounds)
+
+def get_viewport_bounds(m, xlim : tuple, ylim : tuple, n_samples : int = VIEWPORT_SAMPLES):
+	"""
+	Return the (lon_min, lon_max, lat_min, lat_max) box seen through the :xlim: x :ylim: view of the map :m:.
+	The view is sampled on a regular grid of points mapped back through the inverse projection; the box is
+	padded by one sampling step. Return None if no point of the view is on the globe.
+	"""
+	x, y = np.meshgrid(np.linspace(xlim[0], xlim[1], n_samples), np.linspace(ylim[0], ylim[1], n_samples))
+	lons, lats = m(x, y, inverse=True)
+	lons, lats = np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)
+	# Points outside of the projection domain (orthographic maps...) are mapped to huge values
+	valid = np.isfinite(lons) & np.isfinite(lats) & (np.abs(lons) < 1e20) & (np.abs(lats) < 1e20)
+	if not valid.any():
+		return None
+	lons, lats = lons[valid], lats[valid]
+	lat_pad = (lats.max()-lats.min())/(n_samples-1)
+	lat_min, lat_max = max(lats.min()-lat_pad, -90.), min(lats.max()+lat_pad, 90.)
+	lon_0 = float(getattr(m, 'projparams', {}).get('lon_0', 0.))
+	if m.projection not in CYLINDRICAL_PROJECTIONS:
+		# A pole inside the view: all longitudes are visible
+		for pole_lat in [90., -90.]:
+			px, py = m(lon_0, pole_lat)
+			if min(xlim) <= px <= max(xlim) and min(ylim) <= py <= max(ylim):
+				return (lon_0-180., lon_0+180., min(lat_min, pole_lat), max(lat_max, pole_lat))
+	# Longitudes relative to the central meridian: views crossing its antimeridian stay in one piece
+	rel = np.mod(lons-lon_0+180., 360.)-180.
+	lon_pad = (rel.max()-rel.min())/(n_samples-1)
+	return (lon_0+rel.min()-lon_pad, lon_0+rel.max()+lon_pad, lat_min, lat_max)
+
+def is_global(lons : np.ndarray):
+	"""
+	Return True if the longitudes cover the whole globe.
+	"""
+	step = get_step(lons)
+	return len(lons) > 1 and float(np.max(lons)-np.min(lons))+1.5*step >= 360.
+
+def detect_lon_convention(lons : np.ndarray):
+	"""
+	Return the longitude convention of a grid: '0..360', '-180..180' or 'other'.
+	"""
+	lon_min, lon_max = float(np.min(lons)), float(np.max(lons))
+	if lon_min >= 0. and lon_max <= 360.:
+		return '0..360'
+	if lon_min >= -180. and lon_max <= 180.:
+		return '-180..180'
+	return 'other'
+
+def lon_permutation(lons : np.ndarray, center : float = 0.):
+	"""
+	Return the index permutation ordering a global grid by increasing longitude in [center-180, center+180),
+	and the reordered longitudes. The permutation is None when the grid is already in order.
+	"""
+	key = (cache_tools.array_digest(lons), float(center))
+	cached = _PERMUTATIONS.get(key)
+	if cached is not None:
+		return cached
+	west = center-180.
+	wrapped = np.mod(lons-west, 360.)+west
+	perm = np.argsort(wrapped, kind='stable')
+	if np.array_equal(perm, np.arange(len(lons))):
+		perm = None
+	new_lons = wrapped if perm is None else wrapped[perm]
+	_PERMUTATIONS.put(key, (perm, new_lons))
+	return perm, new_lons
+
+def normalize_longitudes(lons : np.ndarray, data : np.ndarray, center : float = 0.):
+	"""
+	Order :data: (..., lon), possibly a stack of several fields, by increasing longitude.
+	Global grids are wrapped around :center: (e.g. lon_0 of the map), whatever their convention; descending regional
+	grids are reversed (as views), other regional grids are left as they are. Data is copied at most once.
+	Return the new longitudes and data.
+	"""
+	if not is_global(lons):
+		if len(lons) > 1 and lons[0] > lons[-1]:
+			# Descending grid: a reversed view is enough
+			return lons[::-1], data[..., ::-1]
+		return lons, data
+	if center == 0. and detect_lon_convention(lons) == '-180..180' and lons[-1] < 180. and np.all(np.diff(lons) > 0):
+		# Already in the target convention
+		return lons, data
+	perm, new_lons = lon_permutation(lons, center)
+	if perm is None:
+		return new_lons, data
+	return new_lons, data.take(perm, axis=-1)
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
@@ -0,0 +1,113 @@
+# Lookup tools: precomputed reprojection tables, from target pixels to source grid cells
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import numpy as np
+
+# Custom imports
+import cache_tools
+import grid_tools
+
+###############
+## Constants ##
+###############
+
+LOOKUP_CACHE_PATH = os.path.join(cache_tools.CACHE_PATH, "lookup")
+METHODS = ["nearest", "bilinear"]
+
+# Tables are memory-mapped: only the pages used by a view are read, and processes share them.
+# Keys include the view limits: the least recently used tables are deleted beyond 1 GB on disk.
+LOOKUP_CACHE = cache_tools.ArrayCache(max_items=8, cache_dir=LOOKUP_CACHE_PATH, mmap_mode='r', max_disk_bytes=1024**3)
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def _fractional_indices(coords : np.ndarray, values : np.ndarray):
+	"""
+	Return the fractional indices of :values: along the monotonic vector :coords:, NaN outside of it.
+	"""
+	positions = np.arange(len(coords), dtype=np.float64)
+	if len(coords) > 1 and coords[0] > coords[-1]:
+		coords = coords[::-1]
+		positions = positions[::-1]
+	indices = np.interp(values, coords, positions)
+	indices[(values < coords[0]) | (values > coords[-1])] = np.nan
+	return indices
+
+def build_table(pixel_lons : np.ndarray, pixel_lats : np.ndarray, lons : np.ndarray, lats : np.ndarray, method : str = "nearest"):
+	"""
+	Return the lookup table sending each target pixel (of geographic coordinates :pixel_lons:, :pixel_lats:,
+	masked outside of the globe) to cells of the (lats, lons) source grid:
+	- nearest: (index, valid), index being the flat index of the closest cell;
+	- bilinear: (index, weights, valid), with the flat indices and weights of the 4 surrounding cells.
+	Global grids wrap around in longitude.
+	"""
+	if method not in METHODS:
+		raise Exception(f"LookupError: Unknown method {method}, expected one of {METHODS}.")
+	n_lats, n_lons = len(lats), len(lons)
+	wrap = grid_tools.is_global(lons)
+	outside = np.ma.getmaskarray(pixel_lons) | np.ma.getmaskarray(pixel_lats)
+	pixel_lons = np.mod(np.ma.getdata(pixel_lons)-lons[0], 360.)+lons[0]
+	lon_coords = np.append(lons, lons[0]+360.) if wrap else lons
+	fi = _fractional_indices(lon_coords, pixel_lons)
+	fj = _fractional_indices(lats, np.ma.getdata(pixel_lats))
+	valid = ~(outside | np.isnan(fi) | np.isnan(fj))
+	fi = np.where(valid, fi, 0.)
+	fj = np.where(valid, fj, 0.)
+
+	def flat(j, i):
+		# Index n_lons is the first column again on global grids
+		i = np.mod(i, n_lons) if wrap else np.clip(i, 0, n_lons-1)
+		return (np.clip(j, 0, n_lats-1)*n_lons+i).astype(np.int32)
+
+	if method == "nearest":
+		return flat(np.rint(fj).astype(np.int64), np.rint(fi).astype(np.int64)), valid
+	i0, j0 = np.floor(fi).astype(np.int64), np.floor(fj).astype(np.int64)
+	wi, wj = (fi-i0).astype(np.float32), (fj-j0).astype(np.float32)
+	index = np.stack([flat(j0, i0), flat(j0, i0+1), flat(j0+1, i0), flat(j0+1, i0+1)])
+	weights = np.stack([(1-wj)*(1-wi), (1-wj)*wi, wj*(1-wi), wj*wi])
+	return index, weights, valid
+
+def get_table(key_parts : tuple, pixel_coordinates, lons : np.ndarray, lats : np.ndarray, method : str = "nearest"):
+	"""
+	Return the lookup table identified by :key_parts: (map settings, view, pixel size...), building and persisting
+	it on first use. :pixel_coordinates: is a callable returning the geographic coordinates of the target pixels,
+	only called when the table has to be built.
+	"""
+	key = cache_tools.make_key(*key_parts, method, cache_tools.array_digest(lons), cache_tools.array_digest(lats))
+	table = LOOKUP_CACHE.get(key)
+	if table is None:
+		pixel_lons, pixel_lats = pixel_coordinates()
+		table = build_table(pixel_lons, pixel_lats, lons, lats, method)
+		LOOKUP_CACHE.put(key, table)
+	return table
+
+def apply_table(table : tuple, data : np.ndarray):
+	"""
+	Return the image of :data: through a lookup table: a single gather (and weighted sum for bilinear tables).
+	"""
+	values = np.ma.filled(np.ma.asarray(data, dtype=np.float32), np.nan).ravel()
+	if len(table) == 2:
+		index, valid = table
+		image = values[index]
+	else:
+		index, weights, valid = table
+		image = np.einsum('k...,k...->...', values[index], weights)
+	return np.ma.masked_where(~np.asarray(valid) | np.isnan(image), image)
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
@@ -0,0 +1,119 @@
+# Basemap factory, sharing map instances between figures
+
+#############
+## Imports ##
+#############
+
+# Matplotlib imports
+from mpl_toolkits.basemap import Basemap
+
+# Other imports
+import os
+import copy
+import pickle
+import threading
+
+# Custom imports
+import cache_tools
+
+###############
+## Constants ##
+###############
+
+BASEMAP_CACHE_PATH = os.path.join(cache_tools.CACHE_PATH, "basemaps")
+# Boundary datasets loaded lazily by Basemap the first time they are drawn
+BOUNDARY_ATTRIBUTES = ["cntrysegs", "riversegs", "statesegs", "countysegs"]
+
+_BASEMAPS = cache_tools.LRUCache(max_items=8)
+_LOCK = threading.Lock()
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def _pickle_path(key : str):
+	return os.path.join(BASEMAP_CACHE_PATH, f"{key}.pickle")
+
+def _load(key : str):
+	"""
+	Load a pickled Basemap. Return None if it is missing or unreadable.
+	"""
+	path = _pickle_path(key)
+	if not os.path.exists(path):
+		return None
+	try:
+		with open(path, 'rb') as foo:
+			return pickle.load(foo)
+	except Exception as e:
+		print(f"Cache warning: could not load basemap {key}.\n{e}", flush=True)
+		return None
+
+def _save(key : str, m : Basemap):
+	"""
+	Pickle a Basemap in the cache directory.
+	"""
+	try:
+		os.makedirs(BASEMAP_CACHE_PATH, exist_ok=True)
+		# Pool workers starting together may pickle the same Basemap: each one writes its own temporary file
+		tmp_path = cache_tools.get_tmp_path(_pickle_path(key))
+		try:
+			with open(tmp_path, 'wb') as foo:
+				pickle.dump(m, foo, protocol=pickle.HIGHEST_PROTOCOL)
+			os.replace(tmp_path, _pickle_path(key))
+		finally:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+	except Exception as e:
+		print(f"Cache warning: could not persist basemap {key}.\n{e}", flush=True)
+
+def _get_shared(settings : dict):
+	"""
+	Return the shared Basemap instance for :settings:, building it if necessary.
+	"""
+	key = cache_tools.make_key(settings)
+	with _LOCK:
+		m = _BASEMAPS.get(key)
+		if m is None:
+			m = _load(key)
+			if m is None:
+				m = Basemap(**settings)
+				_save(key, m)
+			_BASEMAPS.put(key, m)
+	return key, m
+
+def get_basemap(settings : dict, ax = None):
+	"""
+	Return a Basemap built from :settings: (preset args and resolution), bound to :ax:.
+	Heavy boundary data (coastlines, countries, rivers...) is shared with every other map built from the same settings.
+	"""
+	_, shared = _get_shared(settings)
+	m = copy.copy(shared)
+	if hasattr(m, '_initialized_axes'):
+		m._initialized_axes = set()
+	m.ax = ax
+	return m
+
+def update_basemap(settings : dict, m : Basemap):
+	"""
+	Share boundary data lazily loaded by :m: (e.g. after drawcountries) with the cached instance, and persist it.
+	"""
+	key, shared = _get_shared(settings)
+	with _LOCK:
+		new_attributes = [attr for attr in BOUNDARY_ATTRIBUTES if hasattr(m, attr) and not hasattr(shared, attr)]
+		if not new_attributes:
+			return
+		for attr in new_attributes:
+			setattr(shared, attr, getattr(m, attr))
+		_save(key, shared)
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
@@ -0,0 +1,67 @@
+# Packed tools: unpacking of 16-bit integer data (scale_factor/add_offset) through a lookup table
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import numpy as np
+
+# Custom imports
+import cache_tools
+
+###############
+## Constants ##
+###############
+
+N_CODES = 65536 # Number of 16-bit integer values
+
+# Tables of the packings met so far: member files of a virtual dataset may each have their own
+PACKED_TABLES = cache_tools.LRUCache(max_items=32)
+
+#############
+## Classes ##
+#############
+
+###############
+## Functions ##
+###############
+
+def build_table(packing : dict, coef : float = 1, offset : float = 0):
+	"""
+	Return the float32 table of the values of all 16-bit codes, indexed by the code seen as an unsigned integer:
+	(code*scale_factor+add_offset)*coef+offset, NaN for fill values.
+	:packing: is a dictionary {'scale_factor', 'add_offset', 'fill_values'} (see nc_tools.get_packing).
+	"""
+	codes = np.arange(N_CODES, dtype=np.uint16).view(np.int16)
+	table = ((codes*packing['scale_factor']+packing['add_offset'])*coef+offset).astype(np.float32)
+	fill_values = np.array(packing['fill_values'], dtype=np.int16)
+	table[fill_values.view(np.uint16)] = np.nan
+	table.flags.writeable = False
+	return table
+
+def get_table(packing : dict, coef : float = 1, offset : float = 0):
+	"""
+	Return the (shared, read-only) table of a packing and data corrections.
+	"""
+	key = (packing['scale_factor'], packing['add_offset'], tuple(packing['fill_values']), coef, offset)
+	table = PACKED_TABLES.get(key)
+	if table is None:
+		table = build_table(packing, coef, offset)
+		PACKED_TABLES.put(key, table)
+	return table
+
+def unpack(raw : np.ndarray, packing : dict, coef : float = 1, offset : float = 0):
+	"""
+	Return the float32 values of raw 16-bit codes, with data corrections applied and NaN for fill values.
+	A single gather: no float64 nor masked array is allocated.
+	"""
+	return get_table(packing, coef, offset).take(np.asarray(raw, dtype=np.int16).view(np.uint16))
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
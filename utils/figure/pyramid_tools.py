@@ -0,0 +1,209 @@
+# Pyramid tools: precomputed overview levels of a variable, for fast rendering of zoomed out views
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import numpy as np
+import netCDF4 as nc
+
+# Custom imports
+import cache_tools
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+PYRAMID_PATH = os.path.join(cache_tools.CACHE_PATH, "pyramids")
+FACTORS = [2, 4, 8] # Overview levels: blocks of 2x2, 4x4 and 8x8 grid cells
+PIXEL_DENSITY = 1. # Minimum number of grid cells per pixel kept when choosing an overview level
+BUILD_BUDGET = 64*1024**2 # Memory used by the timesteps read at once while building, in bytes
+FILL_VALUE = nc.default_fillvals['f4']
+
+# Block reductions: min/max levels preserve extremes (e.g. precipitation peaks) that averaging smooths out
+METHODS = ["mean", "min", "max"]
+
+# Opened pyramids, shared between figures
+_PYRAMIDS = cache_tools.LRUCache(max_items=4)
+
+#############
+## Classes ##
+#############
+
+class Pyramid():
+	"""
+	Overview levels of one variable, stored in a netCDF cache file.
+	Level :factor: holds the variable reduced by blocks of factor x factor cells (variable 'data_{factor}'),
+	with the block-averaged coordinates ('lat_{factor}', 'lon_{factor}'). Time and level dimensions are kept.
+	The cache file is tied to the identity of the source files: it is rebuilt when one of them changes.
+	"""
+	def __init__(self, dataset : nc.Dataset, variable : str, method : str = "mean", factors : list = FACTORS):
+		identity = nc_tools.get_file_identities(dataset)
+		if identity is None:
+			raise Exception("PyramidError: Overviews are only available for datasets read from files.")
+		if method not in METHODS:
+			raise Exception(f"PyramidError: Unknown method {method}, expected one of {METHODS}.")
+		self.dataset = dataset
+		self.variable = variable
+		self.method = method
+		self.factors = list(factors)
+		key = cache_tools.make_key(identity, variable, method, self.factors)
+		self.path = os.path.join(PYRAMID_PATH, f"{variable}_{method}_{key}.nc")
+		self._ds = None
+
+	def is_built(self):
+		return os.path.exists(self.path)
+
+	def build(self, progress = None):
+		"""
+		Compute all overview levels in one pass over the time axis, and write the cache file.
+		:progress: is an optional callable taking a fraction and a message; the file is not written if it raises.
+		"""
+		source = self.dataset[self.variable]
+		dims = source.dimensions
+		if len(dims) not in (3, 4) or dims[0] != 'time':
+			raise Exception(f"PyramidError: {self.variable} is not a (time, [level], lat, lon) variable.")
+		lons, lats = nc_tools.get_coordinates(self.dataset)
+		n_steps = source.shape[0]
+		step_bytes = int(np.prod(source.shape[1:]))*8
+		n_chunk = max(1, BUILD_BUDGET//step_bytes)
+
+		os.makedirs(PYRAMID_PATH, exist_ok=True)
+		tmp_path = f"{self.path}.{os.getpid()}.tmp"
+		with nc_tools.READ_LOCK:
+			out = nc.Dataset(tmp_path, 'w')
+		try:
+			with nc_tools.READ_LOCK:
+				leading = ('time',)
+				out.createDimension('time', n_steps)
+				if len(dims) == 4:
+					leading += ('level',)
+					out.createDimension('level', source.shape[1])
+				targets = {}
+				for factor in self.factors:
+					c_lats = coarsen_coordinates(lats, factor)
+					c_lons = coarsen_coordinates(lons, factor)
+					out.createDimension(f"lat_{factor}", len(c_lats))
+					out.createDimension(f"lon_{factor}", len(c_lons))
+					out.createVariable(f"lat_{factor}", 'f8', (f"lat_{factor}",))[:] = c_lats
+					out.createVariable(f"lon_{factor}", 'f8', (f"lon_{factor}",))[:] = c_lons
+					# One chunk per field: a frame is a single contiguous read
+					chunksizes = (1,)*len(leading)+(len(c_lats), len(c_lons))
+					targets[factor] = out.createVariable(f"data_{factor}", 'f4', leading+(f"lat_{factor}", f"lon_{factor}"),
+														 fill_value=FILL_VALUE, chunksizes=chunksizes)
+				out.setncattr('source_variable', self.variable)
+				out.setncattr('method', self.method)
+			for start in range (0, n_steps, n_chunk):
+				stop = min(start+n_chunk, n_steps)
+				data = nc_tools.read_slice(source, (slice(start, stop),))
+				for factor, target in targets.items():
+					reduced = coarsen(data, factor, self.method)
+					with nc_tools.READ_LOCK:
+						target[start:stop] = reduced
+				if progress is not None:
+					progress(stop/n_steps, f"Building overviews ({stop}/{n_steps})")
+		except BaseException:
+			with nc_tools.READ_LOCK:
+				out.close()
+			os.remove(tmp_path)
+			raise
+		with nc_tools.READ_LOCK:
+			out.close()
+		os.replace(tmp_path, self.path)
+
+	def _open(self):
+		with nc_tools.READ_LOCK:
+			if self._ds is None:
+				self._ds = nc.Dataset(self.path)
+		return self._ds
+
+	def coordinates(self, factor : int):
+		"""
+		Return the longitude and latitude arrays of a level.
+		"""
+		ds = self._open()
+		with nc_tools.READ_LOCK:
+			return np.ma.getdata(ds[f"lon_{factor}"][:]), np.ma.getdata(ds[f"lat_{factor}"][:])
+
+	def get_variable(self, factor : int):
+		"""
+		Return the variable of a level, to be read like the source variable (e.g. with grid_tools.ReadPlan).
+		"""
+		return self._open()[f"data_{factor}"]
+
+	def close(self):
+		with nc_tools.READ_LOCK:
+			if self._ds is not None:
+				self._ds.close()
+				self._ds = None
+
+###############
+## Functions ##
+###############
+
+def get_pyramid(dataset : nc.Dataset, variable : str, method : str = "mean"):
+	"""
+	Return the (shared) pyramid of a variable, or None if the dataset is not read from files.
+	The pyramid may not be built yet: see Pyramid.is_built and Pyramid.build.
+	"""
+	try:
+		pyramid = Pyramid(dataset, variable, method)
+	except Exception:
+		return None
+	shared = _PYRAMIDS.get(pyramid.path)
+	if shared is None:
+		_PYRAMIDS.put(pyramid.path, pyramid)
+		shared = pyramid
+	return shared
+
+def choose_factor(shape : tuple, pixels : tuple, factors : list = FACTORS, density : float = PIXEL_DENSITY):
+	"""
+	Return the coarsest factor keeping at least :density: grid cells per pixel along both axes, or 1.
+	:shape: is the (lat, lon) shape of the full resolution window, :pixels: the (height, width) of the axes in pixels.
+	"""
+	best = 1
+	for factor in factors:
+		if all(n/factor >= density*n_pixels for n, n_pixels in zip(shape, pixels)):
+			best = max(best, factor)
+	return best
+
+def coarsen(data : np.ndarray, factor : int, method : str = "mean"):
+	"""
+	Reduce the last two axes of :data: by blocks of factor x factor cells.
+	Incomplete blocks at the edges and masked cells are ignored by the reduction.
+	"""
+	data = np.ma.masked_invalid(np.ma.asarray(data, dtype=np.float32))
+	ny, nx = data.shape[-2:]
+	pad = [(0, 0)]*(data.ndim-2)+[(0, -ny%factor), (0, -nx%factor)]
+	mask = np.pad(np.ma.getmaskarray(data), pad, constant_values=True)
+	data = np.ma.array(np.pad(np.ma.getdata(data), pad), mask=mask)
+	blocks = data.reshape(data.shape[:-2]+(data.shape[-2]//factor, factor, data.shape[-1]//factor, factor))
+	if method == "mean":
+		total = blocks.sum(axis=-1).sum(axis=-2)
+		count = blocks.count(axis=-1).sum(axis=-2)
+		return np.ma.masked_where(count == 0, np.ma.getdata(total)/np.maximum(count, 1))
+	if method == "min":
+		return blocks.min(axis=-1).min(axis=-2)
+	if method == "max":
+		return blocks.max(axis=-1).max(axis=-2)
+	raise Exception(f"PyramidError: Unknown method {method}, expected one of {METHODS}.")
+
+def coarsen_coordinates(coords : np.ndarray, factor : int):
+	"""
+	Return the block-averaged coordinates of a level. The last block may be incomplete.
+	"""
+	coords = np.asarray(coords, dtype=np.float64)
+	pad = -len(coords)%factor
+	padded = np.ma.array(np.concatenate([coords, np.zeros(pad)]), mask=[False]*len(coords)+[True]*pad)
+	return np.ma.getdata(padded.reshape(-1, factor).mean(axis=1))
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
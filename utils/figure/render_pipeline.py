@@ -0,0 +1,125 @@
+# Render pipeline: data side of the rendering run on a worker pool
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+###############
+## Constants ##
+###############
+
+#############
+## Classes ##
+#############
+
+class RenderCancelled(Exception):
+	"""
+	Raised inside a job when a newer job has been submitted, or when the pipeline has been cancelled.
+	"""
+	pass
+
+class RenderPipeline():
+	"""
+	Run expensive rendering stages (netCDF reads, transformations, projections) on a worker thread.
+
+	Only the latest submitted job is relevant: older jobs are cancelled at their next progress report,
+	and their callbacks are never called. Callbacks are passed to :scheduler: (e.g. wx.CallAfter) so that
+	they run on the GUI thread; without scheduler, they are called from the worker thread.
+	"""
+	def __init__(self, scheduler = None, max_workers : int = 1):
+		self.scheduler = scheduler
+		self.generation = 0
+		# A single worker keeps netCDF accesses sequential
+		self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+		self._future = None
+		self._lock = threading.Lock()
+
+	def submit(self, prepare, on_done, on_progress = None, on_error = None):
+		"""
+		Submit a job and cancel the previous ones.
+		:prepare: takes a progress callable (fraction, message) and returns the result given to :on_done:.
+		"""
+		with self._lock:
+			self.generation += 1
+			if self._future is not None:
+				self._future.cancel()
+			self._future = self._executor.submit(self._run, self.generation, prepare, on_done, on_progress, on_error)
+			return self._future
+
+	def run(self, prepare):
+		"""
+		Run a job synchronously in the calling thread, e.g. for headless rendering. Return its result.
+		"""
+		return prepare(lambda fraction, message: None)
+
+	def cancel(self):
+		"""
+		Cancel the current job, if any.
+		"""
+		with self._lock:
+			self.generation += 1
+			if self._future is not None:
+				self._future.cancel()
+				self._future = None
+
+	def shutdown(self):
+		"""
+		Cancel the current job and release the worker.
+		"""
+		self.cancel()
+		self._executor.shutdown(wait=False)
+
+	def is_busy(self):
+		"""
+		Return True if a job is pending or running.
+		"""
+		future = self._future
+		return future is not None and not future.done()
+
+	def is_current(self, generation : int):
+		return generation == self.generation
+
+	def _run(self, generation : int, prepare, on_done, on_progress, on_error):
+		def progress(fraction, message):
+			if not self.is_current(generation):
+				raise RenderCancelled()
+			if on_progress is not None:
+				self._dispatch(generation, on_progress, fraction, message)
+		try:
+			result = prepare(progress)
+		except RenderCancelled:
+			return None
+		except Exception as e:
+			if on_error is not None:
+				self._dispatch(generation, on_error, e)
+			return None
+		self._dispatch(generation, on_done, result)
+		return result
+
+	def _dispatch(self, generation : int, callback, *args):
+		"""
+		Call :callback: through the scheduler, unless the job became stale in the meantime.
+		"""
+		def call():
+			if self.is_current(generation):
+				callback(*args)
+		if self.scheduler is not None:
+			self.scheduler(call)
+		else:
+			call()
+
+###############
+## Functions ##
+###############
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
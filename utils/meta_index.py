@@ -0,0 +1,126 @@
+# Persistent index of dataset headers (metadata), stored in a local sqlite database
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+# Custom imports
+import cache_tools
+
+###############
+## Constants ##
+###############
+
+INDEX_PATH = os.path.join(cache_tools.CACHE_PATH, "meta_index.sqlite")
+
+#############
+## Classes ##
+#############
+
+class MetaIndex():
+	"""
+	On-disk index of dataset metadata, keyed by file path, size and modification time:
+	an entry is ignored as soon as its file is modified.
+	Each entry stores the metadata dictionary returned by nc_tools.get_meta and a dictionary of dataset information.
+	"""
+	def __init__(self, path : str = INDEX_PATH):
+		self.path = path
+		self._lock = threading.Lock()
+
+	def _connect(self):
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		connection = sqlite3.connect(self.path, timeout=30)
+		connection.execute(
+						   "CREATE TABLE IF NOT EXISTS files ("
+						   "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, meta TEXT, info TEXT)"
+						   )
+		return connection
+
+	def get(self, full_path : str):
+		"""
+		Return the (metadata, information) of a file, or None if it is not indexed or has changed since.
+		"""
+		try:
+			path, size, mtime = cache_tools.file_identity(full_path)
+		except OSError:
+			return None
+		with self._lock:
+			connection = self._connect()
+			try:
+				row = connection.execute(
+										 "SELECT meta, info FROM files WHERE path = ? AND size = ? AND mtime = ?",
+										 (path, size, mtime)
+										 ).fetchone()
+			finally:
+				connection.close()
+		if row is None:
+			return None
+		return _decode_meta(json.loads(row[0])), json.loads(row[1])
+
+	def put(self, full_path : str, meta : dict, info : dict):
+		"""
+		Store the metadata and information of a file, replacing any previous entry.
+		"""
+		path, size, mtime = cache_tools.file_identity(full_path)
+		with self._lock:
+			connection = self._connect()
+			try:
+				with connection:
+					connection.execute(
+									   "INSERT OR REPLACE INTO files (path, size, mtime, meta, info) VALUES (?, ?, ?, ?, ?)",
+									   (path, size, mtime, json.dumps(meta, default=_to_json), json.dumps(info, default=_to_json))
+									   )
+			finally:
+				connection.close()
+
+	def paths(self):
+		"""
+		Return the list of indexed paths.
+		"""
+		with self._lock:
+			connection = self._connect()
+			try:
+				return [row[0] for row in connection.execute("SELECT path FROM files")]
+			finally:
+				connection.close()
+
+###############
+## Functions ##
+###############
+
+def _to_json(value):
+	"""
+	JSON fallback for values found in netCDF attributes (numpy scalars and arrays, bytes).
+	"""
+	if isinstance(value, np.generic):
+		return value.item()
+	if isinstance(value, np.ndarray):
+		return value.tolist()
+	if isinstance(value, bytes):
+		return value.decode(errors='replace')
+	return str(value)
+
+def _decode_meta(meta : dict):
+	"""
+	Restore the tuples of a metadata dictionary read from JSON.
+	"""
+	for var_meta in meta.values():
+		var_meta['dimensions'] = tuple(var_meta['dimensions'])
+		var_meta['shape'] = tuple(var_meta['shape'])
+	return meta
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
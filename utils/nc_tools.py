@@ -5,30 +5,503 @@
 #############
 
 import netCDF4 as nc
-from datetime import date, timedelta
+import numpy as np
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Custom imports
+import cache_tools
+import meta_index
 
 ###############
 ## Constants ##
 ###############
 
+# netCDF and HDF5 libraries are not thread-safe: reads from worker threads are serialized
+READ_LOCK = threading.RLock()
+
+MAX_OPEN_FILES = 8 # Maximum number of member files opened at once by a virtual dataset
+
+DEFAULT_TIME_UNITS = "hours since 1900-01-01 00:00:00.0" # ERA5 time units
+# Number of seconds of CF time units
+TIME_UNITS = {
+	'seconds': 1, 'second': 1, 'secs': 1, 'sec': 1, 's': 1,
+	'minutes': 60, 'minute': 60, 'mins': 60, 'min': 60,
+	'hours': 3600, 'hour': 3600, 'hrs': 3600, 'hr': 3600, 'h': 3600,
+	'days': 86400, 'day': 86400, 'd': 86400
+}
+# Names of the (longitude, latitude) coordinate variables
+COORDINATE_NAMES = [('lon', 'lat'), ('longitude', 'latitude')]
+# Calendars matching numpy datetime64 (proleptic gregorian)
+NUMPY_CALENDARS = ['standard', 'gregorian', 'proleptic_gregorian']
+
+# Headers of known files are read from this index instead of the files themselves
+META_INDEX = meta_index.MetaIndex()
+INFO_VERSION = 2 # Version of the dataset information format, older index entries are refreshed
+
+# Chunk stores attached to variables, by variable id: (variable, store)
+_STORES = {}
+
+# Pseudo-variables (e.g. temporal aggregations) of datasets, by dataset id: (dataset, {name: dataset holding the variable})
+_PSEUDO_VARIABLES = {}
+
+# Time series of grid points, read by blocks of timesteps (one year of hourly data) and cached per point
+POINT_BLOCK = 8760
+POINT_CACHE = cache_tools.LRUCache(max_items=64)
+
 #############
 ## Classes ##
 #############
 
+class FilePool():
+	"""
+	Bounded pool of open netCDF files: the least recently used file is closed when the pool is full.
+	"""
+	def __init__(self, max_open : int = MAX_OPEN_FILES):
+		self.max_open = max_open
+		self._files = OrderedDict()
+		self._lock = threading.RLock()
+
+	def get(self, path : str):
+		"""
+		Return the open dataset of :path:, opening it if necessary.
+		The read lock is taken first, as by read_slice which may call this method.
+		"""
+		with READ_LOCK, self._lock:
+			if path in self._files:
+				self._files.move_to_end(path)
+				return self._files[path]
+			ds = nc.Dataset(path)
+			self._files[path] = ds
+			while len(self._files) > self.max_open:
+				_, old_ds = self._files.popitem(last=False)
+				old_ds.close()
+			return ds
+
+	def close(self):
+		"""
+		Close all open files.
+		"""
+		with READ_LOCK, self._lock:
+			for ds in self._files.values():
+				ds.close()
+			self._files.clear()
+
+class TimestepList():
+	"""
+	Lazily formatted list of timestep labels '{index} : date', backed by a datetime64 array.
+	Labels are only built when accessed, and dates are looked up by binary search.
+	"""
+	def __init__(self, times : np.ndarray):
+		self.times = times
+		# Daily (or coarser) data is labelled with dates only
+		self.unit = 'D' if len(times) == 0 or np.all(times == times.astype('datetime64[D]')) else 'm'
+		self._order = None if len(times) < 2 or np.all(times[1:] >= times[:-1]) else np.argsort(times, kind='stable')
+
+	def __len__(self):
+		return len(self.times)
+
+	def __iter__(self):
+		for i in range (len(self)):
+			yield self[i]
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[i] for i in range (*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		return f"{index} : {self.get_date(index)}"
+
+	def get_date(self, index : int):
+		"""
+		Return the formatted date of a timestep.
+		"""
+		return np.datetime_as_string(self.times[index], unit=self.unit).replace('T', ' ')
+
+	def index_of(self, date):
+		"""
+		Return the index of the timestep closest to :date: (a datetime64 or a string such as '2019-01-15 12:00').
+		"""
+		if len(self) == 0:
+			raise Exception("DatasetError: The time axis is empty.")
+		if isinstance(date, str):
+			try:
+				date = np.datetime64(date.strip().replace(' ', 'T'))
+			except ValueError:
+				raise ValueError(f"Invalid date: {date}")
+		date = np.datetime64(date, 's')
+		times = self.times if self._order is None else self.times[self._order]
+		right = int(np.clip(np.searchsorted(times, date), 0, len(times)-1))
+		left = max(right-1, 0)
+		closest = left if abs(times[left]-date) <= abs(times[right]-date) else right
+		return closest if self._order is None else int(self._order[closest])
+
+class VirtualVariable():
+	"""
+	Variable of a virtual dataset. Variables depending on time are concatenated along the merged time axis,
+	other ones (coordinates, levels...) are read from the first member file.
+	"""
+	def __init__(self, vds, name : str, template : nc.Variable):
+		self.vds = vds
+		self.name = name
+		self.dimensions = template.dimensions
+		self.dtype = template.dtype
+		self._attributes = {attr: template.getncattr(attr) for attr in template.ncattrs()}
+		self.is_temporal = len(self.dimensions) > 0 and self.dimensions[0] == 'time'
+		if self.is_temporal:
+			self.shape = (len(vds.time_values),)+tuple(template.shape[1:])
+		else:
+			self.shape = tuple(template.shape)
+
+	def __len__(self):
+		return self.shape[0]
+
+	def __getattr__(self, name : str):
+		# Attribute access (var.units...) like netCDF4 variables
+		attributes = self.__dict__.get('_attributes', {})
+		if name in attributes:
+			return attributes[name]
+		raise AttributeError(name)
+
+	def ncattrs(self):
+		return list(self._attributes.keys())
+
+	def getncattr(self, attr : str):
+		return self._attributes[attr]
+
+	def __getitem__(self, key):
+		if self.name == 'time':
+			return self.vds.time_values[key]
+		if not self.is_temporal:
+			return self.vds.pool.get(self.vds.paths[0])[self.name][key]
+		if not isinstance(key, tuple):
+			key = (key,)
+		time_key, rest = key[0], key[1:]
+		if isinstance(time_key, (int, np.integer)):
+			path, local_index = self.vds.locate(int(time_key))
+			return self.vds.pool.get(path)[self.name][(local_index,)+rest]
+		indices = np.arange(len(self))[time_key]
+		pieces = []
+		for path, local_slice in self.vds.group_steps(indices):
+			pieces.append(self.vds.pool.get(path)[self.name][(local_slice,)+rest])
+		return np.ma.concatenate(pieces, axis=0)
+
+class VirtualDataset():
+	"""
+	Dataset made of several netCDF files with the same variables and grids (e.g. one CDS download per month),
+	concatenated along time. Only time coordinates are read when building it: member files are opened on demand,
+	through a bounded pool of file handles.
+	"""
+	def __init__(self, paths : list, max_open : int = MAX_OPEN_FILES):
+		self.pool = FilePool(max_open)
+		self.time_units = None
+		self.calendar = 'standard'
+		file_indices, local_indices, values = [], [], []
+		for i, path in enumerate(paths):
+			with READ_LOCK:
+				ds = self.pool.get(path)
+				time = ds['time']
+				time_values = np.ma.getdata(time[:])
+				units = getattr(time, 'units', None)
+				calendar = getattr(time, 'calendar', 'standard')
+			if self.time_units is None:
+				self.time_units = units
+				self.calendar = calendar
+			elif units != self.time_units:
+				# Express all timesteps in the units of the first file
+				dates = nc.num2date(time_values, units, self.calendar)
+				time_values = nc.date2num(dates, self.time_units, self.calendar)
+			file_indices.append(np.full(len(time_values), i))
+			local_indices.append(np.arange(len(time_values)))
+			values.append(np.asarray(time_values, dtype=np.float64))
+		file_indices = np.concatenate(file_indices)
+		local_indices = np.concatenate(local_indices)
+		values = np.concatenate(values)
+
+		# Sort timesteps, files may be given in any order; duplicated timesteps are read from the first file
+		order = np.argsort(values, kind='stable')
+		keep = np.ones(len(order), dtype=bool)
+		keep[1:] = np.diff(values[order]) != 0
+		order = order[keep]
+
+		self.paths = list(paths)
+		self.time_values = values[order]
+		self.file_indices = file_indices[order]
+		self.local_indices = local_indices[order]
+
+		with READ_LOCK:
+			first = self.pool.get(self.paths[0])
+			self.dimensions = {name: len(dim) for name, dim in first.dimensions.items()}
+			self.variables = OrderedDict((name, VirtualVariable(self, name, var)) for name, var in first.variables.items())
+		self.dimensions['time'] = len(self.time_values)
+
+	def __getitem__(self, name : str):
+		return self.variables[name]
+
+	def filepath(self):
+		return self.paths[0]
+
+	def locate(self, time_index : int):
+		"""
+		Return the member file and local time index of a global time index.
+		"""
+		return self.paths[self.file_indices[time_index]], int(self.local_indices[time_index])
+
+	def group_steps(self, indices : np.ndarray):
+		"""
+		Group global time indices into reads of consecutive timesteps in the same member file.
+		Yield (path, local slice) in the order of :indices:.
+		"""
+		if len(indices) == 0:
+			return
+		files = self.file_indices[indices]
+		locals_ = self.local_indices[indices]
+		breaks = np.nonzero((np.diff(files) != 0) | (np.diff(locals_) != 1))[0]+1
+		for run in np.split(np.arange(len(indices)), breaks):
+			start = int(locals_[run[0]])
+			yield self.paths[files[run[0]]], slice(start, start+len(run))
+
+	def close(self):
+		self.pool.close()
+
 ###############
 ## Functions ##
 ###############
 
-def open_dataset(full_path : str):
+def open_dataset(full_path):
 	"""
 	Open dataset using full path to the file.
+	A list of paths is opened as a single virtual dataset, concatenated along time.
 	"""
 	try:
-		ds = nc.Dataset(full_path)
+		with READ_LOCK:
+			if isinstance(full_path, (list, tuple)):
+				ds = VirtualDataset(full_path) if len(full_path) > 1 else nc.Dataset(full_path[0])
+			else:
+				ds = nc.Dataset(full_path)
 	except Exception as e:
 		raise e
 	return ds
 
+def close_dataset(ds : nc.Dataset):
+	"""
+	Close a dataset while holding the read lock.
+	"""
+	with READ_LOCK:
+		ds.close()
+
+def read_slice(variable : nc.Variable, key : tuple):
+	"""
+	Read variable[key] while holding the read lock. To be used by any code which may run concurrently with
+	worker threads, GUI thread included. Variables with an attached chunk store are read from it instead.
+	"""
+	attached = _STORES.get(id(variable))
+	if attached is not None and attached[0] is variable:
+		return attached[1].read(key)
+	with READ_LOCK:
+		return variable[key]
+
+def read_point_series(variable : nc.Variable, j : int, i : int, pl_index : int = None, time_slice : slice = slice(None)):
+	"""
+	Read the time series of the grid cell (j, i) of a (time, [level], lat, lon) variable.
+	"""
+	key = (time_slice,)+((pl_index,) if pl_index is not None else ())+(j, i)
+	return read_slice(variable, key)
+
+def get_point_series(ds : nc.Dataset, variable : str, j : int, i : int, pl_index : int = None, progress = None):
+	"""
+	Return the whole time series of the grid cell (j, i) of a variable. Only this cell is requested from the files,
+	by blocks of POINT_BLOCK timesteps: the read can be interrupted through :progress:, an optional callable taking
+	a fraction and a message. Series are cached per dataset, variable, cell and level.
+	"""
+	identities = get_file_identities(ds)
+	key = cache_tools.make_key(identities if identities is not None else id(ds), variable, int(j), int(i), pl_index)
+	series = POINT_CACHE.get(key)
+	if series is not None:
+		return series
+	source = ds[variable]
+	n_steps = source.shape[0]
+	pieces = []
+	for start in range (0, n_steps, POINT_BLOCK):
+		stop = min(start+POINT_BLOCK, n_steps)
+		pieces.append(read_point_series(source, int(j), int(i), pl_index, slice(start, stop)))
+		if progress is not None:
+			progress(stop/n_steps, f"Reading time series ({stop}/{n_steps})")
+	series = np.ma.concatenate(pieces) if pieces else np.ma.masked_array([])
+	POINT_CACHE.put(key, series)
+	return series
+
+def attach_store(variable : nc.Variable, store):
+	"""
+	Serve the reads of :variable: through read_slice from :store:, a local copy with a read(key) method (see chunk_store).
+	"""
+	_STORES[id(variable)] = (variable, store)
+
+def detach_stores():
+	"""
+	Read all variables from their datasets again.
+	"""
+	_STORES.clear()
+
+def attach_pseudo_variable(ds : nc.Dataset, name : str, source : nc.Dataset):
+	"""
+	Make the variable :name: of :source: selectable along the variables of :ds: (see aggregation).
+	Its time axis is the one of :source:, see resolve_dataset.
+	"""
+	entry = _PSEUDO_VARIABLES.get(id(ds))
+	if entry is None or entry[0] is not ds:
+		entry = (ds, {})
+		_PSEUDO_VARIABLES[id(ds)] = entry
+	previous = entry[1].get(name)
+	if previous is not None and previous is not source:
+		close_dataset(previous)
+	entry[1][name] = source
+
+def get_pseudo_variables(ds : nc.Dataset):
+	"""
+	Return the names of the pseudo-variables attached to a dataset.
+	"""
+	entry = _PSEUDO_VARIABLES.get(id(ds))
+	if entry is None or entry[0] is not ds:
+		return []
+	return list(entry[1].keys())
+
+def resolve_dataset(ds : nc.Dataset, variable : str):
+	"""
+	Return the dataset holding :variable: the dataset of a pseudo-variable, :ds: otherwise.
+	"""
+	entry = _PSEUDO_VARIABLES.get(id(ds))
+	if entry is None or entry[0] is not ds:
+		return ds
+	return entry[1].get(variable, ds)
+
+def detach_pseudo_variables():
+	"""
+	Close the datasets of all pseudo-variables.
+	"""
+	for _, sources in _PSEUDO_VARIABLES.values():
+		for source in sources.values():
+			close_dataset(source)
+	_PSEUDO_VARIABLES.clear()
+
+def is_packed(variable : nc.Variable):
+	"""
+	Return True if a variable is stored as 16-bit integers with scale_factor and/or add_offset (e.g. ERA5 files from the CDS).
+	"""
+	attributes = variable.ncattrs()
+	return np.dtype(variable.dtype) == np.int16 and ('scale_factor' in attributes or 'add_offset' in attributes)
+
+def get_packing(variable : nc.Variable):
+	"""
+	Return the packing of a 16-bit integer variable: {'scale_factor', 'add_offset', 'fill_values'}.
+	"""
+	attributes = {attr: variable.getncattr(attr) for attr in variable.ncattrs()}
+	fill_values = {int(nc.default_fillvals['i2'])}
+	for name in ['_FillValue', 'missing_value']:
+		if name in attributes:
+			fill_values.update(int(value) for value in np.ravel(attributes[name]))
+	return {
+		'scale_factor': float(attributes.get('scale_factor', 1.)),
+		'add_offset': float(attributes.get('add_offset', 0.)),
+		'fill_values': sorted(fill_values)
+	}
+
+def read_packed(variable : nc.Variable, key : tuple):
+	"""
+	Read variable[key] as raw 16-bit integers, without unpacking nor masking. Return (raw, packing).
+	The first element of :key: must be a single time index: a virtual variable is read from the member file
+	of this timestep, whose scale_factor and add_offset may differ from the other members.
+	"""
+	if isinstance(variable, VirtualVariable):
+		path, local_index = variable.vds.locate(int(key[0]))
+		variable, key = variable.vds.pool.get(path)[variable.name], (local_index,)+tuple(key[1:])
+	with READ_LOCK:
+		variable.set_auto_maskandscale(False)
+		try:
+			raw = variable[key]
+		finally:
+			variable.set_auto_maskandscale(True)
+		packing = get_packing(variable)
+	return np.asarray(raw), packing
+
+def get_path(ds : nc.Dataset):
+	"""
+	Return the path of a single file dataset, or None (virtual or in-memory datasets).
+	"""
+	if isinstance(ds, VirtualDataset):
+		return None
+	try:
+		return ds.filepath()
+	except (ValueError, AttributeError):
+		return None
+
+def get_file_identities(ds : nc.Dataset):
+	"""
+	Return the identities of the files of a dataset (see cache_tools.file_identity), or None for in-memory datasets.
+	"""
+	paths = ds.paths if isinstance(ds, VirtualDataset) else [get_path(ds)]
+	if None in paths:
+		return None
+	return [cache_tools.file_identity(path) for path in paths]
+
+def _read_meta(ds : nc.Dataset):
+	"""
+	Read metadata from the dataset headers.
+	"""
+	with READ_LOCK:
+		return _read_headers(ds)
+
+def _read_headers(ds : nc.Dataset):
+	meta = {}
+	for var_name in ds.variables.keys():
+		var = ds[var_name]
+		temp_dict = {}
+		temp_dict['dimensions'] = var.dimensions
+		temp_dict['shape'] = var.shape
+		attr_dict = {}
+		for attr in var.ncattrs():
+			attr_dict[attr] = var.getncattr(attr)
+		temp_dict['attributes'] = attr_dict
+		try:
+			temp_dict['chunking'] = var.chunking()
+			temp_dict['compression'] = var.filters()
+		except AttributeError:
+			# Virtual variables have no storage of their own
+			temp_dict['chunking'] = None
+			temp_dict['compression'] = None
+		meta[var_name] = temp_dict
+	return meta
+
+def get_dataset_info(ds : nc.Dataset):
+	"""
+	Return a dictionary of dataset-wide information: dimension sizes, time span, pressure levels and grid extent and resolution.
+	"""
+	info = {}
+	info['version'] = INFO_VERSION
+	with READ_LOCK:
+		info['dimensions'] = {name: dim if isinstance(dim, int) else len(dim) for name, dim in ds.dimensions.items()}
+	info['n_steps'] = 0
+	info['time_start'] = None
+	info['time_end'] = None
+	if 'time' in ds.variables:
+		times = decode_times(ds['time'])
+		info['n_steps'] = len(times)
+		if len(times):
+			info['time_start'] = str(times.min())
+			info['time_end'] = str(times.max())
+	info['levels'] = np.ma.getdata(read_slice(ds['level'], slice(None))).tolist() if 'level' in ds.variables else []
+	info['grid'] = None
+	if has_coordinates(ds):
+		lons, lats = get_coordinates(ds)
+		info['grid'] = {
+			'lon_min': float(lons.min()), 'lon_max': float(lons.max()),
+			'lat_min': float(lats.min()), 'lat_max': float(lats.max()),
+			'lon_step': float(np.median(np.abs(np.diff(lons)))) if len(lons) > 1 else 0.,
+			'lat_step': float(np.median(np.abs(np.diff(lats)))) if len(lats) > 1 else 0.
+		}
+	return info
+
 def get_meta(ds : nc.Dataset):
 	"""
 	Return a ditionary with useful information on the dataset.
@@ -39,28 +512,78 @@ def get_meta(ds : nc.Dataset):
 			'shape': (..., ),
 			'attributes': {
 				'attr': '...'
-			}
+			},
+			'chunking': 'contiguous' or [...],
+			'compression': {...}
 		}
 	}
+	Metadata of files already opened once are read from the metadata index.
 	"""
-	meta = {}
-	for var_name in ds.variables.keys():
-		temp_dict = {}
-		temp_dict['dimensions'] = ds[var_name].dimensions
-		temp_dict['shape'] = ds[var_name].shape
-		attr_dict = {}
-		for attr in ds[var_name].ncattrs():
-			attr_dict[attr] = ds[var_name].getncattr(attr)
-		temp_dict['attributes'] = attr_dict
-		meta[var_name] = temp_dict
+	path = get_path(ds)
+	if path:
+		entry = META_INDEX.get(path)
+		if entry is not None and entry[1].get('version') == INFO_VERSION:
+			return entry[0]
+	meta = _read_meta(ds)
+	if path:
+		try:
+			META_INDEX.put(path, meta, get_dataset_info(ds))
+		except (OSError, sqlite3.Error) as e:
+			print(f"Cache warning: metadata of {path} could not be indexed.\n{e}", flush=True)
 	return meta
 
-def retrieve_meta(full_path : str):
+def retrieve_meta(full_path):
 	"""
-	Create a temporary dataset and retrieve only metadata.
+	Retrieve only metadata. Indexed files are not even opened.
 	"""
+	if isinstance(full_path, str):
+		entry = META_INDEX.get(full_path)
+		if entry is not None and entry[1].get('version') == INFO_VERSION:
+			return entry[0]
 	ds = open_dataset(full_path)
-	return get_meta(ds)
+	try:
+		return get_meta(ds)
+	finally:
+		close_dataset(ds)
+
+def is_indexed(full_path : str):
+	"""
+	Return True if the metadata index holds an up-to-date entry for a file.
+	"""
+	entry = META_INDEX.get(full_path)
+	return entry is not None and entry[1].get('version') == INFO_VERSION
+
+def retrieve_info(full_path : str):
+	"""
+	Retrieve the dataset information of a file (see get_dataset_info), from the metadata index if possible.
+	"""
+	entry = META_INDEX.get(full_path)
+	if entry is None or entry[1].get('version') != INFO_VERSION:
+		retrieve_meta(full_path)
+		entry = META_INDEX.get(full_path)
+	if entry is None or entry[1].get('version') != INFO_VERSION:
+		# The index is not writable: read the file once more
+		ds = open_dataset(full_path)
+		try:
+			return get_dataset_info(ds)
+		finally:
+			close_dataset(ds)
+	return entry[1]
+
+def has_coordinates(ds : nc.Dataset):
+	"""
+	Return True if the dataset has longitude and latitude coordinate variables.
+	"""
+	return any(lon_name in ds.variables and lat_name in ds.variables for lon_name, lat_name in COORDINATE_NAMES)
+
+def get_coordinates(ds : nc.Dataset):
+	"""
+	Return the longitude and latitude arrays of a dataset (lon/lat or longitude/latitude variables).
+	"""
+	for lon_name, lat_name in COORDINATE_NAMES:
+		if lon_name in ds.variables and lat_name in ds.variables:
+			return np.ma.getdata(read_slice(ds[lon_name], slice(None))), np.ma.getdata(read_slice(ds[lat_name], slice(None)))
+	raise Exception("DatasetError: Unable to find longitude and latitude coordinates in this dataset.")
 
 def is_pressure_level(ds : nc.Dataset = None, meta : dict = None):
 	"""
@@ -73,36 +596,70 @@ def is_pressure_level(ds : nc.Dataset = None, meta : dict = None):
 	else:
 		raise Exception("ArgumentsError: You need to pass at least 1 argument.")
 
-def _get_time(time, time_index : int):
+def _parse_epoch(epoch : str):
+	"""
+	Parse the reference date of CF time units (e.g. '1900-01-01 00:00:00.0' or '1900-1-1').
+	"""
+	parts = epoch.strip().replace('T', ' ').split()
+	year, month, day = (int(elt) for elt in parts[0].split('-'))
+	clock = parts[1].rstrip('Z') if len(parts) > 1 and ':' in parts[1] else "0:0:0"
+	hours, minutes, seconds = (clock.split(':')+['0', '0'])[:3]
+	return np.datetime64(f"{year:04d}-{month:02d}-{day:02d}T{int(hours):02d}:{int(minutes):02d}:{int(float(seconds)):02d}", 's')
+
+def decode_times(time):
 	"""
-	Return the time associated with the passed time index.
+	Decode a CF time variable (values, 'units' and 'calendar' attributes) into a datetime64[s] array.
+	Gregorian calendars are decoded in one vectorized operation; other calendars go through netCDF4.num2date.
 	"""
-	offset_date = date(1900, 1, 1)
-	hours_since = time[time_index]
-	td = timedelta(days=int(hours_since/24))
-	return (offset_date+td).isoformat()
+	values = np.ma.getdata(read_slice(time, slice(None)))
+	with READ_LOCK:
+		units = getattr(time, 'units', DEFAULT_TIME_UNITS)
+		calendar = str(getattr(time, 'calendar', 'standard')).lower()
+	unit, _, epoch = units.partition(' since ')
+	unit = unit.strip().lower()
+	if calendar in NUMPY_CALENDARS and unit in TIME_UNITS and epoch:
+		seconds = np.round(np.asarray(values, dtype=np.float64)*TIME_UNITS[unit]).astype(np.int64)
+		return _parse_epoch(epoch)+seconds.astype('timedelta64[s]')
+	dates = nc.num2date(values, units, calendar)
+	return np.array([np.datetime64(d.strftime("%Y-%m-%dT%H:%M:%S"), 's') for d in dates], dtype='datetime64[s]')
 
 def get_timesteps(ds : nc.Dataset):
 	"""
 	Return the list of all timesteps with format : '{index} : date'.
+	The list is lazily formatted: see TimestepList.
+	"""
+	return TimestepList(decode_times(ds['time']))
+
+def get_variables(ds : nc.Dataset = None, meta : dict = None):
+	"""
+	Return the list of variables of a dataset (coordinate variables excluded).
 	"""
-	time = ds['time'][:]
-	timesteps = [f"{i} : "+_get_time(time, i) for i in range (len(time))]
-	return timesteps
+	if ds:
+		dimensions = ds.dimensions
+		l_var = list(ds.variables.keys())
+	elif meta:
+		dimensions = set(dim for var_meta in meta.values() for dim in var_meta['dimensions'])
+		l_var = list(meta.keys())
+	else:
+		raise Exception("ArgumentsError: You need to pass at least 1 argument.")
+	return [var_name for var_name in l_var if var_name not in dimensions]
 
-def get_variables(ds : nc.Dataset):
+def get_vector_pair(variable : str, ds : nc.Dataset = None, meta : dict = None):
 	"""
-	Return the list of variables of a dataset.
+	Return the (u, v) names of the wind components :variable: belongs to (e.g. 'v10' -> ('u10', 'v10')), or None.
 	"""
-	l_var = list(ds.variables.keys())
-	l_index_to_pop = []
-	for i in range (len(l_var)):
-		if l_var[i] in ds.dimensions:
-			l_index_to_pop.append(i)
-	l_index_to_pop.sort(reverse=True)
-	for index in l_index_to_pop:
-		l_var.pop(index)
-	return l_var
+	if ds:
+		names = ds.variables.keys()
+	elif meta:
+		names = meta.keys()
+	else:
+		raise Exception("ArgumentsError: You need to pass at least 1 argument.")
+	if variable[:1] not in ['u', 'v']:
+		return None
+	pair = ('u'+variable[1:], 'v'+variable[1:])
+	if pair[0] in names and pair[1] in names:
+		return pair
+	return None
 
 def get_pressure_levels(ds : nc.Dataset):
 	"""
@@ -110,7 +667,7 @@ def get_pressure_levels(ds : nc.Dataset):
 	"""
 	if not is_pressure_level(ds):
 		raise Exception("DatasetError: Unable to retrieve pressure levels from this dataset.")
-	arr = ds['level'][:]
+	arr = read_slice(ds['level'], slice(None))
 	levels = [f"{i} : "+str(arr[i]) for i in range ((arr.shape)[0])]
 	return levels
 
@@ -23,13 +23,18 @@ from matplotlib.figure import Figure as MplFig
 
 # Other imports
 import netCDF4 as nc # Not used for its functions, only for typing
+import numpy as np
 import json # Used to retrieve map presets
 
 # Custom imports
 from features import subpanels
+from dialogs import SeriesDialog
 from figure import display_tools
+from figure import render_pipeline
+from figure import pyramid_tools
+from figure import grid_tools
 from figure import *
-import nc_tools, wx_tools
+import nc_tools, wx_tools, prefetch_tools, stats_tools
 
 ###############
 ## Constants ##
@@ -38,6 +43,15 @@ import nc_tools, wx_tools
 MAP_PREVIEW_PATH = os.path.join(os.path.dirname(__file__), "..\\ressources\\images\\maps\\")
 MAP_PRESETS_PATH = os.path.join(os.path.dirname(__file__), "figure\\map_presets.json")
 
+# Options which can be applied to an existing plot, without rebuilding the map
+DATA_OPTIONS = ["time_index", "pl_index", "coef", "offset", "packed"]
+STYLE_OPTIONS = ["cmap", "norm", "c_min", "c_max", "midpoint"]
+# Colour limits, pre-filled from the statistics of the variable
+LIMIT_OPTIONS = ["c_min", "c_max", "midpoint"]
+
+ZOOM_DELAY = 300 # Delay (ms) without zoom or pan before the view is rendered again
+READOUT_DELAY = 40 # Minimum delay (ms) between two updates of the hover readout
+
 #############
 ## Classes ##
 #############
@@ -56,12 +70,19 @@ class DefaultPanel(wx.Panel):
 		tooltip_load = wx.ToolTip("Choose the data file you want to load.\nOnly .nc files are allowed.")
 		self.button_load.SetToolTip(tooltip_load)
 
+		self.button_catalog = wx.Button(self, label="Open catalog", size=(300, 50))
+		tooltip_catalog = wx.ToolTip("Choose a data directory and search its files.\nExample: t2m, Jan 2019, 850 hPa")
+		self.button_catalog.SetToolTip(tooltip_catalog)
+		self.text_catalog = wx.StaticText(self, label="")
+
 		self.button_pres = wx.Button(self, label="Preset generator", size=(300, 50))
 		tooltip_pres = wx.ToolTip("Genereate a new map preset.\nArguments have to be entered one by one.")
 		self.button_pres.SetToolTip(tooltip_pres)
 
 		# Add features to the panel sizer
 		self.sizer.Add(self.button_load, 0, wx.ALL|wx.CENTER, 20)
+		self.sizer.Add(self.button_catalog, 0, wx.LEFT|wx.RIGHT|wx.TOP|wx.CENTER, 20)
+		self.sizer.Add(self.text_catalog, 0, wx.ALL|wx.CENTER, 5)
 		self.sizer.Add(self.button_pres, 0, wx.ALL|wx.CENTER, 20)
 		self.SetSizer(self.sizer)
 
@@ -139,6 +160,28 @@ class OverviewPanel(wx.Panel):
 		self.var_panels[var_name].Show()
 		self.Layout()
 
+	def set_stats(self, variable : str, stats : list):
+		"""
+		Display the statistics of a variable (see stats_tools.compute_stats).
+		"""
+		if not self or variable not in self.var_panels:
+			return
+		if len(stats) == 1:
+			lines = [stats_tools.format_stats(stats[0])]
+		else:
+			levels = nc_tools.get_pressure_levels(self.dataset)
+			lines = [f"{level} hPa : {stats_tools.format_stats(level_stats)}" for level, level_stats in zip(levels, stats)]
+		self.var_panels[variable].set_stats(lines)
+		self.Layout()
+
+	def set_stats_message(self, variable : str, message : str):
+		"""
+		Display a message in place of the statistics of a variable (e.g. the progress of their computation).
+		"""
+		if not self or variable not in self.var_panels:
+			return
+		self.var_panels[variable].set_stats([message])
+
 
 class OptionPanel(wx.Panel):
 	"""
@@ -152,6 +195,8 @@ class OptionPanel(wx.Panel):
 		self.metadata = metadata
 		self.options = {} # It will gather all the options set by the user
 		self.init_options() # Initialize the options dictionary
+		self.stats = {} # Statistics of the variables, filled in the background
+		self.user_limits = False # True once colour limits have been typed for the current variable
 		
 		self.var_ids = {} # Dictionary with id keys and their corresponing variable
 		self.c_boxes = [] # List of ComboBox used
@@ -168,7 +213,8 @@ class OptionPanel(wx.Panel):
 		
 		# Variables
 		text_variables = wx.StaticText(parent=stbox_gen, label="Variable : ")
-		l_variables = nc_tools.get_variables(self.dataset)
+		# Pseudo-variables (temporal aggregations) are listed after the variables of the dataset
+		l_variables = nc_tools.get_variables(meta=self.metadata)+nc_tools.get_pseudo_variables(self.dataset)
 		self.c_box_variables = wx.ComboBox(
 									  parent=stbox_gen,
 									  id=wx.ID_ANY,
@@ -178,17 +224,17 @@ class OptionPanel(wx.Panel):
 		self.var_ids[self.c_box_variables.GetId()] = "variable"
 		self.c_boxes.append(self.c_box_variables)
 
-		# Time
+		# Time: timesteps are displayed in a virtual list, long time axes are never formatted at once
 		text_time = wx.StaticText(parent=stbox_gen, label="Time index : ")
-		timesteps =  nc_tools.get_timesteps(self.dataset)
-		self.c_box_time = wx.ComboBox(
-									  parent=stbox_gen,
-									  id=wx.ID_ANY,
-									  choices=timesteps,
-									  style=wx.CB_DROPDOWN | wx.CB_READONLY
-									  )
+		self.timesteps_dataset = nc_tools.resolve_dataset(self.dataset, self.options['variable'])
+		self.timesteps = nc_tools.get_timesteps(self.timesteps_dataset)
+		self.c_box_time = wx.ComboCtrl(parent=stbox_gen, id=wx.ID_ANY, size=(200, -1), style=wx.TE_PROCESS_ENTER)
+		self.time_popup = wx_tools.VirtualListPopup(items=self.timesteps, on_select=self.on_time_selected)
+		self.c_box_time.SetPopupControl(self.time_popup)
+		tooltip_time = wx.ToolTip("Choose a timestep, or type a date (YYYY-MM-DD hh:mm) and press Enter.")
+		self.c_box_time.SetToolTip(tooltip_time)
+		self.c_box_time.Bind(wx.EVT_TEXT_ENTER, handler=self.on_time_entered)
 		self.var_ids[self.c_box_time.GetId()] = "time_index"
-		self.c_boxes.append(self.c_box_time)
 
 		# Pressure Level (if necessary) 
 		if nc_tools.is_pressure_level(meta=self.metadata):
@@ -319,7 +365,7 @@ class OptionPanel(wx.Panel):
 		self.c_boxes.append(self.c_box_cmap)
 
 		text_pltype = wx.StaticText(parent=pnl_other, label="Plot type : ")
-		plot_types = ["pcolormesh"]
+		plot_types = PLOT_TYPES
 		self.c_box_pltype = wx.ComboBox(
 									  parent=pnl_other,
 									  id=wx.ID_ANY,
@@ -330,6 +376,25 @@ class OptionPanel(wx.Panel):
 		self.var_ids[self.c_box_pltype.GetId()] = "plot_type"
 		self.c_boxes.append(self.c_box_pltype)
 
+		text_pyramid = wx.StaticText(parent=pnl_other, label="Overviews : ")
+		self.c_box_pyramid = wx.ComboBox(
+									  parent=pnl_other,
+									  id=wx.ID_ANY,
+									  choices=["off"]+pyramid_tools.METHODS,
+									  style=wx.CB_DROPDOWN | wx.CB_READONLY,
+									  size=(100, 25)
+									  )
+		tooltip_pyramid = wx.ToolTip("Draw zoomed out maps from coarser, precomputed versions of the data.\nThey are built once per variable, on first use.")
+		self.c_box_pyramid.SetToolTip(tooltip_pyramid)
+		self.var_ids[self.c_box_pyramid.GetId()] = "pyramid"
+		self.c_boxes.append(self.c_box_pyramid)
+
+		self.check_packed = wx.CheckBox(parent=pnl_other, id=wx.ID_ANY, label=" Packed data")
+		tooltip_packed = wx.ToolTip("Read 16-bit packed variables (ERA5 files) as raw integers and unpack them through a table:\nfaster, and less memory per frame. Other variables are read as usual.")
+		self.check_packed.SetToolTip(tooltip_packed)
+		self.var_ids[self.check_packed.GetId()] = "packed"
+		self.chk_boxes.append(self.check_packed)
+
 		self.check_colorbar = wx.CheckBox(parent=pnl_other, id=wx.ID_ANY, label=" Colorbar")
 		self.var_ids[self.check_colorbar.GetId()] = "colorbar"
 		self.chk_boxes.append(self.check_colorbar)
@@ -365,6 +430,10 @@ class OptionPanel(wx.Panel):
 		pnl_other_sizer.Add(self.c_box_cmap, 0)
 		pnl_other_sizer.Add(text_pltype, 0)
 		pnl_other_sizer.Add(self.c_box_pltype, 0)
+		pnl_other_sizer.Add(text_pyramid, 0)
+		pnl_other_sizer.Add(self.c_box_pyramid, 0)
+		pnl_other_sizer.Add(self.check_packed, 0)
+		pnl_other_sizer.Add((0, 0), 0)
 		pnl_other_sizer.Add(self.check_colorbar, 0)
 		pnl_other_sizer.Add(self.check_norm, 0)
 		pnl_other_sizer.Add(text_midpoint, 0)
@@ -405,6 +474,11 @@ class OptionPanel(wx.Panel):
 		# PLot Button
 
 		self.button = wx.Button(parent=self, label="Draw", size=(200, 30))
+		# Daily/monthly statistics, climatology and anomalies, added to the variables once computed
+		self.button_aggregate = wx.Button(parent=self, label="Aggregate...", size=(200, 30))
+		button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+		button_sizer.Add(self.button, 0, wx.ALIGN_CENTER | wx.ALL, 10)
+		button_sizer.Add(self.button_aggregate, 0, wx.ALIGN_CENTER | wx.ALL, 10)
 
 		# --------------------------------------- #
 		# Bindings
@@ -421,7 +495,7 @@ class OptionPanel(wx.Panel):
 		self.main_sizer.Add(stbox_gen_sizer, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, 20)
 		self.main_sizer.Add(stbox_data_corr_sizer, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 20)
 		self.main_sizer.Add(stbox_proj_sizer, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 20)
-		self.main_sizer.Add(self.button, 0, wx.ALIGN_CENTER | wx.ALL, 20)
+		self.main_sizer.Add(button_sizer, 0, wx.ALIGN_CENTER | wx.ALL, 10)
 		self.SetSizer(self.main_sizer)
 
 	def on_option_change(self, event):
@@ -438,9 +512,35 @@ class OptionPanel(wx.Panel):
 			self.display_map_preview(val)
 		else:
 			val = element.GetValue()
+		if var_name in LIMIT_OPTIONS:
+			# Typed limits are kept until another variable is chosen
+			self.user_limits = True
 		self.update_option(var_name, val)
 		event.Skip()
 
+	def on_time_selected(self, index : int):
+		"""
+		Timestep chosen in the time list.
+		"""
+		self.update_option("time_index", index)
+
+	def on_time_entered(self, event):
+		"""
+		Date (or timestep label) typed in the time entry: select the closest timestep.
+		"""
+		text = self.c_box_time.GetValue()
+		try:
+			if " : " in text:
+				index = int(text.split(" : ")[0])
+			else:
+				index = self.timesteps.index_of(text)
+			if not 0 <= index < len(self.timesteps):
+				raise ValueError(f"Invalid timestep: {index}")
+		except ValueError as e:
+			wx.MessageBox(message=f"{e}\nExpected format: YYYY-MM-DD hh:mm", caption="Error", style=wx.OK | wx.ICON_ERROR)
+			return
+		self.time_popup.select(index)
+
 	def on_norm_change(self, event):
 		"""
 		Enable or disable text entries for colorbar setup.
@@ -453,29 +553,25 @@ class OptionPanel(wx.Panel):
 		self.te_max.Enable(val)
 		event.Skip()
 
+	def select(self, variable : str = None, date : str = None, pl_index : int = None):
+		"""
+		Select a variable, the timestep closest to :date: and a pressure level, as if chosen by the user.
+		"""
+		if variable is not None:
+			self.c_box_variables.SetStringSelection(variable)
+			self.update_option("variable", variable)
+		if date is not None and len(self.timesteps):
+			self.time_popup.select(self.timesteps.index_of(date))
+		if pl_index is not None and self.c_box_levels:
+			self.c_box_levels.SetSelection(pl_index)
+			self.update_option("pl_index", pl_index)
+
 	def init_options(self):
 		"""
 		Initialize the map options.
 		"""
-		self.options = {
-			"variable": nc_tools.get_variables(self.dataset)[0],
-			"time_index": None,
-			"pl_index": None,
-			"lon_offset": 0,
-			"coef": 1,
-			"offset": 0,
-			"preset": "default",
-			"resolution": 'i',
-			"countries": False,
-			"rivers": False,
-			"cmap": "seismic",
-			"colorbar": False,
-			"norm": False,
-			"c_min": 0,
-			"c_max": 50,
-			"midpoint": 25,
-			"plot_type": "pcolormesh"
-		}
+		self.options = DEFAULT_MAP_OPTIONS.copy()
+		self.options["variable"] = nc_tools.get_variables(meta=self.metadata)[0]
 
 	def update_option(self, var_name : str, val):
 		"""
@@ -485,6 +581,63 @@ class OptionPanel(wx.Panel):
 			self.options[var_name] = val
 		except Exception as e:
 			raise e
+		if var_name == 'variable':
+			self.user_limits = False
+			self.update_timesteps()
+		if var_name in ['variable', 'pl_index', 'coef', 'offset']:
+			self.fill_colour_limits()
+
+	def update_timesteps(self):
+		"""
+		List the timesteps of the selected variable: pseudo-variables have their own time axis.
+		When the time axis changes, the timestep closest to the selected date is selected.
+		"""
+		dataset = nc_tools.resolve_dataset(self.dataset, self.options['variable'])
+		if dataset is self.timesteps_dataset:
+			return
+		time_index = self.options['time_index']
+		date = self.timesteps.times[time_index] if time_index is not None and time_index < len(self.timesteps) else None
+		self.timesteps_dataset = dataset
+		self.timesteps = nc_tools.get_timesteps(dataset)
+		self.time_popup.set_items(self.timesteps)
+		if date is not None and len(self.timesteps):
+			self.time_popup.select(self.timesteps.index_of(date))
+		else:
+			self.options['time_index'] = None
+
+	def add_variable(self, variable : str):
+		"""
+		Add a pseudo-variable (see aggregation) to the variable choices, and select it.
+		"""
+		if self.c_box_variables.FindString(variable) == wx.NOT_FOUND:
+			self.c_box_variables.Append(variable)
+		self.select(variable=variable)
+
+	def set_stats(self, variable : str, stats : list):
+		"""
+		Store the statistics of a variable (see stats_tools.compute_stats), and use them for the colour limits.
+		"""
+		if not self:
+			return
+		self.stats[variable] = stats
+		if variable == self.options['variable']:
+			self.fill_colour_limits()
+
+	def fill_colour_limits(self):
+		"""
+		Pre-fill the colour limits with the statistics of the selected variable and level, unless limits have been typed.
+		"""
+		stats = self.stats.get(self.options['variable'])
+		if self.user_limits or stats is None:
+			return
+		level_stats = stats[self.options['pl_index'] or 0] if len(stats) > 1 else stats[0]
+		if level_stats is None:
+			return
+		limits = stats_tools.get_colour_limits(level_stats, coef=self.options['coef'], offset=self.options['offset'])
+		for te, var_name, val in zip([self.te_min, self.te_max, self.te_midpoint], LIMIT_OPTIONS, limits):
+			# No text event: the rendering in progress is not cancelled
+			te.ChangeValue(val)
+			self.options[var_name] = val
 
 	def display_map_preview(self, preset):
 		"""
@@ -508,27 +661,497 @@ class PlotPanel(wx.Panel):
 		self.figure.set_facecolor('xkcd:grey')
 		self.axes = self.figure.add_subplot(111)
 		self.canvas = FigureCanvas(self, -1, self.figure)
+		self.fig = None
+		self.blitter = None
+		self.drawn_options = {} # Options of the figure currently displayed
+		self.home_limits = None # Axis limits of the whole map
+		self.rendered_limits = None # Axis limits for which data has been read
+		self.zoom_timer = None
+
+		# Data is prepared on a worker thread, only the final canvas update runs on the GUI thread
+		self.pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		# Time series of clicked grid points are read on their own worker, without cancelling renderings
+		self.series_pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		# Rendered images are saved to the render cache without blocking the GUI thread
+		self.cache_pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		self.canvas.mpl_connect('button_press_event', self.on_click)
+
+		# Hover readout in the status bar of the frame, refreshed at most every READOUT_DELAY ms
+		self.hover_position = None
+		self.hover_timer = None
+		# Rasters of the readout (see Figure.build_readout) are built on their own worker
+		self.readout_pipeline = render_pipeline.RenderPipeline(scheduler=wx.CallAfter)
+		self.readout_view = None # View of the raster being built
+		self.canvas.mpl_connect('motion_notify_event', self.on_motion)
+		self.canvas.mpl_connect('axes_leave_event', self.on_leave)
 
 		self.main_sizer = wx.BoxSizer(wx.VERTICAL)
 		self.main_sizer.Add(self.canvas, 0, wx.EXPAND)
 
+		# Rendering progress
+		self.gauge = wx.Gauge(parent=self, id=wx.ID_ANY, range=100, size=(300, 15))
+		self.text_progress = wx.StaticText(parent=self, label="")
+		progress_sizer = wx.BoxSizer(wx.HORIZONTAL)
+		progress_sizer.Add(self.gauge, 0, wx.ALIGN_CENTER | wx.LEFT, 20)
+		progress_sizer.Add(self.text_progress, 0, wx.ALIGN_CENTER | wx.LEFT, 10)
+
+		# Time scrubber, with read-ahead of the neighbouring timesteps
+		self.timesteps_dataset = nc_tools.resolve_dataset(self.dataset, self.map_options['variable'])
+		self.timesteps = nc_tools.get_timesteps(self.timesteps_dataset)
+		self.prefetcher = None
+		n_steps = len(self.timesteps)
+		text_scrub = wx.StaticText(parent=self, label="Time index : ")
+		self.slider_time = wx.Slider(parent=self, id=wx.ID_ANY, value=0, minValue=0, maxValue=max(n_steps-1, 1), size=(500, -1))
+		self.spin_time = wx.SpinCtrl(parent=self, id=wx.ID_ANY, min=0, max=max(n_steps-1, 0), initial=0)
+		self.text_time = wx.StaticText(parent=self, label="")
+		self.slider_time.Enable(n_steps > 1)
+		self.spin_time.Enable(n_steps > 1)
+		self.slider_time.Bind(wx.EVT_SLIDER, handler=self.on_time_change)
+		self.spin_time.Bind(wx.EVT_SPINCTRL, handler=self.on_time_change)
+		time_sizer = wx.BoxSizer(wx.HORIZONTAL)
+		time_sizer.Add(text_scrub, 0, wx.ALIGN_CENTER | wx.LEFT, 20)
+		time_sizer.Add(self.slider_time, 0, wx.ALIGN_CENTER | wx.LEFT, 10)
+		time_sizer.Add(self.spin_time, 0, wx.ALIGN_CENTER | wx.LEFT, 10)
+		time_sizer.Add(self.text_time, 0, wx.ALIGN_CENTER | wx.LEFT, 10)
+
 		self.toolbar = None
 		if tb_option:
 			self.add_toolbar()
 			self.main_sizer.Add(self.toolbar, 0, wx.EXPAND | wx.LEFT, 20)
 			self.toolbar.update()
+		self.main_sizer.Add(time_sizer, 0, wx.EXPAND | wx.TOP, 5)
+		self.main_sizer.Add(progress_sizer, 0, wx.EXPAND | wx.TOP, 5)
 
 		self.SetSizer(self.main_sizer)
+		self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
 
-	def draw(self):
+	def draw(self, blocking : bool = False):
 		"""
 		Draw the data and the map.
+		By default, data is prepared in the background and the canvas is updated once it is ready.
+		With :blocking:, everything is done in the calling thread and the figure is returned.
+		"""
+		self.update_timesteps(self.map_options['variable'])
+		# Options may change while the figure is loading: the figure works on a snapshot
+		fig = Figure(figure=self.figure, ax=self.axes, dataset=self.dataset, map_options=dict(self.map_options), presets=self.presets, lazy=True)
+		if blocking:
+			self.show_figure(self.pipeline.run(fig.load))
+			return self.fig
+		cached = self.get_cached_render(fig.map_options)
+		if cached is not None:
+			self.show_cached(cached, fig.map_options)
+			return
+		self.on_progress(0., "Rendering...")
+		self.pipeline.submit(prepare=fig.load, on_done=self.show_figure, on_progress=self.on_progress, on_error=self.on_error)
+
+	def show_figure(self, fig : Figure):
 		"""
-		# Create figure		
-		fig = Figure(figure=self.figure, ax=self.axes, dataset=self.dataset, map_options=self.map_options, presets=self.presets)
+		Draw a loaded figure on the canvas.
+		"""
+		if not self:
+			# The panel has been destroyed while the figure was loading
+			return
+		self.fig = fig
+		fig.draw_map()
 		fig.plot_data()
 		self.figure.tight_layout()
 		self.figure.canvas.draw()
+		self.blitter = display_tools.BlitManager(self.canvas, self.axes, fig.get_animated_artists())
+		self.drawn_options = dict(fig.map_options)
+		self.reset_prefetcher(fig.map_options)
+		self.set_time_controls(fig.map_options['time_index'])
+		# Zoom and pan through the toolbar: the view is read again at a suitable resolution
+		self.home_limits = self.rendered_limits = self.get_limits()
+		self.axes.callbacks.connect('xlim_changed', self.on_limits_changed)
+		self.axes.callbacks.connect('ylim_changed', self.on_limits_changed)
+		self.store_render()
+		self.prepare_readout()
+		self.on_progress(1., "Done")
+
+	def get_render_key(self, options : dict):
+		return get_render_key(self.dataset, options, self.presets, self.canvas.get_width_height())
+
+	def get_cached_render(self, options : dict):
+		"""
+		Return the image of a map previously rendered with the same files, options and canvas size, or None.
+		"""
+		key = self.get_render_key(options)
+		if key is None:
+			return None
+		cached = RENDER_CACHE.get(key)
+		return None if cached is None else cached[0]
+
+	def show_cached(self, image, options : dict):
+		"""
+		Display a cached image of the map instead of rendering it. The figure is only built again when options change.
+		"""
+		self.figure.clear()
+		self.axes = self.figure.add_subplot(111)
+		self.axes.set_axis_off()
+		self.figure.figimage(image, origin='upper')
+		self.canvas.draw()
+		self.drawn_options = dict(options)
+		self.set_time_controls(options['time_index'])
+		self.on_progress(1., "Cached image")
+
+	def store_render(self):
+		"""
+		Store the image of the canvas in the render cache, after full draws only: scrubbed frames are not stored.
+		Zoomed or panned views are not stored either. The disk write runs on the cache worker.
+		"""
+		if self.get_limits() != self.home_limits:
+			return
+		key = self.get_render_key(self.drawn_options)
+		if key is not None:
+			image = np.array(self.canvas.buffer_rgba())
+			self.cache_pipeline.submit(
+									   prepare=lambda progress: RENDER_CACHE.put(key, (image,)),
+									   on_done=lambda result: None,
+									   on_error=lambda error: print(f"Cache warning: rendered image could not be saved.\n{error}", flush=True)
+									   )
+
+	def update(self, map_options : dict):
+		"""
+		Update the plot with new options.
+		If only data or colour options changed, the existing mesh is updated in place; otherwise the whole figure is rebuilt.
+		"""
+		self.map_options = map_options
+		changes = set(key for key in map_options if map_options[key] != self.drawn_options.get(key))
+		if not changes:
+			return
+		if self.fig is None or self.fig.mesh is None or not changes.issubset(DATA_OPTIONS+STYLE_OPTIONS):
+			self.rebuild()
+			return
+		options = dict(map_options)
+		if changes.intersection(DATA_OPTIONS):
+			if self.prefetcher is None or changes.intersection(DATA_OPTIONS) != {'time_index'}:
+				# Prefetched fields are only valid for the same level and corrections
+				self.reset_prefetcher(options)
+			time_index = options['time_index']
+			if time_index in self.prefetcher:
+				self.apply_update(options, changes, self.prefetcher.get(time_index))
+				return
+			prepare = lambda progress: self.prefetcher.get(time_index)
+			on_done = lambda data: self.apply_update(options, changes, data)
+			self.on_progress(0., "Updating...")
+			self.pipeline.submit(prepare=prepare, on_done=on_done, on_error=self.on_error)
+		else:
+			self.apply_update(options, changes)
+
+	def apply_update(self, options : dict, changes : set, data = None):
+		"""
+		Apply new data and/or colour options to the displayed figure.
+		"""
+		if not self:
+			return
+		self.fig.map_options = options
+		if data is not None:
+			self.fig.update_data(data)
+		if changes.intersection(STYLE_OPTIONS) or (data is not None and not options['norm']):
+			# Colour limits (automatic without norm) and the colorbar may change too: full redraw of existing artists
+			if changes.intersection(STYLE_OPTIONS) or self.fig.engine not in REDRAWN_PLOT_TYPES:
+				# Redrawn plot types already got new colour limits with their data
+				self.fig.update_style(options)
+			self.canvas.draw()
+		else:
+			# Some plot types (contours, streamlines) draw new artists for each frame
+			self.blitter.artists = self.fig.get_animated_artists()
+			self.blitter.update()
+		self.drawn_options = dict(options)
+		if data is not None:
+			self.set_time_controls(options['time_index'])
+			self.prefetcher.request(options['time_index'])
+		self.on_progress(1., "Done")
+		if self.get_limits() != self.rendered_limits:
+			# A view rendering has been superseded by this update
+			self.on_limits_changed(self.axes)
+
+	def get_limits(self):
+		return (tuple(self.axes.get_xlim()), tuple(self.axes.get_ylim()))
+
+	def on_limits_changed(self, ax):
+		"""
+		Axis limits changed (zoom, pan): render the view once the limits stop changing.
+		"""
+		if self.zoom_timer is not None and self.zoom_timer.IsRunning():
+			self.zoom_timer.Start(ZOOM_DELAY)
+		else:
+			self.zoom_timer = wx.CallLater(ZOOM_DELAY, self.render_viewport)
+
+	def render_viewport(self):
+		"""
+		Read the data of the current view only, at full or overview resolution, and draw it in place of the mesh.
+		"""
+		if not self or self.fig is None or self.fig.mesh is None:
+			return
+		limits = self.get_limits()
+		if limits == self.rendered_limits:
+			return
+		if limits == self.home_limits:
+			viewport = None
+		else:
+			viewport = grid_tools.get_viewport_bounds(self.fig.map, *limits)
+			if viewport is None:
+				return
+		fig = Figure(figure=self.figure, ax=self.axes, dataset=self.dataset, map_options=dict(self.drawn_options),
+					 presets=self.presets, lazy=True, viewport=viewport)
+		view = self.fig.get_view()
+
+		def prepare(progress):
+			fig.load(progress)
+			# The readout raster of the view is built along with its data
+			fig.readout = fig.build_readout(view)
+			return fig
+
+		on_done = lambda view_fig: self.show_viewport(view_fig, limits)
+		self.on_progress(0., "Rendering view...")
+		self.pipeline.submit(prepare=prepare, on_done=on_done, on_progress=self.on_progress, on_error=self.on_error)
+
+	def show_viewport(self, view_fig : Figure, limits : tuple):
+		"""
+		Draw the data of a view, loaded by render_viewport.
+		"""
+		if not self or self.fig is None:
+			return
+		self.fig.replace_data(view_fig)
+		self.rendered_limits = limits
+		self.blitter.disconnect()
+		self.blitter = display_tools.BlitManager(self.canvas, self.axes, self.fig.get_animated_artists())
+		self.canvas.draw()
+		# Prefetched fields were read for the previous window
+		self.reset_prefetcher(self.drawn_options)
+		self.on_progress(1., "Done")
+
+	def on_click(self, event):
+		"""
+		Click on the map (outside of toolbar zoom and pan modes): show the time series of the closest grid point.
+		"""
+		if event.button != 1 or event.inaxes is not self.axes or self.fig is None or self.fig.map is None:
+			return
+		if self.toolbar is not None and self.toolbar.mode:
+			return
+		lon, lat = self.fig.map(event.xdata, event.ydata, inverse=True)
+		if not (np.isfinite(lon) and np.isfinite(lat) and abs(lon) < 1e20 and abs(lat) < 1e20):
+			return
+		options = dict(self.drawn_options)
+		dataset, variable = nc_tools.resolve_dataset(self.dataset, options['variable']), options['variable']
+		coef, offset = options['coef'], options['offset']
+		time_index, pl_index = options['time_index'] or 0, options['pl_index']
+
+		def prepare(progress):
+			lons, lats = nc_tools.get_coordinates(dataset)
+			# Displayed longitudes are shifted by the longitude offset
+			cell = grid_tools.get_grid_index(lons, lats).locate(lon-options['lon_offset'], lat)
+			if cell is None:
+				return None
+			j, i = cell
+			source = dataset[variable]
+			series = {
+				'title': f"{variable} at {lats[j]:.2f}°N, {lons[i]:.2f}°E",
+				'label': getattr(source, 'units', ''),
+				'times': self.timesteps.times,
+				'values': nc_tools.get_point_series(dataset, variable, j, i, pl_index, progress)*coef+offset,
+				'date': self.timesteps.get_date(time_index),
+				'levels': None,
+				'profile': None
+			}
+			if pl_index is not None and len(source.dimensions) == 4:
+				# Vertical profile at the displayed timestep: a single read of all levels at this cell
+				series['levels'] = np.ma.getdata(nc_tools.read_slice(dataset['level'], slice(None)))
+				series['profile'] = nc_tools.read_slice(source, (time_index, slice(None), j, i))*coef+offset
+			return series
+
+		self.on_progress(0., "Reading time series...")
+		self.series_pipeline.submit(prepare=prepare, on_done=self.show_series, on_progress=self.on_progress, on_error=self.on_error)
+
+	def show_series(self, series : dict):
+		"""
+		Show the time series read by on_click.
+		"""
+		if not self:
+			return
+		if series is None:
+			self.on_progress(0., "Outside of the grid")
+			return
+		self.on_progress(1., "Done")
+		SeriesDialog(self, "Time series", series)
+
+	def on_motion(self, event):
+		"""
+		Mouse motion over the canvas: schedule the readout of the position, motions in between are coalesced.
+		"""
+		if event.inaxes is not self.axes:
+			return
+		self.hover_position = (event.x, event.y)
+		if self.hover_timer is None or not self.hover_timer.IsRunning():
+			self.hover_timer = wx.CallLater(READOUT_DELAY, self.show_readout)
+
+	def on_leave(self, event):
+		self.hover_position = None
+		self.set_status("")
+
+	def show_readout(self):
+		"""
+		Show the coordinates and the data value under the last mouse position in the status bar.
+		"""
+		if not self or self.hover_position is None or self.fig is None or self.fig.mesh is None:
+			return
+		x, y = self.hover_position
+		bbox = self.axes.bbox
+		lon, lat, value = self.fig.get_readout(x-bbox.x0, y-bbox.y0)
+		if self.fig.readout is None or self.fig.readout[0] != self.fig.get_view():
+			# The view changed (e.g. resized or zoomed, not rendered yet): its raster is built in the background
+			self.prepare_readout()
+		if lon is None:
+			self.set_status("")
+			return
+		text = f"lat {lat:.2f}°, lon {lon:.2f}°"
+		variable = self.drawn_options.get('variable')
+		if value is not None:
+			text += f" | {variable} = {value:.4g} {self.fig.units}"
+		self.set_status(text)
+
+	def prepare_readout(self):
+		"""
+		Build the readout raster of the displayed view on the readout worker, unless it is built or being built.
+		"""
+		fig = self.fig
+		if fig is None or fig.mesh is None:
+			return
+		view = fig.get_view()
+		if (fig.readout is not None and fig.readout[0] == view) or (view == self.readout_view and self.readout_pipeline.is_busy()):
+			return
+		self.readout_view = view
+
+		def on_done(readout):
+			if self and fig is self.fig:
+				fig.readout = readout
+
+		self.readout_pipeline.submit(
+									 prepare=lambda progress: fig.build_readout(view),
+									 on_done=on_done,
+									 on_error=lambda error: print(f"Readout warning: the raster of the view could not be built.\n{error}", flush=True)
+									 )
+
+	def set_status(self, text : str):
+		"""
+		Display :text: in the status bar of the frame, if it has one.
+		"""
+		frame = self.GetTopLevelParent()
+		if frame is not None and isinstance(frame, wx.Frame) and frame.GetStatusBar() is not None:
+			frame.SetStatusText(text)
+
+	def reset_prefetcher(self, options : dict):
+		"""
+		Start a new read-ahead cache for the displayed figure, with the data options of :options:.
+		"""
+		if self.prefetcher is not None:
+			self.prefetcher.shutdown()
+		fig = self.fig
+		data_options = {key: options[key] for key in DATA_OPTIONS if key != 'time_index'}
+		self.prefetcher = prefetch_tools.Prefetcher(read=lambda time_index: fig.read_frame(time_index, **data_options), n_steps=len(self.timesteps))
+		if options['time_index'] is not None:
+			self.prefetcher.request(options['time_index'])
+
+	def update_timesteps(self, variable : str):
+		"""
+		Show the time axis of :variable: on the time scrubber: pseudo-variables have their own.
+		"""
+		dataset = nc_tools.resolve_dataset(self.dataset, variable)
+		if dataset is self.timesteps_dataset:
+			return
+		self.timesteps_dataset = dataset
+		self.timesteps = nc_tools.get_timesteps(dataset)
+		n_steps = len(self.timesteps)
+		self.slider_time.SetRange(0, max(n_steps-1, 1))
+		self.spin_time.SetRange(0, max(n_steps-1, 0))
+		self.slider_time.Enable(n_steps > 1)
+		self.spin_time.Enable(n_steps > 1)
+
+	def set_time_controls(self, time_index : int):
+		"""
+		Show :time_index: on the time scrubber.
+		"""
+		if time_index is None:
+			return
+		self.slider_time.SetValue(time_index)
+		self.spin_time.SetValue(time_index)
+		self.text_time.SetLabel(self.timesteps.get_date(time_index))
+
+	def on_time_change(self, event):
+		"""
+		Time scrubber event handler: show another timestep of the same plot.
+		"""
+		time_index = event.GetEventObject().GetValue()
+		# A cached image (no figure) is replaced by a rendering of the new timestep
+		if (self.fig is not None or self.drawn_options) and time_index != self.drawn_options.get('time_index'):
+			self.update(dict(self.map_options, time_index=time_index))
+		event.Skip()
+
+	def rebuild(self):
+		"""
+		Clear the figure and draw it again from scratch.
+		"""
+		self.pipeline.cancel()
+		if self.zoom_timer is not None:
+			self.zoom_timer.Stop()
+		if self.prefetcher is not None:
+			self.prefetcher.shutdown()
+		self.prefetcher = None
+		if self.blitter is not None:
+			self.blitter.disconnect()
+		self.blitter = None
+		self.fig = None
+		self.figure.clear()
+		self.axes = self.figure.add_subplot(111)
+		self.draw()
+
+	def cancel(self):
+		"""
+		Cancel the rendering in progress, if any.
+		"""
+		if self.pipeline.is_busy():
+			self.pipeline.cancel()
+			self.on_progress(0., "Cancelled")
+
+	def on_progress(self, fraction : float, message : str):
+		"""
+		Display the rendering progress.
+		"""
+		if not self:
+			return
+		self.gauge.SetValue(int(100*fraction))
+		self.text_progress.SetLabel(message)
+
+	def on_error(self, error : Exception):
+		"""
+		Display an error raised while preparing the figure.
+		"""
+		if not self:
+			return
+		self.on_progress(0., "Error")
+		wx.MessageBox(
+					  message=f"Error! Data could not be plotted.\n{error}",
+					  caption="Error",
+					  style=wx.OK | wx.ICON_ERROR
+					  )
+
+	def on_destroy(self, event):
+		"""
+		Release the render worker when the panel is destroyed.
+		"""
+		if event.GetEventObject() is self:
+			self.pipeline.shutdown()
+			self.series_pipeline.shutdown()
+			self.cache_pipeline.shutdown()
+			self.readout_pipeline.shutdown()
+			if self.zoom_timer is not None:
+				self.zoom_timer.Stop()
+			if self.hover_timer is not None:
+				self.hover_timer.Stop()
+			if self.prefetcher is not None:
+				self.prefetcher.shutdown()
+		event.Skip()
 
 	def add_toolbar(self):
 		"""
@@ -0,0 +1,97 @@
+# Read-ahead of timesteps, for smooth scrubbing through the time axis
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom imports
+import cache_tools
+
+###############
+## Constants ##
+###############
+
+DEFAULT_BUDGET = 256*1024**2 # Memory budget of prefetched fields, in bytes
+DEFAULT_AHEAD = 6
+DEFAULT_BEHIND = 2
+
+#############
+## Classes ##
+#############
+
+class Prefetcher():
+	"""
+	Keep the fields around the current timestep in a bounded in-memory cache, reading them in the background.
+	:read: is a callable returning the field of a time index.
+	Fields are evicted in LRU order once the memory budget is exceeded.
+	"""
+	def __init__(self, read, n_steps : int, n_ahead : int = DEFAULT_AHEAD, n_behind : int = DEFAULT_BEHIND, max_bytes : int = DEFAULT_BUDGET):
+		self.read = read
+		self.n_steps = n_steps
+		self.n_ahead = n_ahead
+		self.n_behind = n_behind
+		self.cache = cache_tools.LRUCache(max_items=None, max_bytes=max_bytes)
+		self.generation = 0
+		self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+		self._lock = threading.Lock()
+
+	def __contains__(self, time_index : int):
+		return time_index in self.cache
+
+	def get(self, time_index : int):
+		"""
+		Return the field of :time_index:, from the cache if possible.
+		"""
+		data = self.cache.get(time_index)
+		if data is None:
+			data = self.read(time_index)
+			self.cache.put(time_index, data)
+		return data
+
+	def request(self, time_index : int):
+		"""
+		Schedule the read-ahead around :time_index: (next timesteps first). Pending read-ahead is dropped.
+		"""
+		with self._lock:
+			self.generation += 1
+			generation = self.generation
+		ahead = [time_index+i for i in range (1, self.n_ahead+1)]
+		behind = [time_index-i for i in range (1, self.n_behind+1)]
+		indices = [t for t in ahead+behind if 0 <= t < self.n_steps]
+		self._executor.submit(self._prefetch, generation, indices)
+
+	def _prefetch(self, generation : int, indices : list):
+		for time_index in indices:
+			if generation != self.generation:
+				return
+			if time_index not in self.cache:
+				try:
+					self.cache.put(time_index, self.read(time_index))
+				except Exception as e:
+					print(f"Prefetch warning: timestep {time_index} could not be read.\n{e}", flush=True)
+					return
+
+	def shutdown(self):
+		"""
+		Drop pending read-ahead, release the worker and the cached fields.
+		"""
+		with self._lock:
+			self.generation += 1
+		self._executor.shutdown(wait=False)
+		self.cache.clear()
+
+###############
+## Functions ##
+###############
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
@@ -0,0 +1,214 @@
+# Statistics tools: summary statistics of whole variables, computed chunk by chunk along time
+
+#############
+## Imports ##
+#############
+
+# Other imports
+import os
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+# Custom imports
+import cache_tools
+import nc_tools
+
+###############
+## Constants ##
+###############
+
+STATS_PATH = os.path.join(cache_tools.CACHE_PATH, "stats.sqlite")
+STATS_VERSION = 1 # Version of the statistics format, older cache entries are ignored
+CHUNK_BUDGET = 64*1024**2 # Memory used by the timesteps read at once, in bytes
+SAMPLE_SIZE = 65536 # Number of values kept to estimate quantiles
+QUANTILES = [0.02, 0.5, 0.98] # The 2nd and 98th percentiles are used as colour limits
+
+#############
+## Classes ##
+#############
+
+class StreamingStats():
+	"""
+	Summary statistics of a stream of values: count, min, max, mean and standard deviation are exact,
+	quantiles are estimated on a uniform random sample of :sample_size: values (bottom-k reservoir sampling:
+	each value gets a random key, the values with the smallest keys are kept).
+	"""
+	def __init__(self, sample_size : int = SAMPLE_SIZE, seed : int = 0):
+		self.sample_size = sample_size
+		self.rng = np.random.default_rng(seed)
+		self.count = 0
+		self.total = 0.
+		self.total_sq = 0.
+		self.min = np.inf
+		self.max = -np.inf
+		self.sample = np.empty(0, dtype=np.float32)
+		self.keys = np.empty(0, dtype=np.float64)
+
+	def add(self, values : np.ndarray):
+		"""
+		Add values to the statistics. Masked and non finite values are ignored.
+		"""
+		values = np.ma.compressed(np.ma.masked_invalid(values)).astype(np.float64)
+		if len(values) == 0:
+			return
+		self.count += len(values)
+		self.total += values.sum()
+		self.total_sq += np.square(values).sum()
+		self.min = min(self.min, values.min())
+		self.max = max(self.max, values.max())
+		keys = self.rng.random(len(values)) # float64: float32 keys tie too often over millions of values
+		if len(self.keys) == self.sample_size:
+			# Only values with a smaller key than the largest kept one can enter the sample
+			candidates = keys < self.keys.max()
+			keys, values = keys[candidates], values[candidates]
+		keys = np.concatenate([self.keys, keys])
+		sample = np.concatenate([self.sample, values.astype(np.float32)])
+		if len(keys) > self.sample_size:
+			kept = np.argpartition(keys, self.sample_size)[:self.sample_size]
+			keys, sample = keys[kept], sample[kept]
+		self.keys, self.sample = keys, sample
+
+	def result(self, quantiles : list = QUANTILES):
+		"""
+		Return the statistics as a dictionary, or None if no value has been added.
+		"""
+		if self.count == 0:
+			return None
+		mean = self.total/self.count
+		return {
+			'count': self.count,
+			'min': float(self.min),
+			'max': float(self.max),
+			'mean': float(mean),
+			'std': float(np.sqrt(max(self.total_sq/self.count-mean**2, 0.))),
+			'quantiles': {str(q): float(v) for q, v in zip(quantiles, np.quantile(self.sample, quantiles))}
+		}
+
+class StatsIndex():
+	"""
+	On-disk cache of variable statistics, keyed by the identity of the source files and the variable name.
+	"""
+	def __init__(self, path : str = STATS_PATH):
+		self.path = path
+		self._lock = threading.Lock()
+
+	def _connect(self):
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		connection = sqlite3.connect(self.path, timeout=30)
+		connection.execute(
+						   "CREATE TABLE IF NOT EXISTS stats ("
+						   "key TEXT, variable TEXT, stats TEXT, PRIMARY KEY (key, variable))"
+						   )
+		return connection
+
+	def get(self, key : str, variable : str):
+		"""
+		Return the statistics of a variable, or None if they are not cached.
+		"""
+		with self._lock:
+			connection = self._connect()
+			try:
+				row = connection.execute("SELECT stats FROM stats WHERE key = ? AND variable = ?", (key, variable)).fetchone()
+			finally:
+				connection.close()
+		return None if row is None else json.loads(row[0])
+
+	def put(self, key : str, variable : str, stats : list):
+		with self._lock:
+			connection = self._connect()
+			try:
+				with connection:
+					connection.execute(
+									   "INSERT OR REPLACE INTO stats (key, variable, stats) VALUES (?, ?, ?)",
+									   (key, variable, json.dumps(stats))
+									   )
+			finally:
+				connection.close()
+
+STATS_INDEX = StatsIndex()
+
+###############
+## Functions ##
+###############
+
+def compute_stats(dataset, variable : str, progress = None):
+	"""
+	Compute the statistics of a (time, [level], lat, lon) variable in one pass over the time axis.
+	Return a list with the statistics of each pressure level (a single element without levels).
+	:progress: is an optional callable taking a fraction and a message.
+	"""
+	source = dataset[variable]
+	if len(source.dimensions) not in (3, 4) or source.dimensions[0] != 'time':
+		raise Exception(f"StatsError: {variable} is not a (time, [level], lat, lon) variable.")
+	n_steps = source.shape[0]
+	n_levels = source.shape[1] if len(source.shape) == 4 else 1
+	step_bytes = int(np.prod(source.shape[1:]))*8
+	n_chunk = max(1, CHUNK_BUDGET//step_bytes)
+	accumulators = [StreamingStats(seed=i) for i in range (n_levels)]
+	for start in range (0, n_steps, n_chunk):
+		stop = min(start+n_chunk, n_steps)
+		data = nc_tools.read_slice(source, (slice(start, stop),))
+		if n_levels == 1 and data.ndim == 3:
+			accumulators[0].add(data)
+		else:
+			for i, accumulator in enumerate(accumulators):
+				accumulator.add(data[:, i])
+		if progress is not None:
+			progress(stop/n_steps, f"Statistics of {variable} ({stop}/{n_steps})")
+	return [accumulator.result() for accumulator in accumulators]
+
+def get_stats(dataset, variable : str, progress = None):
+	"""
+	Return the statistics of a variable (see compute_stats), computed once per set of source files.
+	Statistics of in-memory datasets are not cached.
+	"""
+	identities = nc_tools.get_file_identities(dataset)
+	if identities is None:
+		return compute_stats(dataset, variable, progress)
+	key = cache_tools.make_key(identities, STATS_VERSION)
+	try:
+		stats = STATS_INDEX.get(key, variable)
+	except sqlite3.Error as e:
+		print(f"Cache warning: statistics index could not be read.\n{e}", flush=True)
+		stats = None
+	if stats is None:
+		stats = compute_stats(dataset, variable, progress)
+		try:
+			STATS_INDEX.put(key, variable, stats)
+		except sqlite3.Error as e:
+			print(f"Cache warning: statistics of {variable} could not be saved.\n{e}", flush=True)
+	return stats
+
+def get_colour_limits(stats : dict, coef : float = 1, offset : float = 0):
+	"""
+	Return integer (c_min, c_max, midpoint) colour limits from statistics: the 2nd and 98th percentiles
+	and the median, after the data corrections of the option panel (data*coef+offset).
+	"""
+	quantiles = stats['quantiles']
+	low, median, high = (quantiles[str(q)]*coef+offset for q in QUANTILES)
+	if low > high:
+		low, high = high, low
+	return int(np.floor(low)), int(np.ceil(high)), int(round(median))
+
+def format_stats(stats : dict):
+	"""
+	Return a one-line description of statistics.
+	"""
+	if stats is None:
+		return "no valid value"
+	quantiles = stats['quantiles']
+	return (
+			f"min {stats['min']:.4g}, max {stats['max']:.4g}, mean {stats['mean']:.4g}, std {stats['std']:.4g}, "
+			f"p2 {quantiles[str(QUANTILES[0])]:.4g}, median {quantiles[str(QUANTILES[1])]:.4g}, p98 {quantiles[str(QUANTILES[2])]:.4g}"
+			)
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
+else:
+	print(f"Module {__name__} imported.", flush=True)
\ No newline at end of file
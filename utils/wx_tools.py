@@ -14,6 +14,84 @@ import wx
 ## Classes ##
 #############
 
+class VirtualListCtrl(wx.ListCtrl):
+	"""
+	Single column virtual list: items are only formatted when displayed, whatever the length of the list.
+	:items: is any sequence (len and indexing) of strings.
+	"""
+	def __init__(self, parent, items, width : int = 250):
+		super(VirtualListCtrl, self).__init__(parent=parent, id=wx.ID_ANY, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_NO_HEADER | wx.LC_SINGLE_SEL)
+		self.items = items
+		self.InsertColumn(0, "")
+		self.SetColumnWidth(0, width)
+		self.SetItemCount(len(items))
+
+	def OnGetItemText(self, item, column):
+		return self.items[item]
+
+class VirtualListPopup(wx.ComboPopup):
+	"""
+	wx.ComboCtrl popup showing a VirtualListCtrl, as a replacement of wx.ComboBox for very long lists.
+	:on_select: is called with the selected index.
+	"""
+	def __init__(self, items, on_select = None):
+		super(VirtualListPopup, self).__init__()
+		self.items = items
+		self.on_select = on_select
+		self.list_ctrl = None
+		self.index = -1
+
+	def Create(self, parent):
+		self.list_ctrl = VirtualListCtrl(parent, self.items)
+		self.list_ctrl.Bind(wx.EVT_LEFT_UP, handler=self.on_left_up)
+		self.list_ctrl.Bind(wx.EVT_LIST_ITEM_ACTIVATED, handler=self.on_activated)
+		return True
+
+	def GetControl(self):
+		return self.list_ctrl
+
+	def GetStringValue(self):
+		return self.items[self.index] if self.index >= 0 else ""
+
+	def GetAdjustedSize(self, minWidth, prefHeight, maxHeight):
+		return wx.Size(max(minWidth, 250), min(300, maxHeight))
+
+	def OnPopup(self):
+		if self.index >= 0:
+			self.list_ctrl.Select(self.index)
+			self.list_ctrl.EnsureVisible(self.index)
+
+	def set_items(self, items):
+		"""
+		Replace the items of the list. The selection is cleared.
+		"""
+		self.items = items
+		self.index = -1
+		if self.list_ctrl is not None:
+			self.list_ctrl.items = items
+			self.list_ctrl.SetItemCount(len(items))
+		self.GetComboCtrl().SetValue("")
+
+	def select(self, index : int):
+		"""
+		Select an item: update the combo text and call :on_select:.
+		"""
+		self.index = index
+		self.GetComboCtrl().SetValue(self.items[index])
+		if self.on_select is not None:
+			self.on_select(index)
+
+	def on_left_up(self, event):
+		item, _ = self.list_ctrl.HitTest(event.GetPosition())
+		if item >= 0:
+			self.Dismiss()
+			self.select(item)
+		event.Skip()
+
+	def on_activated(self, event):
+		self.Dismiss()
+		self.select(event.GetIndex())
+
 ###############
 ## Functions ##
 ###############